@@ -60,8 +60,31 @@ def discovery():
     default=None,
     show_default=True,
 )
+@click.option(
+    "--skip-unchanged",
+    "skip_unchanged",
+    is_flag=True,
+    help="compare against the metadata currently in the commons and only publish records that changed",
+    show_default=True,
+)
+@click.option(
+    "--delete-missing",
+    "delete_missing",
+    is_flag=True,
+    help="delete records of this guid type from the commons that are not in the file",
+    show_default=True,
+)
 @click.pass_context
-def discovery_publish(ctx, file, use_default_file, omit_empty, guid_type, guid_field):
+def discovery_publish(
+    ctx,
+    file,
+    use_default_file,
+    omit_empty,
+    guid_type,
+    guid_field,
+    skip_unchanged,
+    delete_missing,
+):
     """
     Run a discovery metadata ingestion on a given metadata TSV / JSON file with guid column / field.
     If [FILE] is omitted and --default-file not set, prompts for TSV / JSON file name.
@@ -86,6 +109,8 @@ def discovery_publish(ctx, file, use_default_file, omit_empty, guid_type, guid_f
             omit_empty_values=omit_empty,
             guid_type=guid_type,
             guid_field=guid_field,
+            skip_unchanged=skip_unchanged,
+            delete_missing=delete_missing,
         )
     )
 
@@ -125,13 +150,46 @@ def discovery_publish(ctx, file, use_default_file, omit_empty, guid_type, guid_f
     default="",
     show_default=True,
 )
+@click.option(
+    "--fields",
+    "fields",
+    help="comma-separated list of discovery metadata fields to output, defaults to all fields",
+    default=None,
+)
+@click.option(
+    "--filter",
+    "filters",
+    help=(
+        "only output records where a discovery metadata field has the given value, "
+        "formatted as field=value. Can be repeated, values for the same field are OR'd"
+    ),
+    multiple=True,
+)
 @click.pass_context
-def discovery_read(ctx, limit, agg, guid_type, output_format, output_filename_suffix):
+def discovery_read(
+    ctx,
+    limit,
+    agg,
+    guid_type,
+    output_format,
+    output_filename_suffix,
+    fields,
+    filters,
+):
     """
     Download the metadata used to populate a commons' discovery page into a TSV or JSON file.
     Outputs the TSV / JSON filename with format {commons-url}-{guid_type}.tsv/.json
     If "output_filename_suffix" exists, file name will be something like {commons-url}-{guid_type}-{output_filename_suffix}
     """
+    field_filters = {}
+    for field_filter in filters:
+        field, separator, value = field_filter.partition("=")
+        if not separator:
+            raise click.BadParameter(
+                f"expected field=value, got {field_filter}", param_hint="--filter"
+            )
+        field_filters.setdefault(field, []).append(value)
+
     auth = ctx.obj["auth_factory"].get()
     loop = get_or_create_event_loop_for_thread()
     endpoint = ctx.obj.get("endpoint")
@@ -144,6 +202,8 @@ def discovery_read(ctx, limit, agg, guid_type, output_format, output_filename_su
             guid_type=guid_type,
             output_format=output_format,
             output_filename_suffix=output_filename_suffix,
+            fields=fields.split(",") if fields else None,
+            filters=field_filters,
         )
     )
 
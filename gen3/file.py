@@ -4,6 +4,11 @@ import json
 import asyncio
 import aiohttp
 import aiofiles
+import backoff
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import hashlib
+import math
+import threading
 import time
 from tqdm import tqdm
 from types import SimpleNamespace as Namespace
@@ -14,13 +19,21 @@ from pathlib import Path
 from cdislogging import get_logger
 
 from gen3.index import Gen3Index
-from gen3.utils import DEFAULT_BACKOFF_SETTINGS, raise_for_status_and_print_error
+from gen3.utils import (
+    DEFAULT_BACKOFF_SETTINGS,
+    exception_do_not_retry,
+    raise_for_status_and_print_error,
+)
 from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
 
 logging = get_logger("__name__")
 
 
 MAX_RETRIES = 3
+# size of the parts of a multipart upload, grown if a file would need more than
+# MULTIPART_MAX_PARTS parts
+MULTIPART_CHUNK_SIZE = 64 * 1024 * 1024
+MULTIPART_MAX_PARTS = 10000
 
 
 class Gen3File:
@@ -147,6 +160,281 @@ class Gen3File:
 
         return data
 
+    def initialize_multipart_upload(
+        self, file_name, authz=None, expires_in=None, bucket=None
+    ):
+        """
+        Create a blank record for a file and start a multipart upload for it
+
+        Args:
+            file_name (str): file_name to use for upload
+            authz (list): authorization scope for the file as list of paths, optional.
+            expires_in (int): Amount in seconds that the signed urls will expire in.
+            bucket (str): Bucket to upload to, see `upload_file`.
+        Returns:
+            dict: the "guid" of the new record and the "uploadId" of the upload
+        """
+        api_url = f"{self._endpoint}/user/data/multipart/init"
+        body = {"file_name": file_name}
+        if authz:
+            body["authz"] = authz
+        if expires_in:
+            body["expires_in"] = expires_in
+        if bucket:
+            body["bucket"] = bucket
+
+        resp = requests.post(api_url, auth=self._auth_provider, json=body)
+        raise_for_status_and_print_error(resp)
+        return resp.json()
+
+    def generate_multipart_upload_url(
+        self, key, upload_id, part_number, expires_in=None, bucket=None
+    ):
+        """
+        Get a presigned url to upload one part of a multipart upload to
+
+        Args:
+            key (str): object key of the upload, "<guid>/<file_name>"
+            upload_id (str): id of the upload from `initialize_multipart_upload`
+            part_number (int): number of the part, starting from 1
+            expires_in (int): Amount in seconds that the signed url will expire in.
+            bucket (str): Bucket the upload was initialized in.
+        Returns:
+            str: the presigned url
+        """
+        api_url = f"{self._endpoint}/user/data/multipart/upload"
+        body = {"key": key, "uploadId": upload_id, "partNumber": part_number}
+        if expires_in:
+            body["expires_in"] = expires_in
+        if bucket:
+            body["bucket"] = bucket
+
+        resp = requests.post(api_url, auth=self._auth_provider, json=body)
+        raise_for_status_and_print_error(resp)
+        return resp.json()["presigned_url"]
+
+    def complete_multipart_upload(self, key, upload_id, parts, bucket=None):
+        """
+        Complete a multipart upload once all its parts are uploaded
+
+        Args:
+            key (str): object key of the upload, "<guid>/<file_name>"
+            upload_id (str): id of the upload from `initialize_multipart_upload`
+            parts (list): {"PartNumber": int, "ETag": str} for every uploaded part
+            bucket (str): Bucket the upload was initialized in.
+        """
+        api_url = f"{self._endpoint}/user/data/multipart/complete"
+        body = {"key": key, "uploadId": upload_id, "parts": parts}
+        if bucket:
+            body["bucket"] = bucket
+
+        resp = requests.post(api_url, auth=self._auth_provider, json=body)
+        raise_for_status_and_print_error(resp)
+
+    def upload_file_multipart(
+        self,
+        file_path,
+        file_name=None,
+        authz=None,
+        expires_in=None,
+        bucket=None,
+        chunk_size=None,
+        max_concurrent_requests=4,
+        checkpoint_file=None,
+    ):
+        """
+        Upload a local file to a new record with a multipart upload.
+
+        The file is read once, in order, to compute its md5 while its parts are
+        uploaded in parallel, each part retried on its own. Uploaded parts are
+        saved to `checkpoint_file` with their md5 so an interrupted upload can be
+        resumed by calling this again with the same file: the parts already
+        uploaded are only read for the md5, and uploaded again if their content
+        changed. If the resumed upload expired or was aborted a new one is
+        started. The checkpoint is removed once the upload is complete.
+
+        Args:
+            file_path (str): path of the file to upload
+            file_name (str): file_name to use for upload, defaults to the name of
+                the file
+            authz (list): authorization scope for the file as list of paths, optional.
+            expires_in (int): Amount in seconds that the signed urls will expire in.
+            bucket (str): Bucket to upload to, see `upload_file`.
+            chunk_size (int): size of the parts in bytes, defaults to
+                MULTIPART_CHUNK_SIZE
+            max_concurrent_requests (int): number of parts uploaded at the same
+                time, also bounds the memory used to chunk_size times this
+            checkpoint_file (str): file to save the upload progress in, defaults to
+                "<file_path>.checkpoint"
+        Returns:
+            dict: "guid", "key", "size" and "md5" of the uploaded file
+        """
+        file_name = file_name or os.path.basename(file_path)
+        size = os.path.getsize(file_path)
+        mtime_ns = os.stat(file_path).st_mtime_ns
+        chunk_size = max(
+            chunk_size or MULTIPART_CHUNK_SIZE,
+            math.ceil(size / MULTIPART_MAX_PARTS),
+        )
+        num_parts = max(math.ceil(size / chunk_size), 1)
+        checkpoint_file = checkpoint_file or "{}.checkpoint".format(file_path)
+
+        upload = _read_upload_checkpoint(checkpoint_file)
+        if upload and (
+            upload.get("file_name"),
+            upload.get("size"),
+            upload.get("chunk_size"),
+        ) == (file_name, size, chunk_size):
+            logging.info(
+                f"Resuming upload of {file_path} to {upload['guid']}, "
+                f"{len(upload['parts'])} of {num_parts} parts already uploaded"
+            )
+            if upload.get("mtime_ns") != mtime_ns:
+                logging.warning(
+                    f"{file_path} was modified since the upload started, "
+                    "parts that changed will be uploaded again"
+                )
+                upload["mtime_ns"] = mtime_ns
+        else:
+            upload = None
+
+        while True:
+            if upload is None:
+                init = self.initialize_multipart_upload(
+                    file_name, authz=authz, expires_in=expires_in, bucket=bucket
+                )
+                upload = {
+                    "file_name": file_name,
+                    "size": size,
+                    "mtime_ns": mtime_ns,
+                    "chunk_size": chunk_size,
+                    "guid": init["guid"],
+                    "key": "{}/{}".format(init["guid"], file_name),
+                    "upload_id": init["uploadId"],
+                    # part number to its "etag" and "md5"
+                    "parts": {},
+                }
+                _write_upload_checkpoint(checkpoint_file, upload)
+                new_upload = True
+            else:
+                new_upload = False
+
+            try:
+                md5 = self._upload_multipart_parts(
+                    file_path,
+                    upload,
+                    num_parts,
+                    checkpoint_file,
+                    max_concurrent_requests,
+                    expires_in=expires_in,
+                    bucket=bucket,
+                )
+                self.complete_multipart_upload(
+                    upload["key"],
+                    upload["upload_id"],
+                    [
+                        {"PartNumber": int(part_number), "ETag": part["etag"]}
+                        for part_number, part in sorted(
+                            upload["parts"].items(), key=lambda part: int(part[0])
+                        )
+                    ],
+                    bucket=bucket,
+                )
+                break
+            except requests.HTTPError as e:
+                # a resumed upload expired or was aborted, start over once
+                if new_upload or not _is_no_such_upload(e):
+                    raise
+                logging.warning(
+                    f"Upload {upload['upload_id']} of {file_path} no longer exists, "
+                    "starting a new upload"
+                )
+                upload = None
+
+        if os.path.exists(checkpoint_file):
+            os.remove(checkpoint_file)
+        logging.info(f"Uploaded {file_path} to {upload['guid']}")
+
+        return {
+            "guid": upload["guid"],
+            "key": upload["key"],
+            "size": size,
+            "md5": md5,
+        }
+
+    def _upload_multipart_parts(
+        self,
+        file_path,
+        upload,
+        num_parts,
+        checkpoint_file,
+        max_concurrent_requests,
+        expires_in=None,
+        bucket=None,
+    ):
+        """
+        Read the file in order and upload every part that is not in the checkpoint
+        with the same md5, saving the uploaded parts to the checkpoint.
+
+        Returns:
+            str: md5 of the whole file
+        """
+        lock = threading.Lock()
+
+        def _upload(part_number, data, part_md5):
+            etag = self._upload_multipart_part(
+                upload["key"],
+                upload["upload_id"],
+                part_number,
+                data,
+                expires_in=expires_in,
+                bucket=bucket,
+            )
+            with lock:
+                upload["parts"][str(part_number)] = {"etag": etag, "md5": part_md5}
+                _write_upload_checkpoint(checkpoint_file, upload)
+
+        md5 = hashlib.md5()
+        with open(file_path, "rb") as f, ThreadPoolExecutor(
+            max_workers=max_concurrent_requests
+        ) as executor:
+            in_flight = set()
+            for part_number in range(1, num_parts + 1):
+                data = f.read(upload["chunk_size"])
+                md5.update(data)
+                part_md5 = hashlib.md5(data).hexdigest()
+                uploaded_part = upload["parts"].get(str(part_number))
+                if uploaded_part and uploaded_part.get("md5") == part_md5:
+                    continue
+                if len(in_flight) >= max_concurrent_requests:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+                in_flight.add(executor.submit(_upload, part_number, data, part_md5))
+            for future in wait(in_flight).done:
+                future.result()
+
+        return md5.hexdigest()
+
+    @backoff.on_exception(
+        backoff.expo,
+        requests.RequestException,
+        **{
+            **DEFAULT_BACKOFF_SETTINGS,
+            "giveup": lambda e: exception_do_not_retry(e) or _is_no_such_upload(e),
+        },
+    )
+    def _upload_multipart_part(
+        self, key, upload_id, part_number, data, expires_in=None, bucket=None
+    ):
+        """Upload one part of a multipart upload and return its ETag."""
+        url = self.generate_multipart_upload_url(
+            key, upload_id, part_number, expires_in=expires_in, bucket=bucket
+        )
+        resp = requests.put(url, data=data)
+        raise_for_status_and_print_error(resp)
+        return resp.headers["ETag"].strip('"')
+
     def _ensure_dirpath_exists(path: Path) -> Path:
         """Utility to create a directory if missing.
         Returns the path so that the call can be inlined in another call
@@ -259,3 +547,29 @@ class Gen3File:
         resp = requests.get(url, auth=self._auth_provider)
         raise_for_status_and_print_error(resp)
         return resp.json()
+
+
+def _is_no_such_upload(error):
+    """Whether a request failed because its multipart upload expired or was aborted."""
+    response = getattr(error, "response", None)
+    return response is not None and "NoSuchUpload" in str(response.text)
+
+
+def _read_upload_checkpoint(checkpoint_file):
+    """Return the multipart upload saved in checkpoint_file, or None."""
+    try:
+        with open(checkpoint_file) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        logging.warning("Ignoring unreadable checkpoint {}".format(checkpoint_file))
+        return None
+
+
+def _write_upload_checkpoint(checkpoint_file, upload):
+    """Atomically save the progress of a multipart upload."""
+    tmp_file = "{}.tmp".format(checkpoint_file)
+    with open(tmp_file, "w") as f:
+        json.dump(upload, f)
+    os.replace(tmp_file, checkpoint_file)
@@ -5,6 +5,7 @@ import aiohttp
 import asyncio
 import backoff
 import json
+import random
 import requests
 import urllib.parse
 from cdislogging import get_logger
@@ -14,6 +15,7 @@ import time
 
 from gen3.utils import (
     append_query_params,
+    BoundedAsyncExecutor,
     DEFAULT_BACKOFF_SETTINGS,
     raise_for_status_and_print_error,
 )
@@ -25,6 +27,14 @@ INDEX_MANIFEST_JOB = "index-object-manifest"
 DOWNLOAD_MANIFEST_JOB = "download-indexd-manifest"
 MERGE_MANIFEST_JOB = "merge-manifests"
 
+# seconds to wait before checking the status of a job for the first time, the
+# wait grows 1.5x after every check up to JOB_MAX_POLL_INTERVAL
+JOB_POLL_INTERVAL = 3
+JOB_MAX_POLL_INTERVAL = 60
+# defaults for async_run_jobs_and_wait
+MAX_CONCURRENT_JOBS = 100
+MAX_CONCURRENT_JOB_REQUESTS = 10
+
 logging = get_logger("__name__")
 
 
@@ -67,7 +77,8 @@ class Gen3Jobs:
     async def async_run_job_and_wait(self, job_name, job_input, _ssl=None, **kwargs):
         """
         Asynchronous function to create a job, wait for output, and return. Will
-        sleep in a linear delay until the job is done, starting with 1 second.
+        wait without blocking the event loop until the job is done, starting with
+        JOB_POLL_INTERVAL seconds and waiting 1.5x longer after every check.
 
         Args:
             _ssl (None, optional): whether or not to use ssl
@@ -77,15 +88,84 @@ class Gen3Jobs:
         Returns:
             Dict: Response from the endpoint
         """
-        job_create_response = await self.async_create_job(job_name, job_input)
+        return await self._async_run_job_and_wait(
+            job_name, job_input, asyncio.Semaphore(1), jitter=False, _ssl=_ssl
+        )
+
+    async def async_run_jobs_and_wait(
+        self, jobs, max_concurrent_jobs=None, max_concurrent_requests=None, _ssl=None
+    ):
+        """
+        Asynchronous function to create many jobs and wait for their output,
+        yielding the output of each job as soon as it is done.
+
+        The jobs are polled like in `async_run_job_and_wait`, with the wait before
+        each check randomized between 0.5x and 1.5x so jobs created together do
+        not all check their status at the same time. Requests to the job service
+        are shared between the jobs, with at most `max_concurrent_requests` of
+        them sent at a time.
+
+        Example:
+            jobs_to_run = (
+                (phsid, DBGAP_METADATA_JOB, {"phsid_list": phsid}) for phsid in phsids
+            )
+            async for result in jobs.async_run_jobs_and_wait(jobs_to_run):
+                if not result.ok:
+                    print(f"job for {result.key} failed: {result.error}")
+
+        Args:
+            jobs (Iterable[Tuple[object, str, Dict]]): `(key, job_name, job_input)`
+                for each job to run, the key identifies the job in the results
+            max_concurrent_jobs (int, optional): maximum number of jobs created and
+                not yet done at a time, defaults to MAX_CONCURRENT_JOBS
+            max_concurrent_requests (int, optional): maximum number of requests to
+                the job service at a time, defaults to MAX_CONCURRENT_JOB_REQUESTS
+            _ssl (None, optional): whether or not to use ssl
+
+        Yields:
+            gen3.utils.AsyncRequestResult: for each job in the order they finish,
+                with the job output as result, or the error if the job could not be
+                created, did not complete or its output could not be retrieved
+        """
+        semaphore = asyncio.Semaphore(
+            max_concurrent_requests or MAX_CONCURRENT_JOB_REQUESTS
+        )
+
+        def _job_func(job_name, job_input):
+            return lambda: self._async_run_job_and_wait(
+                job_name, job_input, semaphore, jitter=True, _ssl=_ssl
+            )
+
+        executor = BoundedAsyncExecutor(
+            max_concurrent_requests=max_concurrent_jobs or MAX_CONCURRENT_JOBS
+        )
+        async for result in executor.run(
+            (key, _job_func(job_name, job_input)) for key, job_name, job_input in jobs
+        ):
+            yield result
+
+    async def _async_run_job_and_wait(
+        self, job_name, job_input, semaphore, jitter, _ssl=None
+    ):
+        """
+        Create a job, wait for it to be done and return its output, sending at
+        most as many requests at a time as `semaphore` allows.
+        """
+        async with semaphore:
+            job_create_response = await self.async_create_job(
+                job_name, job_input, _ssl=_ssl
+            )
+        job_id = job_create_response.get("uid")
 
         status = {"status": "Running"}
-        sleep_time = 3
+        sleep_time = JOB_POLL_INTERVAL
         while status.get("status") == "Running":
-            logging.info(f"job still running, waiting for {sleep_time} seconds...")
-            time.sleep(sleep_time)
-            sleep_time *= 1.5
-            status = await self.async_get_status(job_create_response.get("uid"))
+            wait_time = sleep_time * random.uniform(0.5, 1.5) if jitter else sleep_time
+            logging.info(f"job still running, waiting for {wait_time:.1f} seconds...")
+            await asyncio.sleep(wait_time)
+            sleep_time = min(sleep_time * 1.5, JOB_MAX_POLL_INTERVAL)
+            async with semaphore:
+                status = await self.async_get_status(job_id, _ssl=_ssl)
             logging.info(f"{status}")
 
         logging.info(f"Job is finished!")
@@ -93,7 +173,8 @@ class Gen3Jobs:
         if status.get("status") != "Completed":
             raise Exception(f"Job status not complete: {status.get('status')}.")
 
-        response = await self.async_get_output(job_create_response.get("uid"))
+        async with semaphore:
+            response = await self.async_get_output(job_id, _ssl=_ssl)
         return response
 
     def is_healthy(self):
@@ -4,6 +4,7 @@ Contains class for interacting with Gen3's Metadata Service.
 import aiohttp
 import backoff
 from datetime import datetime
+import functools
 import requests
 import json
 import os
@@ -11,6 +12,7 @@ from urllib.parse import urlparse
 
 from gen3.utils import (
     append_query_params,
+    BoundedAsyncExecutor,
     DEFAULT_BACKOFF_SETTINGS,
     BACKOFF_NO_LOG_IF_NOT_RETRIED,
     _verify_schema,
@@ -33,6 +35,8 @@ from cdislogging import get_logger
 logging = get_logger("__name__")
 
 
+MAX_CONCURRENT_REQUESTS = 5
+
 PACKAGE_CONTENTS_STANDARD_KEY = "package_contents"
 PACKAGE_CONTENTS_SCHEMA = {
     "type": "array",
@@ -512,6 +516,32 @@ class Gen3Metadata:
 
         return response.json()
 
+    @backoff.on_exception(backoff.expo, Exception, **DEFAULT_BACKOFF_SETTINGS)
+    async def async_delete(self, guid, _ssl=None, **kwargs):
+        """
+        Asynchronous function to delete the metadata associated with the guid
+
+        Args:
+            guid (str): guid to use
+            _ssl (None, optional): whether or not to use ssl
+        """
+        async with aiohttp.ClientSession() as session:
+            url = self.admin_endpoint + f"/metadata/{guid}"
+            url_with_params = append_query_params(url, **kwargs)
+
+            # aiohttp only allows basic auth with their built in auth, so we
+            # need to manually add JWT auth header
+            headers = {"Authorization": self._auth_provider._get_auth_value()}
+
+            logging.debug(f"hitting: {url_with_params}")
+            async with session.delete(
+                url_with_params, headers=headers, ssl=_ssl
+            ) as response:
+                response.raise_for_status()
+                response = await response.json()
+
+        return response
+
     #
     # Alias Support
     #
@@ -783,7 +813,7 @@ class Gen3Metadata:
             ) as response:
                 response.raise_for_status()
 
-                return await response.text
+                return await response.text()
 
     @backoff.on_exception(backoff.expo, Exception, **BACKOFF_NO_LOG_IF_NOT_RETRIED)
     def delete_alias(self, guid, alias, **kwargs):
@@ -835,7 +865,139 @@ class Gen3Metadata:
             ) as response:
                 response.raise_for_status()
 
-                return await response.text
+                return await response.text()
+
+    async def async_batch_create_aliases(
+        self,
+        aliases_by_guid,
+        max_concurrent_requests=MAX_CONCURRENT_REQUESTS,
+        _ssl=None,
+        **kwargs,
+    ):
+        """
+        Asyncronously create Aliases for many guids, keeping up to
+        `max_concurrent_requests` requests in flight
+
+        Args:
+            aliases_by_guid (Dict[str, list[str]]): guid to the aliases to set for it
+            max_concurrent_requests (int, optional): max requests in flight
+            _ssl (None, optional): whether or not to use ssl
+            **kwargs: additional query params
+
+        Returns:
+            Dict[str, AsyncRequestResult]: result for each guid, failures are
+                reported in the result instead of raised
+        """
+        alias_requests = (
+            (
+                guid,
+                functools.partial(
+                    self.async_create_aliases, guid, aliases, _ssl=_ssl, **kwargs
+                ),
+            )
+            for guid, aliases in aliases_by_guid.items()
+        )
+        return await self._async_run_alias_requests(
+            alias_requests, max_concurrent_requests
+        )
+
+    async def async_batch_update_aliases(
+        self,
+        aliases_by_guid,
+        merge=False,
+        max_concurrent_requests=MAX_CONCURRENT_REQUESTS,
+        _ssl=None,
+        **kwargs,
+    ):
+        """
+        Asyncronously update Aliases for many guids, keeping up to
+        `max_concurrent_requests` requests in flight
+
+        Args:
+            aliases_by_guid (Dict[str, list[str]]): guid to the aliases to set for it
+            merge (bool, optional): Whether or not to aliases with existing values
+            max_concurrent_requests (int, optional): max requests in flight
+            _ssl (None, optional): whether or not to use ssl
+            **kwargs: additional query params
+
+        Returns:
+            Dict[str, AsyncRequestResult]: result for each guid, failures are
+                reported in the result instead of raised
+        """
+        alias_requests = (
+            (
+                guid,
+                functools.partial(
+                    self.async_update_aliases,
+                    guid,
+                    aliases,
+                    merge=merge,
+                    _ssl=_ssl,
+                    **kwargs,
+                ),
+            )
+            for guid, aliases in aliases_by_guid.items()
+        )
+        return await self._async_run_alias_requests(
+            alias_requests, max_concurrent_requests
+        )
+
+    async def async_batch_delete_aliases(
+        self,
+        aliases_by_guid,
+        max_concurrent_requests=MAX_CONCURRENT_REQUESTS,
+        _ssl=None,
+        **kwargs,
+    ):
+        """
+        Asyncronously delete Aliases for many guids, keeping up to
+        `max_concurrent_requests` guids in flight
+
+        Args:
+            aliases_by_guid (Dict[str, list[str]]): guid to the aliases to delete
+                from it. An empty list (or None) deletes all aliases for the guid
+            max_concurrent_requests (int, optional): max guids in flight
+            _ssl (None, optional): whether or not to use ssl
+            **kwargs: additional query params
+
+        Returns:
+            Dict[str, AsyncRequestResult]: result for each guid, failures are
+                reported in the result instead of raised
+        """
+
+        async def _delete_guid_aliases(guid, aliases):
+            if not aliases:
+                return await self.async_delete_aliases(guid, _ssl=_ssl, **kwargs)
+
+            return [
+                await self.async_delete_alias(guid, alias, _ssl=_ssl, **kwargs)
+                for alias in aliases
+            ]
+
+        alias_requests = (
+            (guid, functools.partial(_delete_guid_aliases, guid, aliases))
+            for guid, aliases in aliases_by_guid.items()
+        )
+        return await self._async_run_alias_requests(
+            alias_requests, max_concurrent_requests
+        )
+
+    async def _async_run_alias_requests(self, alias_requests, max_concurrent_requests):
+        executor = BoundedAsyncExecutor(max_concurrent_requests)
+        results = {}
+        async for result in executor.run(alias_requests):
+            if not result.ok:
+                logging.error(
+                    f"Error while attempting to change aliases for GUID: "
+                    f"'{result.key}'. Error: {result.error}"
+                )
+            results[result.key] = result
+
+        logging.info(
+            f"alias requests: {executor.counts['succeeded']} succeeded, "
+            f"{executor.counts['failed']} failed"
+        )
+        return results
 
     def _prepare_metadata(
         self, metadata, indexd_doc, force_metadata_columns_even_if_empty
@@ -1,6 +1,33 @@
+import codecs
+from concurrent.futures import ThreadPoolExecutor
+import csv
+import heapq
+import itertools
+import json
+import os
+import queue
+import threading
+
 import requests
+from cdislogging import get_logger
+
+from gen3.tools.utils import _import_pyarrow
+from gen3.utils import GraphQLClient, raise_for_status_and_print_error
+
+logging = get_logger("__name__")
 
-from gen3.utils import raise_for_status_and_print_error
+# size of the chunks of a raw data download response that are parsed at a time
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# number of records per Arrow record batch or Parquet row group
+DOWNLOAD_BATCH_SIZE = 65536
+# number of records buffered between the partition downloads and the merged stream
+PARTITION_QUEUE_SIZE = 10000
+RAW_DATA_FILE_FORMATS = {
+    ".csv": "csv",
+    ".tsv": "tsv",
+    ".jsonl": "jsonl",
+    ".parquet": "parquet",
+}
 
 
 class Gen3Query:
@@ -9,6 +36,8 @@ class Gen3Query:
 
     Args:
         auth_provider (Gen3Auth): A Gen3Auth class instance.
+        cache_ttl (float, optional): Seconds to cache the responses of GraphQL queries
+            sent with `cache=True` for. Nothing is cached by default.
 
     Examples:
         This generates the Gen3Query class pointed at the sandbox commons while
@@ -18,8 +47,13 @@ class Gen3Query:
         ... query = Gen3Query(auth)
     """
 
-    def __init__(self, auth_provider):
+    def __init__(self, auth_provider, cache_ttl=None):
         self._auth_provider = auth_provider
+        self._graphql = GraphQLClient(
+            f"{self._auth_provider.endpoint}/guppy/graphql",
+            self._auth_provider,
+            cache_ttl=cache_ttl,
+        )
 
     def query(
         self,
@@ -32,6 +66,8 @@ class Gen3Query:
         sort_object=None,
         accessibility=None,
         verbose=True,
+        partition_field=None,
+        num_partitions=None,
     ):
         """
         Execute a query against a Data Commons.
@@ -45,6 +81,12 @@ class Gen3Query:
             filter_object (object, optional): Filter to apply. For syntax details, see https://github.com/uc-cdis/guppy/blob/master/doc/queries.md#filter.
             sort_object (object, optional): { field: sort method } object.
             accessibility (list, optional): One of ["accessible" (default), "unaccessible", "all"]. Only valid when querying a data type in "regular" tier access mode.
+            partition_field (str, optional): When `first + offset` is over the 10,000 records
+                ElasticSearch limit, download the data in partitions of this field concurrently
+                instead of in a single request, then sort the records. Records without a value
+                for this field are not returned, a warning is logged when there are some. See
+                `iter_partitioned_raw_data_download`.
+            num_partitions (int, optional): Number of partitions to download (default: 4).
 
         Returns:
             Object: {"data": {<data_type>: [<record>, <record>, ...]}}
@@ -78,6 +120,34 @@ class Gen3Query:
                 "AND": [{"=": {field: val}} for field, val in filters.items()]
             }
 
+        if first + offset > 10000 and partition_field:  # ElasticSearch limitation
+            # download the fields to sort on to sort the records once merged
+            sort_only_fields = [field for field in sort_object if field not in fields]
+            data = list(
+                self.iter_partitioned_raw_data_download(
+                    data_type=data_type,
+                    fields=fields + sort_only_fields,
+                    partition_field=partition_field,
+                    filter_object=filter_object,
+                    accessibility=accessibility,
+                    num_partitions=num_partitions,
+                )
+            )
+            # partitions are merged as they download, sort the merged records
+            for field, val in reversed(list(sort_object.items())):
+                data.sort(
+                    key=lambda record: (
+                        record.get(field) is None,
+                        record.get(field),
+                    ),
+                    reverse=val == "desc",
+                )
+            data = data[offset : offset + first]
+            for record in data:
+                for field in sort_only_fields:
+                    record.pop(field, None)
+            return {"data": {data_type: data}}
+
         if first + offset > 10000:  # ElasticSearch limitation
             sort_fields = [{field: val} for field, val in sort_object.items()]
             data = self.raw_data_download(
@@ -109,13 +179,16 @@ class Gen3Query:
         variables = {"filter": filter_object}
         return self.graphql_query(query_string=query_string, variables=variables)
 
-    def graphql_query(self, query_string, variables=None):
+    def graphql_query(self, query_string, variables=None, cache=False):
         """
         Execute a GraphQL query against a Data Commons.
 
         Args:
             query_txt (str): GraphQL query as text. For syntax details, see https://github.com/uc-cdis/guppy/blob/master/doc/queries.md.
             variables (:obj:`object`, optional): Dictionary of variables to pass with the query.
+            cache (bool, optional): Whether the response can be served from the cache, for
+                read-only queries such as aggregations. Only used when the class was created
+                with a `cache_ttl`.
 
         Returns:
             Object: {"data": {<data_type>: [<record>, <record>, ...]}}
@@ -124,24 +197,22 @@ class Gen3Query:
             >>> query_string = "{ my_index { my_field } }"
             ... Gen3Query.graphql_query(query_string)
         """
-        url = f"{self._auth_provider.endpoint}/guppy/graphql"
-        response = requests.post(
-            url,
-            json={"query": query_string, "variables": variables},
-            auth=self._auth_provider,
-        )
-        try:
-            raise_for_status_and_print_error(response)
-        except Exception:
-            print(
-                f"Unable to query.\nQuery: {query_string}\nVariables: {variables}\n{response.text}"
-            )
-            raise
-        try:
-            return response.json()
-        except Exception:
-            print(f"Did not receive JSON: {response.text}")
-            raise
+
+        def _parse(response):
+            try:
+                raise_for_status_and_print_error(response)
+            except Exception:
+                print(
+                    f"Unable to query.\nQuery: {query_string}\nVariables: {variables}\n{response.text}"
+                )
+                raise
+            try:
+                return response.json()
+            except Exception:
+                print(f"Did not receive JSON: {response.text}")
+                raise
+
+        return self._graphql.query(query_string, variables, cache=cache, parse=_parse)
 
     def raw_data_download(
         self,
@@ -215,3 +286,468 @@ class Gen3Query:
             data = data[:first]
 
         return data
+
+    def iter_raw_data_download(
+        self,
+        data_type,
+        fields,
+        filter_object=None,
+        sort_fields=None,
+        accessibility=None,
+        first=None,
+        offset=None,
+    ):
+        """
+        Execute a raw data download against a Data Commons, yielding the records as
+        the response streams in instead of loading the whole response in memory.
+        `first` and `offset` are applied as the records stream by, and the download
+        stops once `first` records have been yielded.
+
+        Args:
+            data_type (str): Data type to download from.
+            fields (list): List of fields to return.
+            filter_object (object, optional): Filter to apply. For syntax details, see https://github.com/uc-cdis/guppy/blob/master/doc/queries.md#filter.
+            sort_fields (list, optional): List of { field: sort method } objects.
+            accessibility (list, optional): One of ["accessible" (default), "unaccessible", "all"]. Only valid when downloading from a data type in "regular" tier access mode.
+            first (int, optional): Number of rows to return (default: all rows).
+            offset (int, optional): Starting position (default: 0).
+
+        Yields:
+            dict: <record>
+
+        Examples:
+            >>> for record in Gen3Query.iter_raw_data_download(
+                    data_type="subject",
+                    fields=["vital_status", "submitter_id"],
+                ):
+                    print(record["submitter_id"])
+        """
+        if not accessibility:
+            accessibility = "accessible"
+        if not offset:
+            offset = 0
+
+        body = {"type": data_type, "fields": fields, "accessibility": accessibility}
+        if filter_object:
+            body["filter"] = filter_object
+        if sort_fields:
+            body["sort"] = sort_fields
+
+        url = f"{self._auth_provider.endpoint}/guppy/download"
+        response = requests.post(
+            url,
+            json=body,
+            auth=self._auth_provider,
+            stream=True,
+        )
+        try:
+            try:
+                raise_for_status_and_print_error(response)
+            except Exception:
+                print(f"Unable to download.\nBody: {body}\n{response.text}")
+                raise
+            records = _iter_json_array(response.iter_content(DOWNLOAD_CHUNK_SIZE))
+            stop = offset + first if first else None
+            yield from itertools.islice(records, offset, stop)
+        finally:
+            response.close()
+
+    def iter_raw_data_download_batches(
+        self, data_type, fields, batch_size=None, **kwargs
+    ):
+        """
+        Execute a raw data download against a Data Commons, yielding the records
+        as Arrow record batches as the response streams in. Requires pyarrow.
+
+        Args:
+            data_type (str): Data type to download from.
+            fields (list): List of fields to return.
+            batch_size (int, optional): Number of records per batch (default: DOWNLOAD_BATCH_SIZE).
+            **kwargs: Other `iter_raw_data_download` arguments, eg. filter_object.
+
+        Yields:
+            pyarrow.RecordBatch: batches of records with the columns in `fields`.
+                The types are inferred from the first batch.
+        """
+        pyarrow = _import_pyarrow()
+        records = self.iter_raw_data_download(data_type, fields, **kwargs)
+        schema = None
+        for batch in _iter_chunks(records, batch_size or DOWNLOAD_BATCH_SIZE):
+            columns = {
+                field: [record.get(field) for record in batch] for field in fields
+            }
+            if schema is None:
+                record_batch = pyarrow.RecordBatch.from_pydict(columns)
+                schema = record_batch.schema
+            else:
+                record_batch = pyarrow.RecordBatch.from_pydict(columns, schema=schema)
+            yield record_batch
+
+    def raw_data_download_to_file(
+        self, output_file, data_type, fields, output_format=None, **kwargs
+    ):
+        """
+        Execute a raw data download against a Data Commons and stream the records
+        straight to a CSV, TSV, JSON lines or Parquet file.
+
+        Args:
+            output_file (str): Path of the file to write.
+            data_type (str): Data type to download from.
+            fields (list): List of fields to return, and columns of the file.
+            output_format (str, optional): One of "csv", "tsv", "jsonl" or "parquet"
+                (default: inferred from the `output_file` extension).
+                Parquet requires pyarrow.
+            **kwargs: Other `iter_raw_data_download` arguments, eg. filter_object.
+
+        Returns:
+            int: Number of records written.
+
+        Examples:
+            >>> Gen3Query.raw_data_download_to_file(
+                    "subjects.parquet",
+                    data_type="subject",
+                    fields=["vital_status", "submitter_id"],
+                )
+        """
+        if not output_format:
+            extension = os.path.splitext(output_file)[1].lower()
+            output_format = RAW_DATA_FILE_FORMATS.get(extension)
+        if output_format not in RAW_DATA_FILE_FORMATS.values():
+            raise ValueError(
+                f"Unable to write {output_file}: output_format should be one of "
+                f"{sorted(RAW_DATA_FILE_FORMATS.values())}"
+            )
+
+        count = 0
+        if output_format == "parquet":
+            pyarrow = _import_pyarrow()
+            writer = None
+            try:
+                for record_batch in self.iter_raw_data_download_batches(
+                    data_type, fields, **kwargs
+                ):
+                    if writer is None:
+                        writer = pyarrow.parquet.ParquetWriter(
+                            output_file, record_batch.schema
+                        )
+                    writer.write_batch(record_batch)
+                    count += record_batch.num_rows
+            finally:
+                if writer is not None:
+                    writer.close()
+            return count
+
+        records = self.iter_raw_data_download(data_type, fields, **kwargs)
+        with open(output_file, "w", newline="") as f:
+            if output_format == "jsonl":
+                for record in records:
+                    f.write(json.dumps(record) + "\n")
+                    count += 1
+            else:
+                writer = csv.DictWriter(
+                    f,
+                    fieldnames=fields,
+                    delimiter="\t" if output_format == "tsv" else ",",
+                    extrasaction="ignore",
+                )
+                writer.writeheader()
+                for record in records:
+                    writer.writerow(
+                        {
+                            field: json.dumps(value)
+                            if isinstance(value, (list, dict))
+                            else value
+                            for field, value in record.items()
+                        }
+                    )
+                    count += 1
+        return count
+
+    def get_partition_filters(
+        self,
+        data_type,
+        partition_field,
+        filter_object=None,
+        accessibility=None,
+        num_partitions=None,
+        numeric=False,
+    ):
+        """
+        Split the records matching a filter into partitions of a field, using
+        Guppy aggregations.
+
+        Text fields are split by value: the values of the field are grouped into
+        `num_partitions` partitions with similar numbers of records. Numeric fields
+        are split into `num_partitions` ranges of equal width between the minimum
+        and maximum values.
+
+        Records without a value for `partition_field` are not in any partition, a
+        warning with their number is logged when there are some.
+
+        Args:
+            data_type (str): Data type to partition.
+            partition_field (str): Field to partition on.
+            filter_object (object, optional): Filter of the records to partition.
+            accessibility (list, optional): One of ["accessible" (default), "unaccessible", "all"].
+            num_partitions (int, optional): Number of partitions (default: 4).
+            numeric (bool, optional): Whether `partition_field` is numeric.
+
+        Returns:
+            List: filter objects of the partitions, including `filter_object`
+        """
+        if not accessibility:
+            accessibility = "accessible"
+        num_partitions = num_partitions or 4
+
+        histogram = (
+            "histogram { min max count }" if numeric else "histogram { key count }"
+        )
+        query_string = f"""query($filter: JSON) {{
+            _aggregation {{
+                {data_type}(filter: $filter, accessibility: {accessibility}) {{
+                    _totalCount
+                    {partition_field} {{ {histogram} }}
+                }}
+            }}
+        }}"""
+        response = self.graphql_query(
+            query_string=query_string, variables={"filter": filter_object}
+        )
+        aggregation = response["data"]["_aggregation"][data_type]
+        buckets = aggregation[partition_field]["histogram"]
+
+        total = aggregation.get("_totalCount") or 0
+        missing = total - sum(bucket.get("count") or 0 for bucket in buckets)
+        if missing > 0:
+            logging.warning(
+                f"{missing} of {total} {data_type} records have no value for "
+                f"{partition_field} and are not in any partition"
+            )
+
+        partitions = []
+        if numeric:
+            if buckets and buckets[0].get("min") is not None:
+                minimum, maximum = buckets[0]["min"], buckets[0]["max"]
+                step = (maximum - minimum) / num_partitions
+                for i in range(num_partitions):
+                    start = minimum + i * step
+                    if i == num_partitions - 1:
+                        end = {"<=": {partition_field: maximum}}
+                    else:
+                        end = {"<": {partition_field: minimum + (i + 1) * step}}
+                    partitions.append({"AND": [{">=": {partition_field: start}}, end]})
+        else:
+            # assign the largest values first to the smallest partition
+            sizes = [(0, i) for i in range(min(num_partitions, len(buckets)))]
+            values = [[] for _ in sizes]
+            for bucket in sorted(buckets, key=lambda b: b["count"], reverse=True):
+                size, i = heapq.heappop(sizes)
+                values[i].append(bucket["key"])
+                heapq.heappush(sizes, (size + bucket["count"], i))
+            partitions = [{"IN": {partition_field: keys}} for keys in values]
+
+        if filter_object:
+            partitions = [
+                {"AND": [filter_object, partition]} for partition in partitions
+            ]
+        return partitions
+
+    def iter_partitioned_raw_data_download(
+        self,
+        data_type,
+        fields,
+        partition_field=None,
+        filter_object=None,
+        accessibility=None,
+        num_partitions=None,
+        numeric=False,
+        partitions=None,
+        max_concurrent_requests=None,
+    ):
+        """
+        Execute a raw data download against a Data Commons as concurrent downloads
+        of partitions of the records, merged into a single stream of records.
+
+        The records are yielded in the order they are downloaded, so the order of
+        the records is not deterministic.
+
+        Args:
+            data_type (str): Data type to download from.
+            fields (list): List of fields to return.
+            partition_field (str, optional): Field to partition the records on, see
+                `get_partition_filters`. Records without a value for it are not downloaded.
+            filter_object (object, optional): Filter to apply.
+            accessibility (list, optional): One of ["accessible" (default), "unaccessible", "all"].
+            num_partitions (int, optional): Number of partitions (default: 4).
+            numeric (bool, optional): Whether `partition_field` is numeric.
+            partitions (list, optional): Filter objects of the partitions to download
+                instead of partitioning on `partition_field`, eg. date ranges. They
+                should not overlap.
+            max_concurrent_requests (int, optional): Number of partitions to download
+                at the same time (default: all of them).
+
+        Yields:
+            dict: <record>
+
+        Examples:
+            >>> for record in Gen3Query.iter_partitioned_raw_data_download(
+                    data_type="subject",
+                    fields=["vital_status", "submitter_id"],
+                    partition_field="project_id",
+                    num_partitions=8,
+                ):
+                    print(record["submitter_id"])
+        """
+        if partitions is None:
+            if not partition_field:
+                raise ValueError(
+                    "One of `partition_field` and `partitions` is required."
+                )
+            partitions = self.get_partition_filters(
+                data_type,
+                partition_field,
+                filter_object=filter_object,
+                accessibility=accessibility,
+                num_partitions=num_partitions,
+                numeric=numeric,
+            )
+        if not partitions:
+            return
+
+        records = queue.Queue(maxsize=PARTITION_QUEUE_SIZE)
+        stop = threading.Event()
+        done = object()
+
+        def _put(item):
+            while not stop.is_set():
+                try:
+                    records.put(item, timeout=1)
+                    return
+                except queue.Full:
+                    pass
+
+        def _download(partition):
+            try:
+                for record in self.iter_raw_data_download(
+                    data_type=data_type,
+                    fields=fields,
+                    filter_object=partition,
+                    accessibility=accessibility,
+                ):
+                    if stop.is_set():
+                        return
+                    _put(record)
+            except Exception as e:
+                _put(e)
+            finally:
+                _put(done)
+
+        executor = ThreadPoolExecutor(
+            max_workers=max_concurrent_requests or len(partitions)
+        )
+        try:
+            for partition in partitions:
+                executor.submit(_download, partition)
+            remaining = len(partitions)
+            while remaining:
+                item = records.get()
+                if item is done:
+                    remaining -= 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    yield item
+        finally:
+            # stop the downloads if the stream is closed early or failed
+            stop.set()
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _iter_chunks(iterable, size):
+    """Yield lists of `size` items of an iterable, the last one may be shorter."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _iter_json_array(chunks):
+    """
+    Incrementally parse a JSON array, yielding its items as soon as they are
+    complete.
+
+    Args:
+        chunks (iterable): bytes (UTF-8) or str chunks of the JSON array
+
+    Yields:
+        the items of the array
+    """
+    decoder = json.JSONDecoder()
+    utf8_decoder = codecs.getincrementaldecoder("utf-8")()
+    chunks = iter(chunks)
+    buffer = ""
+    position = 0
+    started = False
+    finished = False
+
+    def _read():
+        nonlocal buffer, position, finished
+        for chunk in chunks:
+            if isinstance(chunk, bytes):
+                chunk = utf8_decoder.decode(chunk)
+            if chunk:
+                # drop what was already parsed so the buffer stays small
+                buffer = buffer[position:] + chunk
+                position = 0
+                return True
+        finished = True
+        return False
+
+    def _skip_whitespace():
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\n\r":
+                position += 1
+            if position < len(buffer) or not _read():
+                return
+
+    _skip_whitespace()
+    if position >= len(buffer) or buffer[position] != "[":
+        raise ValueError("Did not receive a JSON array")
+    position += 1
+
+    while True:
+        _skip_whitespace()
+        if position >= len(buffer):
+            raise ValueError("Unexpected end of JSON array")
+        if buffer[position] == "]":
+            return
+        if started:
+            if buffer[position] != ",":
+                raise ValueError(
+                    f"Expected ',' in JSON array: {buffer[position:][:50]}"
+                )
+            position += 1
+            _skip_whitespace()
+        while True:
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # the item is incomplete, unless there is nothing left to read
+                if finished or not _read():
+                    raise
+                continue
+            if (
+                not isinstance(item, (dict, list, str))
+                and (end == len(buffer) or buffer[end] not in ",] \t\n\r")
+                and not finished
+                and _read()
+            ):
+                # a number or literal may continue in the next chunk
+                continue
+            break
+        position = end
+        started = True
+        yield item
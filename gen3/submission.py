@@ -1,14 +1,38 @@
+import collections
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import csv
+import io
 import itertools
 import json
 import requests
 import os
+import time
 from cdislogging import get_logger
 import pandas as pd
 
-from gen3.utils import raise_for_status_and_print_error
+from gen3.utils import GraphQLClient, raise_for_status_and_print_error
 
 logging = get_logger("__name__")
 
+# submit_file halves the chunk size when a chunk takes longer than this, in seconds
+SUBMISSION_TARGET_LATENCY = 60
+# responses that mean a chunk has to be resubmitted in smaller chunks
+SUBMISSION_RETRY_STATUS_CODES = (408, 413, 504)
+SUBMISSION_RETRY_MESSAGES = (
+    "Request Timeout",
+    "413 Request Entity Too Large",
+    "Connection aborted.",
+    "service failure - try again later",
+)
+SUBMISSION_FILE_EXTENSIONS = (".csv", ".tsv", ".txt", ".xlsx")
+# responses that mean a batch of records to delete has to be split: request
+# timeout, url too long and gateway timeout
+DELETE_RETRY_STATUS_CODES = (408, 414, 504)
+# number of ids to query at a time when listing all the records of a node
+DELETE_QUERY_PAGE_SIZE = 5000
+# where the dictionary and GraphQL schema of each commons are cached between runs
+SCHEMA_CACHE_FOLDER = "{}/.cache/gen3/schema_cache".format(os.path.expanduser("~"))
+
 
 class Gen3Error(Exception):
     pass
@@ -31,6 +55,13 @@ class Gen3Submission:
 
     Args:
         auth_provider (Gen3Auth): A Gen3Auth class instance.
+        cache_ttl (float, optional): Seconds to cache the responses of read-only
+            requests (GraphQL schema, dictionary and queries sent with `cache=True`)
+            for. Nothing is cached by default.
+        schema_cache_dir (str, optional): Folder the GraphQL schema and dictionary
+            are saved in, with their ETag or Last-Modified header, so they are only
+            downloaded again when they change. Defaults to SCHEMA_CACHE_FOLDER, pass
+            False to not save them to disk.
 
     Examples:
         This generates the Gen3Submission class pointed at the sandbox commons while
@@ -41,10 +72,20 @@ class Gen3Submission:
 
     """
 
-    def __init__(self, endpoint=None, auth_provider=None):
+    def __init__(
+        self, endpoint=None, auth_provider=None, cache_ttl=None, schema_cache_dir=None
+    ):
         # auth_provider legacy interface required endpoint as 1st arg
         self._auth_provider = auth_provider or endpoint
         self._endpoint = self._auth_provider.endpoint
+        if schema_cache_dir is None:
+            schema_cache_dir = SCHEMA_CACHE_FOLDER
+        self._graphql = GraphQLClient(
+            "{}/api/v0/submission/graphql".format(self._endpoint),
+            self._auth_provider,
+            cache_ttl=cache_ttl,
+            cache_dir=schema_cache_dir or None,
+        )
 
     def __export_file(self, filename, output):
         """Writes an API response to a file."""
@@ -223,15 +264,29 @@ class Gen3Submission:
         """
         return self.delete_records(program, project, [uuid])
 
-    def delete_records(self, program, project, uuids, batch_size=100):
+    def delete_records(
+        self,
+        program,
+        project,
+        uuids,
+        batch_size=100,
+        max_concurrent_requests=1,
+        max_requests_per_second=None,
+    ):
         """
         Delete a list of records from a project.
 
+        With max_concurrent_requests > 1, up to that many batches are deleted at the
+        same time, and a batch whose request is too long or times out is retried in
+        smaller batches.
+
         Args:
             program (str): The program to delete from.
             project (str): The project to delete from.
             uuids (list): The list of uuids of the records to delete
             batch_size (int, optional, default: 100): how many records to delete at a time
+            max_concurrent_requests (int, optional, default: 1): how many batches to delete at the same time
+            max_requests_per_second (float, optional): limit on the number of delete requests started per second
 
         Examples:
             This deletes a list of records from the CCLE project in the sandbox commons.
@@ -243,6 +298,14 @@ class Gen3Submission:
         api_url = "{}/api/v0/submission/{}/{}/entities".format(
             self._endpoint, program, project
         )
+        if max_concurrent_requests > 1:
+            return self._delete_records_concurrently(
+                api_url,
+                uuids,
+                batch_size,
+                max_concurrent_requests,
+                max_requests_per_second,
+            )
         for i in itertools.count():
             uuids_to_delete = uuids[batch_size * i : batch_size * (i + 1)]
             if len(uuids_to_delete) == 0:
@@ -262,7 +325,139 @@ class Gen3Submission:
                 raise
         return output
 
-    def delete_node(self, program, project, node_name, batch_size=100, verbose=True):
+    def _delete_records_concurrently(
+        self,
+        api_url,
+        uuids,
+        batch_size,
+        max_concurrent_requests,
+        max_requests_per_second=None,
+    ):
+        """
+        Delete batches of records with up to max_concurrent_requests requests in
+        flight, halving the batch size when a request is too long or times out.
+
+        Args:
+            api_url (str): The entities endpoint of the project.
+            uuids (list): The list of uuids of the records to delete
+            batch_size (int): how many records to delete at a time
+            max_concurrent_requests (int): how many batches to delete at the same time
+            max_requests_per_second (float, optional): limit on the number of delete requests started per second
+
+        Returns:
+            requests.Response: the response of the last deleted batch
+        """
+
+        def _delete(uuids_to_delete):
+            try:
+                return requests.delete(
+                    "{}/{}".format(api_url, ",".join(uuids_to_delete)),
+                    auth=self._auth_provider,
+                )
+            except requests.exceptions.Timeout as e:
+                return e
+
+        batches = collections.deque(
+            uuids[i : i + batch_size] for i in range(0, len(uuids), batch_size)
+        )
+        min_interval = 1 / max_requests_per_second if max_requests_per_second else 0
+        next_request_time = time.monotonic()
+        in_flight = {}
+        output = None
+        with ThreadPoolExecutor(max_workers=max_concurrent_requests) as executor:
+            while batches or in_flight:
+                while batches and len(in_flight) < max_concurrent_requests:
+                    # rate limit the start of the requests
+                    delay = next_request_time - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                    next_request_time = time.monotonic() + min_interval
+                    uuids_to_delete = batches.popleft()
+                    in_flight[
+                        executor.submit(_delete, uuids_to_delete)
+                    ] = uuids_to_delete
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    uuids_to_delete = in_flight.pop(future)
+                    response = future.result()
+                    if (
+                        isinstance(response, requests.exceptions.Timeout)
+                        or response.status_code in DELETE_RETRY_STATUS_CODES
+                    ) and len(uuids_to_delete) > 1:
+                        # the url is too long or the batch too slow to delete,
+                        # retry in smaller batches
+                        batch_size = max(min(batch_size, len(uuids_to_delete)) // 2, 1)
+                        logging.warning(
+                            "Retrying {} records in batches of {}: {}".format(
+                                len(uuids_to_delete), batch_size, response
+                            )
+                        )
+                        batches.extendleft(
+                            reversed(
+                                [
+                                    uuids_to_delete[i : i + batch_size]
+                                    for i in range(0, len(uuids_to_delete), batch_size)
+                                ]
+                            )
+                        )
+                        continue
+                    if isinstance(response, requests.exceptions.Timeout):
+                        print(
+                            "\n{}\nFailed to delete uuids: {}".format(
+                                response, uuids_to_delete
+                            )
+                        )
+                        raise response
+                    try:
+                        raise_for_status_and_print_error(response)
+                    except requests.exceptions.HTTPError:
+                        print(
+                            "\n{}\nFailed to delete uuids: {}".format(
+                                response.text, uuids_to_delete
+                            )
+                        )
+                        raise
+                    output = response
+        return output
+
+    def _get_node_ids(self, project_id, node, page_size=None):
+        """
+        Get the ids of all the records of a node in a project, paging through
+        them ordered by id.
+
+        Args:
+            project_id (str): The project to get the ids from.
+            node (str): Name of the node
+            page_size (int, optional): how many ids to query at a time, defaults to DELETE_QUERY_PAGE_SIZE
+
+        Returns:
+            list: the ids of the records
+        """
+        page_size = page_size or DELETE_QUERY_PAGE_SIZE
+        uuids = []
+        while True:
+            query_string = f"""{{
+                {node} (first: {page_size}, offset: {len(uuids)}, order_by_asc: "id", project_id: "{project_id}") {{
+                    id
+                }}
+            }}"""
+            res = self.query(query_string)
+            page = [x["id"] for x in res["data"][node]]
+            uuids.extend(page)
+            if len(page) < page_size:
+                return uuids
+
+    def delete_node(
+        self,
+        program,
+        project,
+        node_name,
+        batch_size=100,
+        verbose=True,
+        max_concurrent_requests=1,
+        max_requests_per_second=None,
+    ):
         """
         Delete all records for a node from a project.
 
@@ -272,6 +467,8 @@ class Gen3Submission:
             node_name (str): Name of the node to delete
             batch_size (int, optional, default: 100): how many records to query and delete at a time
             verbose (bool, optional, default: True): whether to print progress logs
+            max_concurrent_requests (int, optional, default: 1): how many batches to delete at the same time, see delete_nodes
+            max_requests_per_second (float, optional): limit on the number of delete requests started per second
 
         Examples:
             This deletes a node from the CCLE project in the sandbox commons.
@@ -279,21 +476,40 @@ class Gen3Submission:
             >>> Gen3Submission.delete_node("DCF", "CCLE", "demographic")
         """
         return self.delete_nodes(
-            program, project, [node_name], batch_size, verbose=verbose
+            program,
+            project,
+            [node_name],
+            batch_size,
+            verbose=verbose,
+            max_concurrent_requests=max_concurrent_requests,
+            max_requests_per_second=max_requests_per_second,
         )
 
     def delete_nodes(
-        self, program, project, ordered_node_list, batch_size=100, verbose=True
+        self,
+        program,
+        project,
+        ordered_node_list,
+        batch_size=100,
+        verbose=True,
+        max_concurrent_requests=1,
+        max_requests_per_second=None,
     ):
         """
         Delete all records for a list of nodes from a project.
 
+        By default, batches of ids are queried then deleted one at a time. With
+        max_concurrent_requests > 1, all the ids of a node are queried first and
+        their batches are deleted concurrently, see delete_records.
+
         Args:
             program (str): The program to delete from.
             project (str): The project to delete from.
             ordered_node_list (list): The list of nodes to delete, in reverse graph submission order
             batch_size (int, optional, default: 100): how many records to query and delete at a time
             verbose (bool, optional, default: True): whether to print progress logs
+            max_concurrent_requests (int, optional, default: 1): how many batches to delete at the same time
+            max_requests_per_second (float, optional): limit on the number of delete requests started per second
 
         Examples:
             This deletes a list of nodes from the CCLE project in the sandbox commons.
@@ -304,6 +520,28 @@ class Gen3Submission:
         for node in ordered_node_list:
             if verbose:
                 print(node, end="", flush=True)
+            if max_concurrent_requests > 1:
+                previous_uuids = None
+                while True:
+                    uuids = self._get_node_ids(project_id, node)
+                    if len(uuids) == 0:
+                        break  # all done
+                    if uuids == previous_uuids:
+                        raise Exception("Failed to delete. Exiting")
+                    previous_uuids = uuids
+                    if verbose:
+                        print(" ({} records)".format(len(uuids)), end="", flush=True)
+                    self.delete_records(
+                        program,
+                        project,
+                        uuids,
+                        batch_size,
+                        max_concurrent_requests=max_concurrent_requests,
+                        max_requests_per_second=max_requests_per_second,
+                    )
+                if verbose:
+                    print()
+                continue
             first_uuid = ""
             while True:
                 query_string = f"""{{
@@ -398,13 +636,15 @@ class Gen3Submission:
 
     ### Query functions
 
-    def query(self, query_txt, variables=None, max_tries=1):
+    def query(self, query_txt, variables=None, max_tries=1, cache=False):
         """Execute a GraphQL query against a Data Commons.
 
         Args:
             query_txt (str): Query text.
             variables (:obj:`object`, optional): Dictionary of variables to pass with the query.
-            max_tries (:obj:`int`, optional): Number of times to retry if the request fails.
+            max_tries (:obj:`int`, optional): Number of times to try the query if the request fails or returns no data.
+            cache (:obj:`bool`, optional): Whether the response can be served from the cache, for read-only
+                queries such as counts. Only used when the class was created with a `cache_ttl`.
 
         Examples:
             This executes a query to get the list of all the project codes for all the projects
@@ -414,32 +654,64 @@ class Gen3Submission:
             ... Gen3Submission.query(query)
 
         """
-        api_url = "{}/api/v0/submission/graphql".format(self._endpoint)
-        if variables == None:
-            query = {"query": query_txt}
-        else:
-            query = {"query": query_txt, "variables": variables}
-
         tries = 0
-        while tries < max_tries:
-            output = requests.post(api_url, auth=self._auth_provider, json=query).text
-            data = json.loads(output)
+        while True:
+            tries += 1
+            try:
+                data = self._graphql.query(
+                    query_txt,
+                    variables,
+                    # retries skip the cache, which may hold the failed response
+                    cache=cache and tries == 1,
+                    parse=_parse_submission_query_response,
+                )
+            except requests.exceptions.RequestException:
+                if tries >= max_tries:
+                    raise
+                continue
 
-            if "errors" in data:
-                raise Gen3SubmissionQueryError(data["errors"])
+            if "data" in data:
+                return data
+            print(query_txt)
+            print(data)
+            if tries >= max_tries:
+                return data
 
-            if not "data" in data:
-                print(query_txt)
-                print(data)
+    def batch_query(self, queries, variables=None, cache=False):
+        """Execute several GraphQL queries in a single request, by aliasing their fields.
 
-            tries += 1
+        Args:
+            queries (dict): { alias: field selection } of the queries to execute.
+            variables (:obj:`object`, optional): { name: (GraphQL type, value) } of the variables used by any of the queries.
+            cache (:obj:`bool`, optional): See `query`.
+
+        Returns:
+            dict: { alias: data returned for the query }
 
-        return data
+        Examples:
+            This counts the subjects and samples of a project in a single request.
+
+            >>> Gen3Submission.batch_query(
+                    {
+                        "subjects": "_subject_count(project_id: $project_id)",
+                        "samples": "_sample_count(project_id: $project_id)",
+                    },
+                    variables={"project_id": ("String", "DCF-CCLE")},
+                )
+
+        """
+        return self._graphql.batch_query(
+            queries,
+            variables=variables,
+            cache=cache,
+            parse=_parse_submission_query_response,
+        )
 
     def get_graphql_schema(self):
         """Returns the GraphQL schema for a commons.
 
         This runs the GraphQL introspection query against a commons and returns the results.
+        The schema is cached and only downloaded again when it changes.
 
         Examples:
             This returns the GraphQL schema.
@@ -448,9 +720,7 @@ class Gen3Submission:
 
         """
         api_url = "{}/api/v0/submission/getschema".format(self._endpoint)
-        output = requests.get(api_url).text
-        data = json.loads(output)
-        return data
+        return self._graphql.get_json(api_url, cache=True)
 
     ### Dictionary functions
 
@@ -458,6 +728,7 @@ class Gen3Submission:
         """Returns the dictionary schema for a specific node.
 
         This gets the current json dictionary schema for a specific node type in a commons.
+        The schema is cached and only downloaded again when it changes.
 
         Args:
             node_type (str): The node_type (or name of the node) to retrieve.
@@ -471,9 +742,7 @@ class Gen3Submission:
         api_url = "{}/api/v0/submission/_dictionary/{}".format(
             self._endpoint, node_type
         )
-        output = requests.get(api_url).text
-        data = json.loads(output)
-        return data
+        return self._graphql.get_json(api_url, cache=True)
 
     def get_dictionary_all(self):
         """Returns the entire dictionary object for a commons.
@@ -488,6 +757,24 @@ class Gen3Submission:
         """
         return self.get_dictionary_node("_all")
 
+    def get_node_types(self):
+        """Returns the sorted names of the node types in the dictionary of a commons.
+
+        These are the ids the `_node_type` GraphQL query returns, read from the
+        cached dictionary instead.
+
+        Examples:
+            This returns the node types of a commons.
+
+            >>> Gen3Submission.get_node_types()
+
+        """
+        return sorted(
+            node
+            for node, schema in self.get_dictionary_all().items()
+            if not node.startswith("_") and isinstance(schema, dict)
+        )
+
     ### File functions
 
     def get_project_manifest(self, program, project):
@@ -506,14 +793,38 @@ class Gen3Submission:
         output = requests.get(api_url, auth=self._auth_provider)
         return output
 
-    def submit_file(self, project_id, filename, chunk_size=30, row_offset=0):
+    def submit_file(
+        self,
+        project_id,
+        filename,
+        chunk_size=30,
+        row_offset=0,
+        max_concurrent_requests=1,
+        max_chunk_size=None,
+        checkpoint_file=None,
+    ):
         """Submit data in a spreadsheet file containing multiple records in rows to a Gen3 Data Commons.
 
+        CSV and TSV files are streamed, so only the chunks being submitted are held in
+        memory. Up to `max_concurrent_requests` chunks are submitted at the same time.
+        The chunk size adapts to the API: it is halved when a request times out, is too
+        large or takes longer than SUBMISSION_TARGET_LATENCY seconds, and grows back by
+        a quarter of the initial `chunk_size` after every fast request, up to
+        `max_chunk_size` and staying below the last chunk size that was too slow.
+
+        Progress is saved to `checkpoint_file` as the number of leading rows that were
+        submitted, so running the same submission again after an interruption resumes
+        where it stopped. The checkpoint is ignored if the file's size or modification
+        time changed since it was saved, and removed once the whole file is submitted.
+
         Args:
             project_id (str): The project_id to submit to.
             filename (str): The file containing data to submit. The format can be TSV, CSV or XLSX (first worksheet only for now).
             chunk_size (integer): The number of rows of data to submit for each request to the API.
             row_offset (integer): The number of rows of data to skip; '0' starts submission from the first row and submits all data.
+            max_concurrent_requests (integer): The number of chunks to submit at the same time.
+            max_chunk_size (integer): The largest chunk size to grow to, defaults to `chunk_size`.
+            checkpoint_file (str): The file to save progress to, defaults to `<filename>.checkpoint`.
 
         Examples:
             This submits a spreadsheet file containing multiple records in rows to the CCLE project in the sandbox commons.
@@ -521,41 +832,35 @@ class Gen3Submission:
             >>> Gen3Submission.submit_file("DCF-CCLE","data_spreadsheet.tsv")
 
         """
-        # Read the file in as a pandas DataFrame
-        f = os.path.basename(filename)
-        if f.lower().endswith(".csv"):
-            df = pd.read_csv(filename, header=0, sep=",", dtype=str).fillna("")
-        elif f.lower().endswith(".xlsx"):
-            xl = pd.ExcelFile(filename)  # load excel file
-            sheet = xl.sheet_names[0]  # sheetname
-            df = xl.parse(sheet)  # save sheet as dataframe
-            converters = {
-                col: str for col in list(df)
-            }  # make sure int isn't converted to float
-            df = pd.read_excel(filename, converters=converters).fillna("")  # remove nan
-        elif filename.lower().endswith((".tsv", ".txt")):
-            df = pd.read_csv(filename, header=0, sep="\t", dtype=str).fillna("")
-        else:
-            raise Gen3UserError("Please upload a file in CSV, TSV, or XLSX format.")
-        df.rename(
-            columns={c: c.lstrip("*") for c in df.columns}, inplace=True
-        )  # remove any leading asterisks in the DataFrame column names
+        # Check uniqueness of submitter_ids and count the rows without loading the file
+        total = _check_submission_file(filename)
 
-        # Check uniqueness of submitter_ids:
-        if len(list(df.submitter_id)) != len(list(df.submitter_id.unique())):
-            raise Gen3Error(
-                "Warning: file contains duplicate submitter_ids. \nNote: submitter_ids must be unique within a node!"
+        checkpoint_file = checkpoint_file or "{}.checkpoint".format(filename)
+        checkpoint_offset = _read_submission_checkpoint(
+            checkpoint_file, project_id, filename
+        )
+        if checkpoint_offset > row_offset:
+            print(
+                "Resuming submission of {} from row {} (checkpoint: {})".format(
+                    filename, checkpoint_offset, checkpoint_file
+                )
             )
+            row_offset = checkpoint_offset
 
-        # Chunk the file
-        print("\nSubmitting {} with {} records.".format(filename, len(df)))
+        print("\nSubmitting {} with {} records.".format(filename, total))
         program, project = project_id.split("-", 1)
         api_url = "{}/api/v0/submission/{}/{}".format(self._endpoint, program, project)
         headers = {"content-type": "text/tab-separated-values"}
 
-        start = row_offset
-        end = row_offset + chunk_size
-        chunk = df[start:end]
+        rows = _iter_submission_file(filename)
+        columns = next(rows)
+        submitter_id_column = columns.index("submitter_id")
+        rows = itertools.islice(enumerate(rows), row_offset, None)
+
+        max_chunk_size = max(max_chunk_size or chunk_size, chunk_size)
+        # grow additively in small steps, and never back to a size that was too slow
+        chunk_size_step = max(chunk_size // 4, 1)
+        slow_chunk_size = None
 
         count = 0
 
@@ -567,148 +872,569 @@ class Gen3Submission:
             "responses": [],  # list of API response codes
         }
 
-        # Start the chunking loop:
-        while (start + len(chunk)) <= len(df):
-            timeout = False
-            valid_but_failed = []
-            invalid = []
-            count += 1
-            print(
-                "Chunk {} (chunk size: {}, submitted: {} of {})".format(
-                    count,
-                    chunk_size,
-                    len(results["succeeded"]) + len(results["invalid"]),
-                    len(df),
-                )
-            )
-
+        def _put_chunk(chunk):
+            data = io.StringIO()
+            writer = csv.writer(data, delimiter="\t", lineterminator="\n")
+            writer.writerow(columns)
+            writer.writerows(row for _, row in chunk.rows)
+            start_time = time.perf_counter()
             try:
                 response = requests.put(
                     api_url,
                     auth=self._auth_provider,
-                    data=chunk.to_csv(sep="\t", index=False),
+                    data=data.getvalue(),
                     headers=headers,
-                ).text
+                )
             except requests.exceptions.ConnectionError as e:
-                results["details"].append(e.message)
-                continue
-
-            # Handle the API response
-            if (
-                "Request Timeout" in response
-                or "413 Request Entity Too Large" in response
-                or "Connection aborted." in response
-                or "service failure - try again later" in response
-            ):  # time-out, response is not valid JSON at the moment
-                print("\t Reducing Chunk Size: {}".format(response))
-                results["responses"].append("Reducing Chunk Size: {}".format(response))
-                timeout = True
-
-            else:
-                try:
-                    json_res = json.loads(response)
-                except ValueError as e:
-                    print(response)
-                    print(str(e))
-                    raise Gen3Error("Unable to parse API response as JSON!")
-
-                if "message" in json_res and "code" not in json_res:
+                return None, str(e), time.perf_counter() - start_time
+            return response.status_code, response.text, time.perf_counter() - start_time
+
+        # chunks to submit before reading more rows: retries of failed chunks
+        retries = collections.deque()
+        in_flight = {}
+        # first row of every submitted range that isn't part of the checkpoint yet
+        completed = {}
+        with ThreadPoolExecutor(max_workers=max_concurrent_requests) as executor:
+            while True:
+                while len(in_flight) < max_concurrent_requests:
+                    if retries:
+                        chunk = retries.popleft()
+                    else:
+                        chunk_rows = list(itertools.islice(rows, chunk_size))
+                        if not chunk_rows:
+                            break
+                        chunk = _SubmissionChunk(
+                            chunk_rows[0][0], chunk_rows[-1][0] + 1, chunk_rows
+                        )
+                    count += 1
                     print(
-                        "\t No code in the API response for Chunk {}: {}".format(
-                            count, json_res.get("message")
+                        "Chunk {} (chunk size: {}, submitted: {} of {})".format(
+                            count,
+                            len(chunk.rows),
+                            len(results["succeeded"]) + len(results["invalid"]),
+                            total,
                         )
                     )
-                    print("\t {}".format(json_res.get("transactional_errors")))
-                    results["responses"].append(
-                        "Error Chunk {}: {}".format(count, json_res.get("message"))
+                    in_flight[executor.submit(_put_chunk, chunk)] = (
+                        chunk,
+                        chunk_size,
+                        count,
                     )
-                    results["other"].append(json_res.get("transactional_errors"))
 
-                elif "code" not in json_res:
-                    print("\t Unhandled API-response: {}".format(response))
-                    results["responses"].append(
-                        "Unhandled API response: {}".format(response)
-                    )
+                if not in_flight:
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    chunk, sent_chunk_size, chunk_count = in_flight.pop(future)
+                    status_code, response, latency = future.result()
+
+                    if status_code is None:
+                        results["details"].append(response)
+                    if (
+                        status_code is None
+                        or status_code in SUBMISSION_RETRY_STATUS_CODES
+                        or any(
+                            message in response for message in SUBMISSION_RETRY_MESSAGES
+                        )
+                    ):  # time-out, response is not valid JSON at the moment
+                        print("\t Reducing Chunk Size: {}".format(response))
+                        results["responses"].append(
+                            "Reducing Chunk Size: {}".format(response)
+                        )
+                        if len(chunk.rows) < 2:
+                            print("Last chunk:\n{}".format(chunk.rows))
+                            raise Gen3Error(
+                                "Submission is timing out. Please contact the Helpdesk."
+                            )
+                        # only reduce once for all the chunks sent at the same size
+                        if sent_chunk_size >= chunk_size:
+                            slow_chunk_size = sent_chunk_size
+                            chunk_size = max(int(chunk_size / 2), 1)
+                        retries.extendleft(
+                            reversed(
+                                chunk.split(min(chunk_size, (len(chunk.rows) + 1) // 2))
+                            )
+                        )
+                        print(
+                            "Retrying Chunk with reduced chunk_size: {}".format(
+                                chunk_size
+                            )
+                        )
+                        continue
 
-                elif json_res["code"] == 200:  # success
-                    entities = json_res.get("entities", [])
-                    print("\t Succeeded: {} entities.".format(len(entities)))
-                    results["responses"].append(
-                        "Chunk {} Succeeded: {} entities.".format(count, len(entities))
+                    valid_but_failed, invalid = self._handle_submission_response(
+                        response, chunk_count, results
                     )
+                    if (
+                        len(valid_but_failed) > 0 and len(invalid) > 0
+                    ):  # if valid entities failed bc grouped with invalid, retry submission
+                        valid_but_failed = set(valid_but_failed)
+                        # these are records that weren't successful because they were part of a chunk that failed, but are valid and can be resubmitted without changes
+                        retries.appendleft(
+                            _SubmissionChunk(
+                                chunk.start,
+                                chunk.end,
+                                [
+                                    row
+                                    for row in chunk.rows
+                                    if row[1][submitter_id_column] in valid_but_failed
+                                ],
+                            )
+                        )
+                        print(
+                            "Retrying submission of valid entities from failed chunk: {} valid entities.".format(
+                                len(valid_but_failed)
+                            )
+                        )
+                        continue
 
-                    for entity in entities:
-                        sid = entity["unique_keys"][0]["submitter_id"]
-                        results["succeeded"].append(sid)
+                    elif (
+                        len(valid_but_failed) > 0 and len(invalid) == 0
+                    ):  # if all entities are valid but submission still failed, probably due to duplicate submitter_ids. Can remove this section once the API response is fixed: https://ctds-planx.atlassian.net/browse/PXP-3065
+                        raise Gen3Error(
+                            "Please check your data for correct file encoding, special characters, or duplicate submitter_ids or ids."
+                        )
 
-                elif json_res["code"] == 500:  # internal server error
-                    print("\t Internal Server Error: {}".format(response))
-                    results["responses"].append(
-                        "Internal Server Error: {}".format(response)
+                    if latency > SUBMISSION_TARGET_LATENCY:
+                        if sent_chunk_size >= chunk_size and chunk_size >= 2:
+                            slow_chunk_size = sent_chunk_size
+                            chunk_size = int(chunk_size / 2)
+                            print(
+                                "\t Reducing Chunk Size to {} after a {:.0f}s request".format(
+                                    chunk_size, latency
+                                )
+                            )
+                    else:
+                        chunk_size_limit = max_chunk_size
+                        if slow_chunk_size is not None:
+                            chunk_size_limit = min(
+                                chunk_size_limit, slow_chunk_size - 1
+                            )
+                        if chunk_size < chunk_size_limit:
+                            chunk_size = min(
+                                chunk_size + chunk_size_step, chunk_size_limit
+                            )
+
+                    # save the number of leading rows that are all submitted
+                    completed[chunk.start] = chunk.end
+                    if row_offset in completed:
+                        while row_offset in completed:
+                            row_offset = completed.pop(row_offset)
+                        _write_submission_checkpoint(
+                            checkpoint_file, project_id, filename, row_offset
+                        )
+
+        if os.path.exists(checkpoint_file):
+            os.remove(checkpoint_file)
+
+        print("Finished data submission.")
+        print("Successful records: {}".format(len(set(results["succeeded"]))))
+        print("Failed invalid records: {}".format(len(results["invalid"])))
+
+        return results
+
+    def submit_directory(
+        self, project_id, directory, max_concurrent_files=4, **submit_file_kwargs
+    ):
+        """Submit every node file in a directory, in an order derived from the dictionary.
+
+        The node of each CSV, TSV or XLSX file is the `type` of its first row, or the
+        file name without its extension. Using the links in the dictionary, the nodes
+        are grouped into levels where every node only links to nodes in earlier levels
+        (or to nodes that aren't in the directory, which must already exist). Up to
+        `max_concurrent_files` files of the same level are submitted at the same time.
+        A file isn't submitted if a node it links to failed to submit.
+
+        Args:
+            project_id (str): The project_id to submit to.
+            directory (str): The directory containing one data file per node.
+            max_concurrent_files (integer): The number of files to submit at the same time.
+            **submit_file_kwargs: Passed to `submit_file` for every file, eg. chunk_size.
+
+        Returns:
+            dict: the combined report, with
+                "levels": the nodes submitted at the same time, in submission order
+                "nodes": the `submit_file` results of every submitted node
+                "succeeded": the number of records successfully submitted
+                "invalid": the number of invalid records
+                "failed": the error of every node whose submission raised
+                "skipped": the nodes that weren't submitted because a node they link to failed
+
+        Examples:
+            This submits all the node files in a directory to the CCLE project in the sandbox commons.
+
+            >>> Gen3Submission.submit_directory("DCF-CCLE", "./CCLE_nodes")
+
+        """
+        filename_by_node = {}
+        for name in sorted(os.listdir(directory)):
+            filename = os.path.join(directory, name)
+            if not name.lower().endswith(SUBMISSION_FILE_EXTENSIONS):
+                continue
+            node = _get_submission_file_node(filename)
+            if node in filename_by_node:
+                raise Gen3UserError(
+                    "Both {} and {} contain {} records.".format(
+                        filename_by_node[node], filename, node
                     )
+                )
+            filename_by_node[node] = filename
 
-                else:  # failure (400, 401, 403, 404...)
-                    entities = json_res.get("entities", [])
-                    print(
-                        "\tChunk Failed (status code {}): {} entities.".format(
-                            json_res.get("code"), len(entities)
+        dictionary = self.get_dictionary_all()
+        levels = _get_submission_levels(dictionary, filename_by_node)
+        print(
+            "\nSubmitting {} nodes in {} levels: {}".format(
+                len(filename_by_node), len(levels), levels
+            )
+        )
+
+        report = {
+            "levels": levels,
+            "nodes": {},
+            "succeeded": 0,
+            "invalid": 0,
+            "failed": {},
+            "skipped": [],
+        }
+        with ThreadPoolExecutor(max_workers=max_concurrent_files) as executor:
+            for level in levels:
+                futures = {}
+                for node in level:
+                    failed_links = [
+                        link
+                        for link in _get_node_links(dictionary[node])
+                        if link in report["failed"] or link in report["skipped"]
+                    ]
+                    if failed_links:
+                        print(
+                            "Skipping {} because {} failed to submit".format(
+                                node, failed_links
+                            )
                         )
+                        report["skipped"].append(node)
+                        continue
+                    futures[node] = executor.submit(
+                        self.submit_file,
+                        project_id,
+                        filename_by_node[node],
+                        **submit_file_kwargs,
                     )
-                    results["responses"].append(
-                        "Chunk {} Failed: {} entities.".format(count, len(entities))
-                    )
+                for node, future in futures.items():
+                    try:
+                        results = future.result()
+                    except Exception as e:
+                        logging.error("Failed to submit {}: {}".format(node, e))
+                        report["failed"][node] = str(e)
+                        continue
+                    report["nodes"][node] = results
+                    report["succeeded"] += len(set(results["succeeded"]))
+                    report["invalid"] += len(results["invalid"])
+
+        print("Finished submitting {}.".format(directory))
+        print("Successful records: {}".format(report["succeeded"]))
+        print("Failed invalid records: {}".format(report["invalid"]))
+        if report["failed"]:
+            print("Failed nodes: {}".format(list(report["failed"])))
+        if report["skipped"]:
+            print("Skipped nodes: {}".format(report["skipped"]))
+
+        return report
+
+    def _handle_submission_response(self, response, count, results):
+        """Record the outcome of a chunk submitted by `submit_file` in `results`.
 
-                    for entity in entities:
-                        sid = entity["unique_keys"][0]["submitter_id"]
-                        if entity["valid"]:  # valid but failed
-                            valid_but_failed.append(sid)
-                        else:  # invalid and failed
-                            message = str(entity["errors"])
-                            results["invalid"][sid] = message
-                            invalid.append(sid)
-                    print("\tInvalid records in this chunk: {}".format(len(invalid)))
-
-            if (
-                len(valid_but_failed) > 0 and len(invalid) > 0
-            ):  # if valid entities failed bc grouped with invalid, retry submission
-                chunk = chunk.loc[
-                    df["submitter_id"].isin(valid_but_failed)
-                ]  # these are records that weren't successful because they were part of a chunk that failed, but are valid and can be resubmitted without changes
-                print(
-                    "Retrying submission of valid entities from failed chunk: {} valid entities.".format(
-                        len(chunk)
-                    )
+        Args:
+            response (str): The text of the API response.
+            count (integer): The chunk number, for logging.
+            results (dict): The `submit_file` results to update.
+
+        Returns:
+            tuple(list, list): submitter_ids of the valid records that failed because
+            they were submitted with invalid records, and of the invalid records
+        """
+        valid_but_failed = []
+        invalid = []
+        try:
+            json_res = json.loads(response)
+        except ValueError as e:
+            print(response)
+            print(str(e))
+            raise Gen3Error("Unable to parse API response as JSON!")
+
+        if "message" in json_res and "code" not in json_res:
+            print(
+                "\t No code in the API response for Chunk {}: {}".format(
+                    count, json_res.get("message")
                 )
+            )
+            print("\t {}".format(json_res.get("transactional_errors")))
+            results["responses"].append(
+                "Error Chunk {}: {}".format(count, json_res.get("message"))
+            )
+            results["other"].append(json_res.get("transactional_errors"))
+
+        elif "code" not in json_res:
+            print("\t Unhandled API-response: {}".format(response))
+            results["responses"].append("Unhandled API response: {}".format(response))
+
+        elif json_res["code"] == 200:  # success
+            entities = json_res.get("entities", [])
+            print("\t Succeeded: {} entities.".format(len(entities)))
+            results["responses"].append(
+                "Chunk {} Succeeded: {} entities.".format(count, len(entities))
+            )
+
+            for entity in entities:
+                sid = entity["unique_keys"][0]["submitter_id"]
+                results["succeeded"].append(sid)
+
+        elif json_res["code"] == 500:  # internal server error
+            print("\t Internal Server Error: {}".format(response))
+            results["responses"].append("Internal Server Error: {}".format(response))
 
-            elif (
-                len(valid_but_failed) > 0 and len(invalid) == 0
-            ):  # if all entities are valid but submission still failed, probably due to duplicate submitter_ids. Can remove this section once the API response is fixed: https://ctds-planx.atlassian.net/browse/PXP-3065
-                raise Gen3Error(
-                    "Please check your data for correct file encoding, special characters, or duplicate submitter_ids or ids."
+        else:  # failure (400, 401, 403, 404...)
+            entities = json_res.get("entities", [])
+            print(
+                "\tChunk Failed (status code {}): {} entities.".format(
+                    json_res.get("code"), len(entities)
                 )
+            )
+            results["responses"].append(
+                "Chunk {} Failed: {} entities.".format(count, len(entities))
+            )
 
-            elif timeout is False:  # get new chunk if didn't timeout
-                start += chunk_size
-                end = start + chunk_size
-                chunk = df[start:end]
+            for entity in entities:
+                sid = entity["unique_keys"][0]["submitter_id"]
+                if entity["valid"]:  # valid but failed
+                    valid_but_failed.append(sid)
+                else:  # invalid and failed
+                    message = str(entity["errors"])
+                    results["invalid"][sid] = message
+                    invalid.append(sid)
+            print("\tInvalid records in this chunk: {}".format(len(invalid)))
 
-            else:  # if timeout, reduce chunk size and retry smaller chunk
-                if chunk_size >= 2:
-                    chunk_size = int(chunk_size / 2)
-                    end = start + chunk_size
-                    chunk = df[start:end]
-                    print(
-                        "Retrying Chunk with reduced chunk_size: {}".format(chunk_size)
-                    )
-                    timeout = False
-                else:
-                    print("Last chunk:\n{}".format(chunk))
-                    raise Gen3Error(
-                        "Submission is timing out. Please contact the Helpdesk."
-                    )
+        return valid_but_failed, invalid
 
-        print("Finished data submission.")
-        print("Successful records: {}".format(len(set(results["succeeded"]))))
-        print("Failed invalid records: {}".format(len(results["invalid"])))
 
-        return results
+def _parse_submission_query_response(response):
+    """Parse the JSON response of a submission GraphQL query and raise its errors."""
+    data = json.loads(response.text)
+    if "errors" in data:
+        raise Gen3SubmissionQueryError(data["errors"])
+    return data
+
+
+class _SubmissionChunk:
+    """Rows of a submission file submitted in one request.
+
+    Args:
+        start (int): index of the first data row of the file this chunk covers
+        end (int): index after the last data row of the file this chunk covers
+        rows (list): (row index, row values) pairs, a retry may leave out some of
+            the rows between start and end
+    """
+
+    __slots__ = ("start", "end", "rows")
+
+    def __init__(self, start, end, rows):
+        self.start = start
+        self.end = end
+        self.rows = rows
+
+    def split(self, size):
+        """Split into chunks of `size` rows that together cover start to end."""
+        size = max(size, 1)
+        pieces = [self.rows[i : i + size] for i in range(0, len(self.rows), size)]
+        starts = [self.start] + [piece[0][0] for piece in pieces[1:]]
+        ends = starts[1:] + [self.end]
+        return [
+            _SubmissionChunk(start, end, piece)
+            for start, end, piece in zip(starts, ends, pieces)
+        ]
+
+
+def _iter_submission_file(filename):
+    """Yield the column names then the values of every row of a submission file.
+
+    CSV and TSV files are read one row at a time. Leading asterisks are removed
+    from the column names and short rows are padded with empty values.
+
+    Args:
+        filename (str): a CSV, TSV or XLSX (first worksheet only) file
+
+    Raises:
+        Gen3UserError: the file isn't CSV, TSV or XLSX
+    """
+    f = os.path.basename(filename).lower()
+    if f.endswith(".xlsx"):
+        xl = pd.ExcelFile(filename)  # load excel file
+        sheet = xl.sheet_names[0]  # sheetname
+        df = xl.parse(sheet)  # save sheet as dataframe
+        converters = {
+            col: str for col in list(df)
+        }  # make sure int isn't converted to float
+        df = pd.read_excel(filename, converters=converters).fillna("")  # remove nan
+        yield [str(c).lstrip("*") for c in df.columns]
+        yield from df.values.tolist()
+        return
+
+    if f.endswith(".csv"):
+        delimiter = ","
+    elif f.endswith((".tsv", ".txt")):
+        delimiter = "\t"
+    else:
+        raise Gen3UserError("Please upload a file in CSV, TSV, or XLSX format.")
+
+    with open(filename, newline="", encoding="utf-8-sig") as submission_file:
+        reader = csv.reader(submission_file, delimiter=delimiter)
+        columns = [c.lstrip("*") for c in next(reader, [])]
+        yield columns
+        for row in reader:
+            if not any(row):
+                continue  # skip blank lines
+            if len(row) < len(columns):
+                row += [""] * (len(columns) - len(row))
+            yield row
+
+
+def _check_submission_file(filename):
+    """Check that every row of a submission file has a unique submitter_id.
+
+    Args:
+        filename (str): a CSV, TSV or XLSX (first worksheet only) file
+
+    Returns:
+        int: the number of rows in the file
+
+    Raises:
+        Gen3UserError: the file has no submitter_id column
+        Gen3Error: the file has duplicate submitter_ids
+    """
+    rows = _iter_submission_file(filename)
+    columns = next(rows)
+    if "submitter_id" not in columns:
+        raise Gen3UserError("{} has no submitter_id column.".format(filename))
+    submitter_id_column = columns.index("submitter_id")
+
+    submitter_ids = set()
+    total = 0
+    for total, row in enumerate(rows, 1):
+        submitter_ids.add(row[submitter_id_column])
+        if len(submitter_ids) != total:
+            raise Gen3Error(
+                "Warning: file contains duplicate submitter_ids. \nNote: submitter_ids must be unique within a node!"
+            )
+    return total
+
+
+def _get_submission_file_node(filename):
+    """Return the node of a submission file: the type of its first row, or the
+    file name without its extension if it has no type column or no rows.
+    """
+    rows = _iter_submission_file(filename)
+    columns = next(rows)
+    first_row = next(rows, None)
+    if "type" in columns and first_row and first_row[columns.index("type")]:
+        return first_row[columns.index("type")]
+    return os.path.splitext(os.path.basename(filename))[0]
+
+
+def _get_node_links(schema):
+    """Yield the target node of every link of a dictionary node schema."""
+    for link in schema.get("links", []):
+        if "subgroup" in link:
+            for sublink in link["subgroup"]:
+                yield sublink["target_type"]
+        else:
+            yield link["target_type"]
+
+
+def _get_submission_levels(dictionary, nodes):
+    """Group nodes into levels where each node only links to nodes in earlier levels.
+
+    Links to nodes that aren't in `nodes` are ignored, they have to be submitted
+    already.
+
+    Args:
+        dictionary (dict): the dictionary returned by `get_dictionary_all`
+        nodes (iterable): the nodes to submit
+
+    Returns:
+        list(list(str)): the nodes of every level, sorted, in submission order
+
+    Raises:
+        Gen3UserError: a node isn't in the dictionary or the nodes link in a cycle
+    """
+    dependencies = {}
+    for node in nodes:
+        if node not in dictionary:
+            raise Gen3UserError("Node {} is not in the dictionary.".format(node))
+        dependencies[node] = {
+            link
+            for link in _get_node_links(dictionary[node])
+            if link in nodes and link != node
+        }
+
+    levels = []
+    submitted = set()
+    while dependencies:
+        level = sorted(
+            node for node, links in dependencies.items() if links <= submitted
+        )
+        if not level:
+            raise Gen3UserError(
+                "Nodes {} link to each other in a cycle.".format(sorted(dependencies))
+            )
+        for node in level:
+            del dependencies[node]
+        submitted.update(level)
+        levels.append(level)
+    return levels
+
+
+def _get_submission_file_version(filename):
+    """Return the size and modification time of filename, which change when it is edited."""
+    stat = os.stat(filename)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _read_submission_checkpoint(checkpoint_file, project_id, filename):
+    """Return the number of rows already submitted to project_id according to the
+    checkpoint file, or 0 if there is no checkpoint for the project or filename
+    changed since the checkpoint was saved.
+    """
+    try:
+        with open(checkpoint_file) as f:
+            checkpoint = json.load(f)
+    except FileNotFoundError:
+        return 0
+    except ValueError:
+        logging.warning("Ignoring unreadable checkpoint {}".format(checkpoint_file))
+        return 0
+    if checkpoint.get("project_id") != project_id:
+        return 0
+    if checkpoint.get("file_version") != _get_submission_file_version(filename):
+        logging.warning(
+            "Ignoring checkpoint {}, {} changed since it was saved".format(
+                checkpoint_file, filename
+            )
+        )
+        return 0
+    return checkpoint.get("row_offset", 0)
+
+
+def _write_submission_checkpoint(checkpoint_file, project_id, filename, row_offset):
+    """Atomically save the number of leading rows of filename submitted to project_id."""
+    tmp_file = "{}.tmp".format(checkpoint_file)
+    with open(tmp_file, "w") as f:
+        json.dump(
+            {
+                "project_id": project_id,
+                "filename": filename,
+                "file_version": _get_submission_file_version(filename),
+                "row_offset": row_offset,
+            },
+            f,
+        )
+    os.replace(tmp_file, checkpoint_file)
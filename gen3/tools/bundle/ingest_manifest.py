@@ -1,6 +1,7 @@
 import csv
 import json
 from cdislogging import get_logger
+from multiprocessing.dummy import Pool as ThreadPool
 import os
 import time
 import sys
@@ -258,6 +259,73 @@ def _write_csv(records, filename="tests/outputs/output_manifest.csv"):
     return filename
 
 
+def _get_bundle_levels(records):
+    """
+    Group the bundles into levels of the bundle DAG so that every bundle only
+    references bundles in earlier levels. Bundles in the same level don't depend
+    on each other and can be created concurrently.
+
+    _verify_and_process_bundle_manifest only accepts references to bundles in
+    earlier rows, so a single pass in manifest order is enough.
+
+    Args:
+        records(list): verified records from _verify_and_process_bundle_manifest
+
+    Returns:
+        list(list(tuple(int, dict))): levels of (manifest position, record), in
+            manifest order within a level
+    """
+    names = {record["name"] for record in records}
+    level_by_name = {}
+    levels = []
+    for position, record in enumerate(records, 1):
+        level = 0
+        for item in record.get("bundles", []):
+            if item not in names:
+                # a GUID of an existing object or bundle
+                continue
+            if item not in level_by_name:
+                raise ValueError(
+                    "Bundle {} references bundle {} before it is defined".format(
+                        record["name"], item
+                    )
+                )
+            level = max(level, level_by_name[item] + 1)
+        level_by_name[record["name"]] = level
+        if level == len(levels):
+            levels.append([])
+        levels[level].append((position, record))
+    return levels
+
+
+def _create_bundle(drsclient, record, bundle_name_to_guid):
+    """
+    Post a single bundle to indexd, replacing the bundle names it references
+    with their guids, and record the guid indexd assigned to it.
+    """
+    bundle_name = record["name"]
+    # Check the bundle list to make sure they're all guids
+    record["bundles"] = _replace_bundle_name_with_guid(
+        record["bundles"], bundle_name_to_guid
+    )
+    resp = drsclient.create(**record)
+
+    if resp.status_code != 200:
+        logging.error(
+            "Failed to create bundle {}. Status code: {} Detail: {}".format(
+                bundle_name, resp.status_code, resp.text
+            )
+        )
+    else:
+        rec = resp.json()
+        guid = rec["bundle_id"]
+        logging.info("Successfully created bundle {}".format(bundle_name))
+        # Associate bundle_name to its guid created by indexd
+        bundle_name_to_guid[bundle_name] = guid
+        if "guid" not in record:
+            record["guid"] = guid
+
+
 def ingest_bundle_manifest(
     commons_url,
     manifest_file,
@@ -265,7 +333,29 @@ def ingest_bundle_manifest(
     manifest_file_delimiter=None,
     auth=None,
     token=None,
+    thread_num=1,
 ):
+    """
+    Create the bundles in a bundle manifest in indexd.
+
+    With thread_num > 1 the bundles are grouped into levels of the bundle DAG
+    and every level is created concurrently by up to thread_num threads, once
+    all the bundles it references exist.
+
+    Args:
+        commons_url(str): root domain for commons where indexd lives
+        manifest_file(str): the path to the input manifest
+        out_manifest_file(str): unused, the output manifest is written to
+            tests/outputs/output_manifest.csv
+        manifest_file_delimiter(str): delimiter, inferred from the file extension
+            by default
+        auth(Gen3Auth): Gen3 auth or tuple with basic auth name and password
+        token(str): access token
+        thread_num(int): number of threads creating bundles at the same time
+
+    Returns:
+        records(list): the ingested records, None if the manifest is invalid
+    """
     logging.info("Starting the process ....")
     start_time = time.perf_counter()
     logging.info("start time: {}".format(start_time))
@@ -294,31 +384,31 @@ def ingest_bundle_manifest(
 
     drsclient = DrsClient(commons_url, auth=auth, token=token)
     total = len(records)
-    # Iterate through the records list and post to indexd
-    for start, record in enumerate(records, 1):
-        bundle_name = record["name"]
-
-        logging.info("Posting bundle {} of {}".format(start, total))
-        # Check the bundle list to make sure they're all guids
-        record["bundles"] = _replace_bundle_name_with_guid(
-            record["bundles"], bundle_name_to_guid
-        )
-        resp = drsclient.create(**record)
 
-        if resp.status_code != 200:
-            logging.error(
-                "Failed to create bundle {}. Status code: {} Detail: {}".format(
-                    bundle_name, resp.status_code, resp.text
-                )
+    def _post_bundle(position_and_record):
+        position, record = position_and_record
+        logging.info("Posting bundle {} of {}".format(position, total))
+        _create_bundle(drsclient, record, bundle_name_to_guid)
+
+    if thread_num > 1:
+        levels = _get_bundle_levels(records)
+        logging.info(
+            "Posting {} bundles in {} levels with {} threads".format(
+                total, len(levels), thread_num
             )
-        else:
-            rec = resp.json()
-            guid = rec["bundle_id"]
-            logging.info("Successfully created bundle {}".format(bundle_name))
-            # Associate bundle_name to its guid created by indexd
-            bundle_name_to_guid[bundle_name] = guid
-            if "guid" not in record:
-                record["guid"] = guid
+        )
+        pool = ThreadPool(thread_num)
+        try:
+            for level in levels:
+                # a level only references bundles created in earlier levels
+                pool.map(_post_bundle, level)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        # Iterate through the records list and post to indexd
+        for position_and_record in enumerate(records, 1):
+            _post_bundle(position_and_record)
 
     logging.info("Published all {} bundles".format(total))
     logging.info("Start writng output manifest . . .")
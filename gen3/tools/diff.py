@@ -4,15 +4,24 @@ Takes the differential between the matching columns of two manifests
 TODO: Able to handle situations where only specific columns should be compared
 """
 
+import ast
+import hashlib
+import json
 import os
-import csv
 import sys
+import tempfile
 import traceback
+import zlib
 
 from cdislogging import get_logger
 
+from gen3.tools.utils import ManifestReader, ManifestWriter
+
 logging = get_logger("__name__")
 
+# number of spill files per manifest for the hash join in stream_manifest_diff
+DEFAULT_NUM_PARTITIONS = 16
+
 
 def manifest_diff(
     directory=".",
@@ -107,21 +116,12 @@ def _precheck_manifests(
     if not len(files) == 2:
         raise Exception("Must take difference of two files, check dir for hidden files")
 
-    tsv_files = [file_name for file_name in files if ".tsv" in file_name.lower()]
-    csv_files = [file_name for file_name in files if ".csv" in file_name.lower()]
-    if len(tsv_files) == len(files):
-        file_delimiter = "\t"
-    elif len(csv_files) == len(files):
-        file_delimiter = ","
-    else:
-        raise ValueError("Not all files have the same extension type")
+    _check_files_format(files)
 
     headers = []
     manifest_content = []
     for manifest in files:
-        with open(manifest, "r", encoding="utf-8-sig") as csvfile:
-            csv_reader = csv.DictReader(csvfile, delimiter=file_delimiter)
-
+        with ManifestReader(manifest) as csv_reader:
             field_names = csv_reader.fieldnames
             logging.debug(f"Field names from {manifest}: {field_names}")
             headers.append(field_names)
@@ -136,7 +136,7 @@ def _precheck_manifests(
             for row in csv_reader:
                 for column in row:
                     if column == "acl":
-                        row[column] = str(sorted(eval(row[column])))
+                        row[column] = _normalize_acl(row[column])
                 content[row[key_column]] = row
 
             manifest_content.append(content)
@@ -147,6 +147,278 @@ def _precheck_manifests(
     }
 
 
+def stream_manifest_diff(
+    files,
+    key_column="id",
+    allow_additional_columns=False,
+    output_manifest_file_delimiter=None,
+    output_manifest="diff-manifest.tsv",
+    presorted=False,
+    num_partitions=DEFAULT_NUM_PARTITIONS,
+    spill_directory=None,
+):
+    """
+    Diff an old and a new manifest on key_column without loading either into
+    memory, writing every added, removed and changed row.
+
+    By default this is a hash join: both manifests are partitioned by key into
+    spill files on disk, then one partition at a time, the old rows are reduced
+    to a 16-byte digest per key and the new rows are streamed past them. Old rows
+    are only read back from disk if they changed or were removed.
+
+    If both manifests are already sorted by key_column, presorted=True
+    merge-joins them in a single pass instead, with no spill files.
+
+    Keys should be unique in each manifest. If a key appears more than once in
+    a manifest, a warning is logged for every duplicate row and only the first
+    row for that key is compared.
+
+    The output has a "diff" column ("added", "removed" or "changed"), a
+    "changes" column with JSON of {column: {"old": ..., "new": ...}} for changed
+    rows, then the columns shared by both manifests. Added and changed rows have
+    the new values, removed rows have the old values.
+
+    Args:
+        files(list[str]): paths of the old and new manifests, in that order
+        key_column(str): column of unique identifier in manifest
+        allow_additional_columns(bool): allow manifests to have different
+            columns, only shared columns are compared
+        output_manifest_file_delimiter(str): delimiter for the output manifest,
+            determined from the output_manifest extension if not provided
+        output_manifest(str): the file to write the diff to
+        presorted(bool): both manifests are sorted by key_column
+        num_partitions(int): number of spill files per manifest for the hash join.
+            more partitions means less memory used at a time
+        spill_directory(str): where to create the spill files, defaults to the
+            system temp directory
+
+    Returns:
+        dict: number of "added", "removed", "changed" and "unchanged" rows
+    """
+    if not len(files) == 2:
+        raise Exception("Must take difference of two files")
+
+    _check_files_format(files)
+    counts = {"added": 0, "removed": 0, "changed": 0, "unchanged": 0}
+
+    old_manifest, new_manifest = files
+    with ManifestReader(old_manifest) as old_reader, ManifestReader(
+        new_manifest
+    ) as new_reader:
+        old_headers = old_reader.fieldnames
+        new_headers = new_reader.fieldnames
+
+        if not allow_additional_columns and old_headers != new_headers:
+            raise Exception(
+                f"Headers are not the same among manifests. {set(new_headers) ^ set(old_headers)}"
+            )
+        headers = [header for header in old_headers if header in new_headers]
+        if key_column not in headers:
+            raise ValueError(f"key column {key_column} is not in both manifests")
+        key_index = headers.index(key_column)
+
+        with ManifestWriter(
+            output_manifest,
+            ["diff", "changes"] + headers,
+            output_manifest_file_delimiter,
+        ) as output_writer:
+            output_writer.writeheader()
+
+            def _write_diff(diff, row, old_row=None):
+                changes = ""
+                if old_row is not None:
+                    changes = json.dumps(
+                        {
+                            header: {"old": old_value, "new": new_value}
+                            for header, old_value, new_value in zip(
+                                headers, old_row, row
+                            )
+                            if old_value != new_value
+                        }
+                    )
+                output_row = dict(zip(headers, row))
+                output_row.update({"diff": diff, "changes": changes})
+                output_writer.writerow(output_row)
+                counts[diff] += 1
+
+            old_rows = _get_diff_rows(old_reader, headers)
+            new_rows = _get_diff_rows(new_reader, headers)
+            logging.info(f"Writing diff of {old_manifest} and {new_manifest}")
+            if presorted:
+                _merge_join_rows(old_rows, new_rows, key_index, counts, _write_diff)
+            else:
+                _hash_join_rows(
+                    old_rows,
+                    new_rows,
+                    key_index,
+                    num_partitions,
+                    spill_directory,
+                    counts,
+                    _write_diff,
+                )
+
+    logging.info(f"Finished writing diff manifest to {output_manifest}: {counts}")
+    return counts
+
+
+def _get_diff_rows(reader, headers):
+    """
+    Yields each row as a list of values for headers, with acl normalized
+    """
+    acl_index = headers.index("acl") if "acl" in headers else None
+    for row in reader:
+        values = [row.get(header) or "" for header in headers]
+        if acl_index is not None:
+            values[acl_index] = _normalize_acl(values[acl_index])
+        yield values
+
+
+def _merge_join_rows(old_rows, new_rows, key_index, counts, write_diff):
+    """
+    Diff rows from two manifests that are both sorted by key
+    """
+
+    def _next_row(rows, previous_row, name):
+        row = next(rows, None)
+        while row is not None and row[key_index] == previous_row[key_index]:
+            logging.warning(
+                f"skipping duplicate key {row[key_index]} in {name} manifest"
+            )
+            row = next(rows, None)
+        if row is not None and row[key_index] < previous_row[key_index]:
+            raise ValueError(
+                f"{name} manifest is not sorted by key: "
+                f"{row[key_index]} comes after {previous_row[key_index]}"
+            )
+        return row
+
+    old_row = next(old_rows, None)
+    new_row = next(new_rows, None)
+    while old_row is not None or new_row is not None:
+        if new_row is None or (
+            old_row is not None and old_row[key_index] < new_row[key_index]
+        ):
+            write_diff("removed", old_row)
+            old_row = _next_row(old_rows, old_row, "old")
+        elif old_row is None or new_row[key_index] < old_row[key_index]:
+            write_diff("added", new_row)
+            new_row = _next_row(new_rows, new_row, "new")
+        else:
+            if old_row != new_row:
+                write_diff("changed", new_row, old_row)
+            else:
+                counts["unchanged"] += 1
+            old_row = _next_row(old_rows, old_row, "old")
+            new_row = _next_row(new_rows, new_row, "new")
+
+
+def _hash_join_rows(
+    old_rows, new_rows, key_index, num_partitions, spill_directory, counts, write_diff
+):
+    """
+    Diff rows from two manifests by partitioning both by key onto disk, then
+    joining one partition at a time
+    """
+    num_partitions = max(int(num_partitions), 1)
+    with tempfile.TemporaryDirectory(dir=spill_directory) as spill_dir:
+        old_partitions = _partition_rows(
+            old_rows, key_index, num_partitions, os.path.join(spill_dir, "old")
+        )
+        new_partitions = _partition_rows(
+            new_rows, key_index, num_partitions, os.path.join(spill_dir, "new")
+        )
+
+        for old_partition, new_partition in zip(old_partitions, new_partitions):
+            with open(old_partition, "rb") as old_file:
+                # key to (digest, offset) of each old row, or None once matched
+                old_digests = {}
+                offset = 0
+                for line in old_file:
+                    key = json.loads(line)[key_index]
+                    if key in old_digests:
+                        logging.warning(f"skipping duplicate key {key} in old manifest")
+                    else:
+                        old_digests[key] = (_get_row_digest(line), offset)
+                    offset += len(line)
+
+                with open(new_partition, "rb") as new_file:
+                    for line in new_file:
+                        row = json.loads(line)
+                        key = row[key_index]
+                        if key not in old_digests:
+                            write_diff("added", row)
+                            # so a duplicate of this key is skipped like any other
+                            old_digests[key] = None
+                            continue
+
+                        old_digest = old_digests[key]
+                        if old_digest is None:
+                            logging.warning(
+                                f"skipping duplicate key {key} in new manifest"
+                            )
+                            continue
+                        old_digests[key] = None
+
+                        digest, old_offset = old_digest
+                        if digest != _get_row_digest(line):
+                            old_file.seek(old_offset)
+                            write_diff("changed", row, json.loads(old_file.readline()))
+                        else:
+                            counts["unchanged"] += 1
+
+                for old_digest in old_digests.values():
+                    if old_digest is not None:
+                        old_file.seek(old_digest[1])
+                        write_diff("removed", json.loads(old_file.readline()))
+
+
+def _partition_rows(rows, key_index, num_partitions, spill_prefix):
+    """
+    Write rows as JSON lines to num_partitions files by key
+
+    Returns:
+        list[str]: the partition filenames
+    """
+    filenames = [
+        f"{spill_prefix}-{partition:05d}.jsonl" for partition in range(num_partitions)
+    ]
+    partition_files = [open(filename, "w", encoding="utf-8") for filename in filenames]
+    try:
+        for row in rows:
+            partition = zlib.crc32(row[key_index].encode("utf-8")) % num_partitions
+            partition_files[partition].write(json.dumps(row) + "\n")
+    finally:
+        for partition_file in partition_files:
+            partition_file.close()
+    return filenames
+
+
+def _get_row_digest(line):
+    return hashlib.blake2b(line, digest_size=16).digest()
+
+
+def _normalize_acl(acl):
+    """
+    Sort an acl so that the same values in a different order compare equal.
+    Handles both list literals (ex: "['open', 'phs1']") and space-delimited values
+    """
+    try:
+        values = ast.literal_eval(acl)
+    except (ValueError, SyntaxError):
+        return " ".join(sorted(acl.split(" ")))
+
+    if isinstance(values, (list, tuple, set)):
+        return str(sorted(values))
+    return acl
+
+
+def _check_files_format(files):
+    # compare the extensions themselves, since any extension that isn't tsv,
+    # parquet or arrow (ex: .txt) is read as csv
+    if len(set(os.path.splitext(file_name)[-1].lower() for file_name in files)) > 1:
+        raise ValueError("Not all files have the same extension type")
+
+
 def _compare_manifest_columns(
     allow_additional_columns,
     manifest_content={},
@@ -185,22 +457,12 @@ def _write_csv(output_manifest_file_delimiter, output_manifest, diff_content={})
         Writes a manifest file of the diff between manifests
     """
 
-    if output_manifest_file_delimiter is None:
-        output_manifest_file_ext = os.path.splitext(output_manifest)
-        if output_manifest_file_ext[-1].lower() == ".tsv":
-            output_manifest_file_delimiter = "\t"
-        else:
-            output_manifest_file_delimiter = ","
-
     headers = diff_content["headers"]
 
     logging.info(f"Writing diff manifest to {output_manifest}")
-    with open(output_manifest, "w") as outputfile:
-        output_writer = csv.DictWriter(
-            outputfile,
-            delimiter=output_manifest_file_delimiter,
-            fieldnames=headers,
-        )
+    with ManifestWriter(
+        output_manifest, headers, output_manifest_file_delimiter
+    ) as output_writer:
         output_writer.writeheader()
 
         for record in diff_content["csvdict"]:
@@ -1,4 +1,5 @@
-import requests, json, fnmatch, os, os.path, sys, subprocess, glob, ntpath, copy, re, operator, csv
+import requests, json, fnmatch, os, os.path, sys, glob, ntpath, copy, re, operator, csv
+from concurrent.futures import ThreadPoolExecutor
 from os import path
 import gen3
 from gen3.auth import Gen3Auth
@@ -8,6 +9,9 @@ from gen3.file import Gen3File
 from pandas import json_normalize
 import pandas as pd
 
+# number of (project, node) record counts to get in a single GraphQL query
+COUNT_QUERY_BATCH_SIZE = 50
+
 
 class Gen3Error(Exception):
     pass
@@ -114,6 +118,7 @@ class Gen3Expansion:
         overwrite=False,
         remove_empty=True,
         outdir="node_tsvs",
+        max_concurrent_requests=4,
     ):
         """Gets a TSV of the structured data from particular node for each project specified.
            Also creates a master TSV of merged data from each project for the specified node.
@@ -122,6 +127,7 @@ class Gen3Expansion:
         Args:
             node (str): The name of the node to download structured data from.
             projects (list): The projects to download the node from. If "None", downloads data from each project user has access to.
+            max_concurrent_requests (int): The number of projects to export at the same time.
 
         Example:
         >>> df = get_node_tsvs('demographic')
@@ -148,51 +154,46 @@ class Gen3Expansion:
         elif isinstance(projects, str):
             projects = [projects]
 
-        header = ""
-        output = ""
-        data_count = 0
-
+        filenames = []
+        exports = []
         for project in projects:
             filename = str(mydir + "/" + project + "_" + node + ".tsv")
+            filenames.append(filename)
             if (os.path.isfile(filename)) and (overwrite is False):
                 print("File previously downloaded.")
             else:
-                prog, proj = project.split("-", 1)
-                self.sub.export_node(prog, proj, node, "tsv", filename)
+                exports.append((project, node, filename))
+        self._export_node_tsvs(exports, max_concurrent_requests)
 
-            with open(filename) as tsv_file:
+        data_count = 0
+        header_written = False
+        nodefile = str("master_" + node + ".tsv")
+        with open(nodefile, "w+") as master_tsv:
+            for filename in filenames:
                 count = 0
-                lines = tsv_file.readlines()
-                # if file contains actual data and not just header row
-                if len(lines) > 1:
-                    for line in lines:
+                with open(filename) as tsv_file:
+                    header = tsv_file.readline()
+                    # stream the data rows, the header is only written once
+                    for line in tsv_file:
+                        if not header_written:
+                            master_tsv.write(header)
+                            header_written = True
+                        master_tsv.write(line)
                         count += 1
-                        # If header is empty and we are at the first line, set the header
-                        if len(header) == 0 and count == 1:
-                            header = line
-                        elif count > 1:
-                            output = output + line
-                    count -= 1
-                    data_count += count
+                data_count += count
                 print(filename + " has " + str(count) + " records.")
 
                 if remove_empty is True:
                     if count == 0:
                         print("Removing empty file: " + filename)
-                        cmd = ["rm", filename]  # look in the download directory
                         try:
-                            output = subprocess.check_output(
-                                cmd, stderr=subprocess.STDOUT
-                            ).decode("UTF-8")
-                        except Exception as e:
-                            output = e.output.decode("UTF-8")
-                            print("ERROR deleting file: " + output)
-        print("length of all data: " + str(data_count))
-        nodefile = str("master_" + node + ".tsv")
-        # Append header to the beginning of TSV
-        output = header + output
-        with open(nodefile, "w+") as master_tsv:
-            master_tsv.write(output)
+                            os.remove(filename)
+                        except OSError as e:
+                            print("ERROR deleting file: " + str(e))
+            print("length of all data: " + str(data_count))
+
+            master_tsv.seek(0)
+            output = master_tsv.read()
         print(
             "Master node TSV with "
             + str(data_count)
@@ -210,6 +211,7 @@ class Gen3Expansion:
         overwrite=False,
         save_empty=False,
         remove_nodes=["program", "project", "root", "data_release"],
+        max_concurrent_requests=4,
     ):
         """Function gets a TSV for every node in a specified project.
             Exports TSV files into a directory "project_tsvs/".
@@ -220,22 +222,14 @@ class Gen3Expansion:
             overwrite (boolean): If False, the TSV file is not downloaded if there is an existing file with the same name.
             save_empty(boolean): If True, TSVs with no records, i.e., downloads an empty TSV template, will be downloaded.
             remove_nodes(list): A list of nodes in the data model that should not be downloaded per project.
+            max_concurrent_requests (int): The number of TSVs to export at the same time.
         Example:
         >>> get_project_tsvs(projects = ['internal-test'])
 
         """
         if nodes is None:
             # get all the 'node_id's in the data model
-            nodes = sorted(
-                list(
-                    set(
-                        x["id"]
-                        for x in self.sub.query("""{_node_type (first:-1) {id}}""")[
-                            "data"
-                        ]["_node_type"]
-                    )
-                )
-            )
+            nodes = self.sub.get_node_types()
         elif isinstance(nodes, str):
             nodes = [nodes]
 
@@ -257,6 +251,7 @@ class Gen3Expansion:
         elif isinstance(projects, str):
             projects = [projects]
 
+        exports = []
         for project_id in projects:
             mydir = "{}/{}_tsvs".format(
                 outdir, project_id
@@ -270,32 +265,72 @@ class Gen3Expansion:
                 if (os.path.isfile(filename)) and (overwrite is False):
                     print("\tPreviously downloaded: '{}'".format(filename))
                 else:
-                    query_txt = """{_%s_count (project_id:"%s")}""" % (node, project_id)
-                    res = self.sub.query(
-                        query_txt
-                    )  #  {'data': {'_acknowledgement_count': 0}}
-                    count = res["data"][str("_" + node + "_count")]  # count=int(0)
-                    if count > 0 or save_empty is True:
-                        print(
-                            "\nDownloading {} records in node '{}' of project '{}'.".format(
-                                count, node, project_id
-                            )
-                        )
-                        prog, proj = project_id.split("-", 1)
-                        self.sub.export_node(prog, proj, node, "tsv", filename)
-                    else:
-                        print(
-                            "\t{} records in node '{}' of project '{}'.".format(
-                                count, node, project_id
-                            )
-                        )
-
-        cmd = ["ls", mydir]  # look in the download directory
+                    exports.append((project_id, node, filename))
+
+        counts = self._get_node_counts(
+            [(project_id, node) for project_id, node, _ in exports]
+        )
+        exports_with_records = []
+        for project_id, node, filename in exports:
+            count = counts[(project_id, node)]
+            if count > 0 or save_empty is True:
+                print(
+                    "\nDownloading {} records in node '{}' of project '{}'.".format(
+                        count, node, project_id
+                    )
+                )
+                exports_with_records.append((project_id, node, filename))
+            else:
+                print(
+                    "\t{} records in node '{}' of project '{}'.".format(
+                        count, node, project_id
+                    )
+                )
+        self._export_node_tsvs(exports_with_records, max_concurrent_requests)
+
+        # list the download directory
         try:
-            output = subprocess.check_output(cmd, stderr=subprocess.STDOUT).decode(
-                "UTF-8"
-            )
+            output = "".join(name + "\n" for name in sorted(os.listdir(mydir)))
         except Exception as e:
-            output = "ERROR:" + e.output.decode("UTF-8")
+            output = "ERROR:" + str(e)
 
         return output
+
+    def _get_node_counts(self, project_nodes):
+        """Gets the number of records in each node of each project, using
+        COUNT_QUERY_BATCH_SIZE aliased count fields per GraphQL query.
+
+        Args:
+            project_nodes (list): (project_id, node) pairs to count records for
+
+        Returns:
+            dict: the number of records for every (project_id, node)
+        """
+        counts = {}
+        for start in range(0, len(project_nodes), COUNT_QUERY_BATCH_SIZE):
+            batch = project_nodes[start : start + COUNT_QUERY_BATCH_SIZE]
+            query_txt = "{%s}" % " ".join(
+                """count_%d: _%s_count (project_id:"%s")""" % (i, node, project_id)
+                for i, (project_id, node) in enumerate(batch)
+            )
+            res = self.sub.query(query_txt)  #  {'data': {'count_0': 0, 'count_1': 12}}
+            for i, project_node in enumerate(batch):
+                counts[project_node] = res["data"]["count_%d" % i]
+        return counts
+
+    def _export_node_tsvs(self, exports, max_concurrent_requests):
+        """Exports node TSVs with up to max_concurrent_requests exports at a time.
+
+        Args:
+            exports (list): (project_id, node, filename) of every TSV to export
+            max_concurrent_requests (int): the number of exports to run at the same time
+        """
+
+        def _export(export):
+            project_id, node, filename = export
+            prog, proj = project_id.split("-", 1)
+            self.sub.export_node(prog, proj, node, "tsv", filename)
+
+        with ThreadPoolExecutor(max_workers=max_concurrent_requests) as executor:
+            # consume the results to raise any export error
+            list(executor.map(_export, exports))
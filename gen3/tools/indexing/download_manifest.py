@@ -7,6 +7,9 @@ The default manifest format created is a Comma-Separated Value file (csv)
 with rows for every record. A header row is created with field names:
 guid,authz,acl,file_size,md5,urls,file_name
 
+If the output filename ends in .parquet or .arrow, the manifest is written in that
+format instead (requires pyarrow).
+
 Fields that are lists (like acl, authz, and urls) separate the values with spaces.
 
 Attributes:
@@ -37,6 +40,9 @@ import math
 
 from gen3.tools.utils import (
     get_and_verify_fileinfos_from_manifest,
+    get_manifest_format,
+    ManifestWriter,
+    COLUMNAR_MANIFEST_FORMATS,
     GUID_STANDARD_KEY,
     FILENAME_STANDARD_KEY,
     SIZE_STANDARD_KEY,
@@ -54,6 +60,15 @@ INDEXD_RECORD_PAGE_SIZE = 1024
 MAX_CONCURRENT_REQUESTS = 24
 CURRENT_DIR = os.path.dirname(os.path.realpath(__file__))
 TMP_FOLDER = os.path.abspath(CURRENT_DIR + "/tmp") + "/"
+OUTPUT_MANIFEST_HEADERS = [
+    "guid",
+    "urls",
+    "authz",
+    "acl",
+    "md5",
+    "file_size",
+    "file_name",
+]
 
 logging = get_logger("__name__")
 
@@ -238,8 +253,12 @@ async def _write_all_index_records_to_file(
     if os.path.isfile(output_filename):
         os.unlink(output_filename)
 
+    if get_manifest_format(output_filename) in COLUMNAR_MANIFEST_FORMATS:
+        _write_columnar_output_file(output_filename)
+        return
+
     with open(output_filename, "wb") as outfile:
-        outfile.write("guid,urls,authz,acl,md5,file_size,file_name\n".encode("utf8"))
+        outfile.write((",".join(OUTPUT_MANIFEST_HEADERS) + "\n").encode("utf8"))
         for filename in glob.glob(TMP_FOLDER + "output/*"):
             if output_filename == filename:
                 # don't want to copy the output into the output
@@ -251,6 +270,21 @@ async def _write_all_index_records_to_file(
     logging.info(f"done writing output to file {output_filename}")
 
 
+def _write_columnar_output_file(output_filename):
+    """
+    Combine the csv output from each process into a single Parquet or Arrow manifest
+    """
+    with ManifestWriter(output_filename, OUTPUT_MANIFEST_HEADERS) as writer:
+        for filename in glob.glob(TMP_FOLDER + "output/*"):
+            logging.info(f"combining {filename} into {output_filename}")
+            with open(filename, encoding="utf8") as readfile:
+                writer.writerows(
+                    csv.DictReader(readfile, fieldnames=OUTPUT_MANIFEST_HEADERS)
+                )
+
+    logging.info(f"done writing output to file {output_filename}")
+
+
 @click.command()
 @click.option(
     "--commons_url", help="Root domain (url) for a commons containing indexd."
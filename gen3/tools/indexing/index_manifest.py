@@ -31,7 +31,6 @@ Usages:
     python index_manifest.py --commons_url https://giangb.planx-pla.net  --manifest_file path_to_manifest --api_key ./credentials.json --replace_urls False --thread_num 10
 """
 import os
-import csv
 import click
 from functools import partial
 from multiprocessing.dummy import Pool as ThreadPool
@@ -57,7 +56,11 @@ from gen3.utils import (
     _standardize_str,
     get_urls,
 )
-from gen3.tools.utils import get_and_verify_fileinfos_from_manifest
+from gen3.tools.utils import (
+    get_and_verify_fileinfos_from_manifest,
+    ManifestReader,
+    ManifestWriter,
+)
 import indexclient.client as client
 from indexclient.client import Document
 from cdislogging import get_logger
@@ -81,7 +84,7 @@ class ThreadControl(object):
 
 def _write_csv(filename, files, fieldnames=None):
     """
-    write to csv file
+    write to tsv file, or a Parquet/Arrow manifest depending on the extension
 
     Args:
         filename(str): file name
@@ -104,8 +107,7 @@ def _write_csv(filename, files, fieldnames=None):
     if not files:
         return None
     fieldnames = fieldnames or files[0].keys()
-    with open(filename, mode="w") as outfile:
-        writer = csv.DictWriter(outfile, delimiter="\t", fieldnames=fieldnames)
+    with ManifestWriter(filename, fieldnames, manifest_file_delimiter="\t") as writer:
         writer.writeheader()
 
         for f in files:
@@ -405,7 +407,7 @@ def index_object_manifest(
                 },
 
     Returns:
-        files(list(dict)): list of file info
+        files(list(ManifestRecord)): list of file info, as dict-like ManifestRecords
         [
             {
                 "guid": "guid_example",
@@ -444,7 +446,10 @@ def index_object_manifest(
 
     try:
         files, headers = get_and_verify_fileinfos_from_manifest(
-            manifest_file, manifest_file_delimiter, include_additional_columns=True
+            manifest_file,
+            manifest_file_delimiter,
+            include_additional_columns=True,
+            compact_rows=True,
         )
     except Exception as e:
         exc_info = sys.exc_info()
@@ -598,16 +603,7 @@ def delete_all_guids(auth, file):
         )
         exit()
 
-    # try to get delimeter based on file ext
-    file_ext = os.path.splitext(file)
-    if file_ext[-1].lower() == ".tsv":
-        manifest_file_delimiter = "\t"
-    else:
-        # default, assume CSV
-        manifest_file_delimiter = ","
-
-    with open(file, "r", encoding="utf-8-sig") as input_file:
-        csvReader = csv.DictReader(input_file, delimiter=manifest_file_delimiter)
+    with ManifestReader(file) as csvReader:
         fieldnames = csvReader.fieldnames
 
         logging.debug(f"got fieldnames from {file}: {fieldnames}")
@@ -27,10 +27,21 @@ import os
 from cdislogging import get_logger
 
 import csv
-import copy
+import heapq
+import itertools
+import json
+import tempfile
+import zlib
 
 from collections import OrderedDict
-from gen3.tools.utils import get_and_verify_fileinfos_from_manifest
+from concurrent.futures import ProcessPoolExecutor
+from gen3.tools.utils import (
+    get_and_verify_fileinfos_from_manifest,
+    ManifestReader,
+    ManifestRecord,
+    ManifestWriter,
+    _verify_manifest_rows,
+)
 from gen3.tools.utils import (
     GUID_STANDARD_KEY,
     SIZE_STANDARD_KEY,
@@ -42,6 +53,9 @@ from gen3.tools.utils import (
 
 logging = get_logger("__name__")
 
+# number of md5 shards (spill files per input manifest) for external_sort
+DEFAULT_NUM_SHARDS = 64
+
 
 def merge_bucket_manifests(
     directory=".",
@@ -52,6 +66,10 @@ def merge_bucket_manifests(
     allow_mult_guids_per_hash=False,
     columns_with_arrays=None,
     expected_duplicate_md5s=list(),
+    external_sort=False,
+    num_shards=DEFAULT_NUM_SHARDS,
+    num_processes=1,
+    spill_directory=None,
     **kwargs,
 ):
     """
@@ -87,6 +105,19 @@ def merge_bucket_manifests(
             to include URLs column, ACL column, and AuthZ column.
         expected_duplicate_md5s(list[str]): list of md5sums that we EXPECT to be duplicated in the
             input manifests; skip merging for these records
+        external_sort(bool): for inputs larger than memory. rows are sharded by md5
+            prefix into spill files on disk, then each shard is merged on its own and
+            streamed to the output manifest, so only one shard is in memory at a time.
+            Output is grouped by shard instead of in input order
+        num_shards(int): number of md5 shards to use with external_sort. more
+            shards means less memory used per shard
+        num_processes(int): number of processes to merge with. input manifests
+            are read and sharded by md5 into spill files in parallel, then each
+            shard is read and merged by its own process. Output order is the same
+            as with a single process (by shard with external_sort)
+        spill_directory(str): directory for the temporary spill files used with
+            external_sort or num_processes > 1, defaults to the system temp
+            directory. needs about as much free space as the input manifests
 
     Returns:
         None
@@ -104,50 +135,110 @@ def merge_bucket_manifests(
 
     logging.info(f"Merging files: {files}")
 
+    merge_options = {
+        "continue_after_error": continue_after_error,
+        "allow_mult_guids_per_hash": allow_mult_guids_per_hash,
+        "columns_with_arrays": columns_with_arrays,
+        "expected_duplicate_md5s": expected_duplicate_md5s,
+    }
+
+    if external_sort:
+        _merge_bucket_manifests_external(
+            files,
+            output_manifest,
+            output_manifest_file_delimiter,
+            num_shards=num_shards,
+            num_processes=num_processes,
+            spill_directory=spill_directory,
+            merge_options=merge_options,
+        )
+        return
+
     headers = set()
-    all_rows = {}
-    records_with_no_guid = []
+    if num_processes > 1:
+        all_rows = _merge_records_in_parallel(
+            files, headers, num_processes, spill_directory, merge_options
+        )
+    else:
+        records = _get_records_from_manifests(files, headers)
+        all_rows = _merge_records(records, **merge_options)
+    _create_output_file(
+        output_manifest,
+        headers,
+        (record for records in all_rows.values() for record in records),
+        output_manifest_file_delimiter,
+    )
+
+
+def _get_records_from_manifests(files, headers):
+    """
+    Yields the records from each manifest in order, adding their columns to headers
+    """
     for manifest in files:
         records_from_file, _ = get_and_verify_fileinfos_from_manifest(
-            manifest, include_additional_columns=True
+            manifest, include_additional_columns=True, compact_rows=True
         )
         for record in records_from_file:
-            # simple case where this is the first time we've seen this hash
             headers.update(record.keys())
-            if record[MD5_STANDARD_KEY] not in all_rows:
-                record_to_write = copy.deepcopy(record)
-                all_rows[record_to_write[MD5_STANDARD_KEY]] = [record_to_write]
-
-                new_guid = record.get(GUID_STANDARD_KEY)
-                if not new_guid:
-                    # since there's no guid specified to differentiate this from other
-                    # entries, we will add metadata to all records later
-                    records_with_no_guid.append(record)
+            yield record
+
+
+def _merge_records(
+    records,
+    continue_after_error,
+    allow_mult_guids_per_hash,
+    columns_with_arrays,
+    expected_duplicate_md5s,
+):
+    """
+    Merge records with the same md5, see merge_bucket_manifests for the options.
+
+    Records with different md5s never affect each other, so any set of records
+    that contains every record for its md5s (in input order) can be merged on its own.
+
+    Returns:
+        dict: md5 to the list of merged records for it
+    """
+    all_rows = {}
+    records_with_no_guid = []
+    for record in records:
+        # simple case where this is the first time we've seen this hash
+        if record[MD5_STANDARD_KEY] not in all_rows:
+            # values are all strings/ints, so a shallow copy is enough. most
+            # records are only ever seen once, so keep them compact
+            record_to_write = ManifestRecord(record)
+            all_rows[record_to_write[MD5_STANDARD_KEY]] = [record_to_write]
+
+            new_guid = record.get(GUID_STANDARD_KEY)
+            if not new_guid:
+                # since there's no guid specified to differentiate this from other
+                # entries, we will add metadata to all records later
+                records_with_no_guid.append(record)
+        else:
+            # if the hash already exists, we need to try and update existing
+            # entries with any new data (and ensure we don't add duplicates)
+            new_guid = record.get(GUID_STANDARD_KEY)
+
+            if not new_guid:
+                # since there's no guid specified to differentiate this from other
+                # entries, we will add metadata to all records later
+                records_with_no_guid.append(record)
+                continue
+
+            # If this record is one of the records which are expected duplicates
+            # then don't attempt to merge this record
+            # with any records that share its md5sum: just add it to the list
+            if record[MD5_STANDARD_KEY] in expected_duplicate_md5s:
+                all_rows[record[MD5_STANDARD_KEY]].append(record)
             else:
-                # if the hash already exists, we need to try and update existing
-                # entries with any new data (and ensure we don't add duplicates)
-                new_guid = record.get(GUID_STANDARD_KEY)
-
-                if not new_guid:
-                    # since there's no guid specified to differentiate this from other
-                    # entries, we will add metadata to all records later
-                    records_with_no_guid.append(record)
-                    continue
-
-                # If this record is one of the records which are expected duplicates
-                # then don't attempt to merge this record
-                # with any records that share its md5sum: just add it to the list
-                if record[MD5_STANDARD_KEY] in expected_duplicate_md5s:
-                    all_rows[record[MD5_STANDARD_KEY]].append(record)
-                else:
-                    updated_records = _get_updated_records(
-                        record=record,
-                        existing_records=all_rows[record[MD5_STANDARD_KEY]],
-                        continue_after_error=continue_after_error,
-                        allow_mult_guids_per_hash=allow_mult_guids_per_hash,
-                        columns_with_arrays=columns_with_arrays,
-                    )
-                    all_rows[record[MD5_STANDARD_KEY]] = updated_records.values()
+                updated_records = _get_updated_records(
+                    record=record,
+                    existing_records=all_rows[record[MD5_STANDARD_KEY]],
+                    continue_after_error=continue_after_error,
+                    allow_mult_guids_per_hash=allow_mult_guids_per_hash,
+                    columns_with_arrays=columns_with_arrays,
+                )
+                all_rows[record[MD5_STANDARD_KEY]] = updated_records.values()
 
     # for the entries where there was no GUID specified, we will add that metadata
     # to all previous records
@@ -178,9 +269,249 @@ def merge_bucket_manifests(
                 for record in updated_records.values()
                 if record.get(GUID_STANDARD_KEY)
             ]
-    _create_output_file(
-        output_manifest, headers, all_rows, output_manifest_file_delimiter
-    )
+
+    return all_rows
+
+
+def _merge_records_in_parallel(
+    files, headers, num_processes, spill_directory, merge_options
+):
+    """
+    Shard every input manifest by md5 into spill files, then have each process
+    read and merge its own shard, so records are never collected in the parent
+    or sent to the workers.
+
+    Returns:
+        dict: md5 to the list of merged records for it, in the same order as
+            _merge_records would return them
+    """
+    with tempfile.TemporaryDirectory(dir=spill_directory) as spill_dir:
+        spill_prefixes = [
+            os.path.join(spill_dir, f"{file_index:06d}")
+            for file_index in range(len(files))
+        ]
+        with ProcessPoolExecutor(max_workers=num_processes) as executor:
+            headers_per_file = list(
+                executor.map(
+                    _shard_manifest,
+                    files,
+                    spill_prefixes,
+                    [num_processes] * len(files),
+                )
+            )
+            headers.update(*headers_per_file)
+
+            logging.info(
+                f"Merging {len(files)} manifests with {num_processes} processes"
+            )
+            merged_partitions = list(
+                executor.map(
+                    _merge_partition,
+                    [spill_prefixes] * num_processes,
+                    range(num_processes),
+                    [merge_options] * num_processes,
+                )
+            )
+
+    # each partition is sorted by where its md5s were first seen, which is unique
+    # across partitions, so merging them restores the single process order
+    return {
+        md5: merged_records
+        for _, md5, merged_records in heapq.merge(*merged_partitions)
+    }
+
+
+def _merge_partition(spill_prefixes, shard, merge_options):
+    """
+    Merge the records in a shard.
+
+    Returns:
+        list(tuple): (position first seen, md5, merged records) for each md5 in
+            the shard, in the order they were first seen
+    """
+    first_seen = {}
+
+    def _get_records():
+        for position, record in _read_shard(spill_prefixes, shard, with_positions=True):
+            first_seen.setdefault(record[MD5_STANDARD_KEY], position)
+            yield record
+
+    all_rows = _merge_records(_get_records(), **merge_options)
+    # dict views can't be sent back from a worker process
+    return [
+        (first_seen[md5], md5, list(merged_records))
+        for md5, merged_records in all_rows.items()
+    ]
+
+
+def _merge_bucket_manifests_external(
+    files,
+    output_manifest,
+    output_manifest_file_delimiter,
+    num_shards,
+    num_processes,
+    spill_directory,
+    merge_options,
+):
+    """
+    Shard every input manifest by md5 into spill files (one process per manifest,
+    up to num_processes at once), then merge and write out one shard at a time.
+
+    Every record for an md5 lands in the same shard, and each shard is read back
+    in input order (manifest by manifest, row by row), so merging a shard on its
+    own gives the same records as merging everything at once.
+    """
+    num_shards = max(int(num_shards), 1)
+    with tempfile.TemporaryDirectory(dir=spill_directory) as spill_dir:
+        spill_prefixes = [
+            os.path.join(spill_dir, f"{file_index:06d}")
+            for file_index in range(len(files))
+        ]
+        logging.info(
+            f"Sharding {len(files)} manifests into {num_shards} shards in {spill_dir}"
+        )
+        if num_processes > 1:
+            with ProcessPoolExecutor(max_workers=num_processes) as executor:
+                headers_per_file = list(
+                    executor.map(
+                        _shard_manifest,
+                        files,
+                        spill_prefixes,
+                        [num_shards] * len(files),
+                    )
+                )
+        else:
+            headers_per_file = [
+                _shard_manifest(manifest, spill_prefix, num_shards)
+                for manifest, spill_prefix in zip(files, spill_prefixes)
+            ]
+        headers = set().union(*headers_per_file)
+
+        if num_processes > 1:
+            # merge shards in parallel to files, then stream those out in order
+            merged_filenames = [
+                os.path.join(spill_dir, f"merged-{shard:05d}.jsonl")
+                for shard in range(num_shards)
+            ]
+            with ProcessPoolExecutor(max_workers=num_processes) as executor:
+                for _ in executor.map(
+                    _merge_shard_to_file,
+                    [spill_prefixes] * num_shards,
+                    range(num_shards),
+                    merged_filenames,
+                    [merge_options] * num_shards,
+                ):
+                    pass
+
+            def _get_merged_records():
+                for merged_filename in merged_filenames:
+                    with open(merged_filename, encoding="utf-8") as merged_file:
+                        for line in merged_file:
+                            yield json.loads(line)
+
+        else:
+
+            def _get_merged_records():
+                for shard in range(num_shards):
+                    all_rows = _merge_records(
+                        _read_shard(spill_prefixes, shard), **merge_options
+                    )
+                    logging.debug(f"merged shard {shard}: {len(all_rows)} hashes")
+                    for records in all_rows.values():
+                        yield from records
+
+        _create_output_file(
+            output_manifest,
+            headers,
+            _get_merged_records(),
+            output_manifest_file_delimiter,
+        )
+
+
+def _merge_shard_to_file(spill_prefixes, shard, merged_filename, merge_options):
+    """
+    Merge the records in a shard and write them to merged_filename
+    """
+    all_rows = _merge_records(_read_shard(spill_prefixes, shard), **merge_options)
+    with open(merged_filename, "w", encoding="utf-8") as merged_file:
+        for records in all_rows.values():
+            for record in records:
+                merged_file.write(json.dumps(dict(record)) + "\n")
+    logging.debug(f"merged shard {shard}: {len(all_rows)} hashes")
+
+
+def _get_md5_shard(md5, num_shards):
+    try:
+        return int(md5[:8], 16) % num_shards
+    except ValueError:
+        # not actually an md5, but all records with it still need the same shard
+        return zlib.crc32(md5.encode("utf-8")) % num_shards
+
+
+def _get_shard_filename(spill_prefix, shard):
+    return f"{spill_prefix}-{shard:05d}.jsonl"
+
+
+def _shard_manifest(manifest, spill_prefix, num_shards):
+    """
+    Stream the records from manifest to a spill file per md5 shard, in order,
+    verifying each row as it's read so the manifest is never loaded into memory.
+    Like get_and_verify_fileinfos_from_manifest, a manifest that doesn't pass
+    verification contributes no records.
+
+    Returns:
+        set(str): columns in the manifest's records
+    """
+    headers = set()
+    shard_files = {}
+
+    def _write_record(record):
+        headers.update(record.keys())
+        shard = _get_md5_shard(record[MD5_STANDARD_KEY], num_shards)
+        if shard not in shard_files:
+            shard_files[shard] = open(
+                _get_shard_filename(spill_prefix, shard), "w", encoding="utf-8"
+            )
+        shard_files[shard].write(json.dumps([next(row_indexes), record]) + "\n")
+
+    row_indexes = itertools.count()
+    try:
+        with ManifestReader(manifest) as reader:
+            _, _, pass_verification = _verify_manifest_rows(
+                reader,
+                include_additional_columns=True,
+                handle_file_info=_write_record,
+            )
+    finally:
+        for shard_file in shard_files.values():
+            shard_file.close()
+
+    if not pass_verification:
+        logging.error(f"The manifest {manifest} is not in the correct format!!!")
+        for shard in shard_files:
+            os.remove(_get_shard_filename(spill_prefix, shard))
+        return set()
+
+    logging.info(f"Sharded {manifest} into {len(shard_files)} shards")
+    return headers
+
+
+def _read_shard(spill_prefixes, shard, with_positions=False):
+    """
+    Yields the records in a shard, in input order. with_positions, yields
+    ((manifest index, row index), record) instead
+    """
+    for file_index, spill_prefix in enumerate(spill_prefixes):
+        shard_filename = _get_shard_filename(spill_prefix, shard)
+        if not os.path.exists(shard_filename):
+            continue
+        with open(shard_filename, encoding="utf-8") as shard_file:
+            for line in shard_file:
+                row_index, record = json.loads(line)
+                if with_positions:
+                    yield (file_index, row_index), record
+                else:
+                    yield record
 
 
 def _get_updated_records(
@@ -276,7 +607,7 @@ def _get_updated_records(
                     record_to_write.get(GUID_STANDARD_KEY), {}
                 ).update(record_to_write)
             else:
-                record_to_write = copy.deepcopy(record)
+                record_to_write = dict(record)
 
                 updated_records.setdefault(
                     record_to_write.get(GUID_STANDARD_KEY), {}
@@ -339,7 +670,7 @@ def _get_updated_record(
     continue_after_error,
     columns_with_arrays,
 ):
-    record_to_write = copy.deepcopy(existing_record)
+    record_to_write = dict(existing_record)
 
     # for any column not in the standard set, either update the existing
     # record with new data, or leave column as data provided
@@ -359,11 +690,8 @@ def _get_updated_record(
                 # column that has a space-delimited array of values
                 record_to_write[column_name] = " ".join(
                     sorted(
-                        list(
-                            set(
-                                new_record[column_name].split(" ")
-                                + existing_record[column_name].split(" ")
-                            )
+                        set(new_record[column_name].split(" ")).union(
+                            existing_record[column_name].split(" ")
                         )
                     )
                 ).strip(" ")
@@ -401,15 +729,8 @@ def _get_updated_record(
 
 
 def _create_output_file(
-    output_manifest, headers, all_rows, output_manifest_file_delimiter
+    output_manifest, headers, records, output_manifest_file_delimiter
 ):
-    if output_manifest_file_delimiter is None:
-        output_manifest_file_ext = os.path.splitext(output_manifest)
-        if output_manifest_file_ext[-1].lower() == ".tsv":
-            output_manifest_file_delimiter = "\t"
-        else:
-            output_manifest_file_delimiter = ","
-
     # order headers logically for standard columns, followed by alphabetical for
     # non-standard columns
     stardard_headers = [
@@ -425,19 +746,14 @@ def _create_output_file(
     )
 
     headers = stardard_headers + non_standard_headers
-    with open(output_manifest, "w") as outfile:
+    with ManifestWriter(
+        output_manifest, headers, output_manifest_file_delimiter
+    ) as output_writer:
         logging.info(f"Writing merged manifest to {output_manifest}")
         logging.info(f"Headers {headers}")
-        output_writer = csv.DictWriter(
-            outfile,
-            delimiter=output_manifest_file_delimiter,
-            fieldnames=headers,
-            extrasaction="ignore",
-        )
         output_writer.writeheader()
 
-        for hash_code, records in all_rows.items():
-            for record in records:
-                output_writer.writerow(record)
+        for record in records:
+            output_writer.writerow(record)
 
         logging.info(f"Finished writing merged manifest to {output_manifest}")
@@ -4,14 +4,23 @@ validate_manifest takes as input a manifest, an api credentials file, and an out
 then attemps to obtain a pre-signed url and download a file from each bucket
 to verify it has been indexed, and then generate a report in csv format.
 
+Only the first byte of each file is requested (a 1-byte Range request) so large
+objects are never fully downloaded, and the records are checked concurrently.
+More than one record per bucket can be checked with `samples_per_key`.
+
 The output format is as follows:
 | ACL | Bucket | Protocol | Presigned URL Status | Download Status | GUID |
 """
 
 
 import csv
+import functools
+import heapq
+import itertools
+from multiprocessing.dummy import Pool as ThreadPool
 from cdislogging import get_logger, get_stream_handler
 from gen3.file import Gen3File
+from gen3.tools.utils import read_manifest_in_parallel
 import requests
 import re
 
@@ -20,6 +29,9 @@ logger = get_logger(__name__)
 logger.addHandler(get_stream_handler())
 logger.setLevel("INFO")
 
+MAX_CONCURRENT_REQUESTS = 24
+URL_PATTERN = re.compile(r"^[a-zA-Z][a-zA-Z0-9+.-]*://[^\s/]+(?:/[^\s]*)*$")
+
 
 class GuidError(Exception):
     pass
@@ -30,6 +42,16 @@ class ManifestError(Exception):
 
 
 class Record:
+    __slots__ = (
+        "guid",
+        "bucket",
+        "protocol",
+        "acl",
+        "size",
+        "response_status",
+        "download_status",
+    )
+
     def __init__(self, guid, bucket, protocol, acl, size):
         self.guid = guid
         self.bucket = bucket
@@ -46,7 +68,7 @@ class Record:
         This method performs the following actions:
         1. Attempts to generate a pre-signed URL for the record identified by `self.guid` using the provided `gen3file` object.
         2. Logs the result of the pre-signed URL generation, including the response status code.
-        3. If the URL is successfully generated (status code 200), it attempts to download the file from the generated URL.
+        3. If the URL is successfully generated (status code 200), it requests the first byte of the file from the generated URL.
         4. Logs the result of the download attempt, including the status code.
         5. Sets the `response_status` attribute to indicate the success or failure of the pre-signed URL generation.
         6. Sets the `download_status` attribute to indicate the success or failure of the download attempt (if applicable).
@@ -72,7 +94,20 @@ class Record:
 
         if response_status == 200:
             try:
-                self.download_status = requests.get(url).status_code
+                # presigned urls are only signed for GET, so probe with a 1-byte
+                # range instead of HEAD and never read the rest of the body. an
+                # empty file has no first byte, so it's requested without a range
+                is_empty = int(self.size) == 0
+                headers = {} if is_empty else {"Range": "bytes=0-0"}
+                resp = requests.get(url, headers=headers, stream=True)
+                resp.close()
+                # a partial response means the file is downloadable, as does an
+                # unsatisfiable range for an empty file
+                self.download_status = (
+                    200
+                    if resp.status_code == 206 or (is_empty and resp.status_code == 416)
+                    else resp.status_code
+                )
                 logger.info(
                     f"Download process complete with status code {self.download_status}"
                 )
@@ -84,18 +119,63 @@ class Record:
         return
 
 
+def _get_records_from_rows(guid_col, rows, first_line_number=2):
+    """
+    Creates a Record for every acl and url of every manifest row, in order.
+
+    Args:
+        guid_col (str): name of the GUID column
+        rows (csv.DictReader): reader over manifest rows
+
+    Returns:
+        list(Record): a record for each (url, acl) pair, except for the admin acl
+    """
+    records = []
+    for row in rows:
+        size = row["size"]
+        guid = row[guid_col]
+        acls = [acl for acl in row["acl"].split(" ") if acl != "admin"]
+        if not acls:
+            continue
+        # parse every url once per row rather than once per acl
+        locations = []
+        for url in row["url"].split(" "):
+            url = url.replace("[", "").replace("]", "")
+            if URL_PATTERN.match(url) is None:
+                raise ManifestError(
+                    f"Manifest contains guid {guid} with invalid url format: {url}"
+                )
+            locations.append((url.split("/")[2], url.split("://")[0]))
+        for acl in acls:
+            for bucket, protocol in locations:
+                records.append(Record(guid, bucket, protocol, acl, size))
+    return records
+
+
 class RecordParser:
-    def __init__(self, auth):
+    def __init__(self, auth, samples_per_key=1):
+        """
+        Args:
+            auth (Gen3Auth): a Gen3Auth instance
+            samples_per_key (int): number of records to check for each unique
+                (bucket, protocol, acl) combination, smallest non-zero sizes first
+        """
         self.auth = auth
+        self.samples_per_key = samples_per_key
         self.record_dict = {}
         self.record_sizes = {}
+        # (bucket, protocol, acl) to a heap of (-size, row order, Record) holding the
+        # smallest non-zero sized records, only kept when samples_per_key > 1
+        self.record_samples = {}
 
-    def read_records_from_manifest(self, manifest):
+    def read_records_from_manifest(self, manifest, num_processes=1):
         """
         Parses a manifest and creates a dictionary of Record objects.
 
         Args:
             manifest (str): the location of a manifest file
+            num_processes (int): number of processes to parse the manifest with, see
+                gen3.tools.utils.read_manifest_in_parallel
         """
         tsv_pattern = "^.*\.tsv$"
         csv_pattern = "^.*\.csv$"
@@ -110,7 +190,6 @@ class RecordParser:
 
         with open(manifest, mode="r") as f:
             csv_reader = csv.DictReader(f, delimiter=sep)
-            rows = [row for row in csv_reader]
 
             try:
                 guid_cols = {"GUID", "guid", "id"}
@@ -120,66 +199,90 @@ class RecordParser:
                     "Manifest file has no column named 'GUID', 'guid', or 'id'"
                 )
 
-            url_pattern = r"^[a-zA-Z][a-zA-Z0-9+.-]*://[^\s/]+(?:/[^\s]*)*$"
-            for row in rows:
-                size = row["size"]
-                guid = row[guid_col]
-                for acl in row["acl"].split(" "):
-                    if acl != "admin":
-                        for url in row["url"].split(" "):
-                            url = url.replace("[", "").replace("]", "")
-                            if re.match(url_pattern, url) == None:
-                                raise ManifestError(
-                                    f"Manifest contains guid {guid} with invalid url format: {url}"
-                                )
-                            else:
-                                protocol, bucket = (
-                                    url.split("://")[0].replace("[", ""),
-                                    url.split("/")[2],
-                                )
-                                key = (
-                                    bucket,
-                                    protocol,
-                                    acl,
-                                )  # Check a record for each unique (bucket, protocol, acl) combination
-                                if (
-                                    key not in self.record_dict
-                                    or (  # Add record to the list of records if no matching (bucket,protocol,acl) found
-                                        int(self.record_dict[key].size)
-                                        >= int(
-                                            size
-                                        )  # Update to download smallest non-zero sized record
-                                        and int(size)
-                                        != 0  # Make sure record has non-zero size
-                                    )
-                                ):  # If it passes these we temporarily choose this record to check for the bucket, protocol, and acl
-                                    record = Record(
-                                        guid,
-                                        bucket,
-                                        protocol,
-                                        acl,
-                                        size,
-                                    )
-                                    self.record_dict[key] = record
-
-    def check_records(self):
+            if num_processes == 1:
+                records = _get_records_from_rows(guid_col, csv_reader)
+            else:
+                records = itertools.chain.from_iterable(
+                    read_manifest_in_parallel(
+                        manifest,
+                        functools.partial(_get_records_from_rows, guid_col),
+                        sep,
+                        num_processes=num_processes,
+                    )
+                )
+
+            row_order = itertools.count()
+            for record in records:
+                key = (
+                    record.bucket,
+                    record.protocol,
+                    record.acl,
+                )  # Check a record for each unique (bucket, protocol, acl) combination
+                if (
+                    key not in self.record_dict
+                    or (  # Add record to the list of records if no matching (bucket,protocol,acl) found
+                        (
+                            int(self.record_dict[key].size) >= int(record.size)
+                            or int(self.record_dict[key].size) == 0
+                        )  # Update to download smallest non-zero sized record, replacing an empty one
+                        and int(record.size) != 0  # Make sure record has non-zero size
+                    )
+                ):  # If it passes these we temporarily choose this record to check for the bucket, protocol, and acl
+                    self.record_dict[key] = record
+                if self.samples_per_key > 1 and int(record.size) != 0:
+                    samples = self.record_samples.setdefault(key, [])
+                    sample = (-int(record.size), next(row_order), record)
+                    if len(samples) < self.samples_per_key:
+                        heapq.heappush(samples, sample)
+                    else:
+                        heapq.heappushpop(samples, sample)
+
+    def get_records_to_check(self):
+        """
+        Returns the records to check, `samples_per_key` of them for each unique
+        (bucket, protocol, acl) combination, in manifest key order.
+
+        Returns:
+            list(Record): the chosen record for every key followed by the other
+                sampled records for that key, smallest first
+        """
+        records_to_check = []
+        for key, record in self.record_dict.items():
+            records_to_check.append(record)
+            samples = sorted(self.record_samples.get(key, []), reverse=True)
+            others = [sample for _, _, sample in samples if sample is not record]
+            records_to_check.extend(others[: self.samples_per_key - 1])
+        return records_to_check
+
+    def check_records(self, max_concurrent_requests=None):
         """
-        Iterates through all records in `self.record_dict` and checks each record's status.
+        Checks the status of every record returned by `get_records_to_check`.
 
         This method performs the following actions:
         1. Initializes a `Gen3File` object using the authentication information from `self.auth`.
-        2. Iterates over the items in `self.record_dict`, where each item consists of a tuple `(bucket, protocol, acl)` and a `record` object.
-        3. For each record, the `check_record` method is called, which attempts to generate a pre-signed URL and check the download status.
+        2. Calls the `check_record` method of each record, which attempts to generate a pre-signed URL
+           and check the download status, on a pool of at most `max_concurrent_requests` threads.
 
         Args:
-            None: This method does not take any arguments beyond `self`.
+            max_concurrent_requests (int): maximum number of records checked at once,
+                defaults to MAX_CONCURRENT_REQUESTS
 
         Returns:
-            None: This function does not return any value. It triggers the `check_record` method for each record in `self.record_dict`.
+            None: This function does not return any value. It triggers the `check_record` method for each record.
         """
         gen3file = Gen3File(self.auth)
-        for (bucket, protocol, acl), record in self.record_dict.items():
-            record.check_record(gen3file)
+        records = self.get_records_to_check()
+        if not records:
+            return
+
+        pool = ThreadPool(
+            min(max_concurrent_requests or MAX_CONCURRENT_REQUESTS, len(records))
+        )
+        try:
+            pool.map(lambda record: record.check_record(gen3file), records)
+        finally:
+            pool.close()
+            pool.join()
 
     def save_download_check_results_to_csv(self, csv_filename):
         """
@@ -190,7 +293,7 @@ class RecordParser:
             csv_filename (str): the relative file path of the output csv
         """
         self.download_results = []
-        for record in self.record_dict.values():
+        for record in self.get_records_to_check():
             self.download_results.append(
                 {
                     "acl": record.acl,
@@ -241,7 +344,13 @@ class RecordParser:
         logger.info(f"Results saved to {csv_filename}")
 
 
-def validate_manifest(MANIFEST, auth, output_file="results.csv"):
+def validate_manifest(
+    MANIFEST,
+    auth,
+    output_file="results.csv",
+    samples_per_key=1,
+    max_concurrent_requests=None,
+):
     """
     Takes as input a manifest location, a Gen3Auth instance, and an output file
     Attempts to obtain a presigned url from a record from each bucket then download the file.
@@ -251,10 +360,13 @@ def validate_manifest(MANIFEST, auth, output_file="results.csv"):
         MANIFEST (str): the location of a manifest file
         api_key (str): the location of an api credentials file
         auth (str): a Gen3Auth instance
+        samples_per_key (int): number of records to check for each unique
+            (bucket, protocol, acl) combination
+        max_concurrent_requests (int): maximum number of records checked at once
     """
     logger.info("Starting...")
-    records = RecordParser(auth)
+    records = RecordParser(auth, samples_per_key=samples_per_key)
     records.read_records_from_manifest(MANIFEST)
-    records.check_records()
+    records.check_records(max_concurrent_requests=max_concurrent_requests)
     records.save_download_check_results_to_csv(output_file)
     return records
@@ -1,10 +1,12 @@
 """
 Module to implement is_valid_manifest_format
 """
+import functools
 import warnings
 import csv
 
 from gen3.tools.utils import (
+    read_manifest_in_parallel,
     Columns,
     MD5Validator,
     URLValidator,
@@ -26,6 +28,7 @@ def is_valid_manifest_format(
     allow_base64_encoded_md5=False,
     error_on_empty_url=False,
     line_limit=None,
+    num_processes=1,
 ):
     """
     Validates the contents of a manifest of file objects and logs all errors
@@ -110,6 +113,9 @@ def is_valid_manifest_format(
         line_limit(int, optional):
             number of lines in manifest to validate including the header. if
             not provided, every line is validated
+        num_processes(int, optional):
+            number of processes to validate rows with when validating every
+            line. see gen3.tools.utils.read_manifest_in_parallel
 
     Returns:
         bool: True if no errors were found in manifest. False otherwise
@@ -130,7 +136,23 @@ def is_valid_manifest_format(
         manifest_is_valid = _validate_manifest_column_names(
             manifest_column_names_to_validators, enums_to_validators, error_on_empty_url
         )
-        if line_limit is None or line_limit > 1:
+        if line_limit is None and num_processes != 1:
+            manifest_is_valid = (
+                all(
+                    read_manifest_in_parallel(
+                        manifest_path,
+                        functools.partial(
+                            _validate_rows_in_process,
+                            manifest_column_names_to_validators,
+                        ),
+                        dsv_reader.reader.dialect.delimiter,
+                        num_processes=num_processes,
+                        quoting=csv.QUOTE_NONE,
+                    )
+                )
+                and manifest_is_valid
+            )
+        elif line_limit is None or line_limit > 1:
             manifest_is_valid = (
                 _validate_rows(
                     dsv_reader, manifest_column_names_to_validators, line_limit
@@ -332,7 +354,27 @@ def _log_manifest_column_names_to_validators(manifest_column_names_to_validators
         )
 
 
-def _validate_rows(dsv_reader, manifest_column_names_to_validators, line_limit=None):
+def _validate_rows_in_process(
+    manifest_column_names_to_validators, dsv_reader, first_line_number
+):
+    """
+    Validates the rows of a shard in a read_manifest_in_parallel worker,
+    raising EmptyWarning as an error there the same as in the main process
+    """
+    warnings.filterwarnings("error")
+    return _validate_rows(
+        dsv_reader,
+        manifest_column_names_to_validators,
+        first_line_number=first_line_number,
+    )
+
+
+def _validate_rows(
+    dsv_reader,
+    manifest_column_names_to_validators,
+    line_limit=None,
+    first_line_number=2,
+):
     """
     Loops over manifest rows starting from line 2, validating each row's values
     by calling validate method on the corresponding Validator subclass
@@ -356,12 +398,14 @@ def _validate_rows(dsv_reader, manifest_column_names_to_validators, line_limit=N
             up to (e.g. if line_number is 4, _validate_rows validates lines
             2 through 4 and stops). if line_number is None, then _validate_rows
             validates up to the last line in the manifest
+        first_line_number(int): the line number in the manifest of the first
+            row in dsv_reader
 
     Returns:
         bool: true if no errors were found, false otherwise
     """
     rows_are_valid = True
-    for line_number, row in enumerate(dsv_reader, 2):
+    for line_number, row in enumerate(dsv_reader, first_line_number):
         row_items = row.items()
         if len(row_items) != len(dsv_reader.fieldnames):
             logging.warning(
@@ -41,13 +41,13 @@ Attributes:
 """
 import aiohttp
 import asyncio
-import csv
 from cdislogging import get_logger
 
 import os
 import time
 
 from gen3.index import Gen3Index
+from gen3.tools.utils import ManifestReader, get_manifest_delimiter
 from gen3.utils import get_or_create_event_loop_for_thread
 
 MAX_CONCURRENT_REQUESTS = 24
@@ -215,12 +215,7 @@ async def async_verify_object_manifest(
 
     # if delimiter not specified, try to get based on file ext
     if not manifest_file_delimiter:
-        file_ext = os.path.splitext(manifest_file)
-        if file_ext[-1].lower() == ".tsv":
-            manifest_file_delimiter = "\t"
-        else:
-            # default, assume CSV
-            manifest_file_delimiter = ","
+        manifest_file_delimiter = get_manifest_delimiter(manifest_file)
 
     logging.debug(f"detected {manifest_file_delimiter} as delimiter between columns")
 
@@ -267,9 +262,7 @@ async def _verify_all_index_records_in_file(
     queue = asyncio.Queue()
     output_queue = asyncio.Queue()
 
-    with open(manifest_file, encoding="utf-8-sig") as manifest:
-        reader = csv.DictReader(manifest, delimiter=manifest_file_delimiter)
-
+    with ManifestReader(manifest_file, manifest_file_delimiter) as reader:
         for row in reader:
             new_row = {}
             for key, value in row.items():
@@ -1,5 +1,8 @@
 import os
 import csv
+import functools
+import gzip
+from array import array
 from collections import OrderedDict
 from pathlib import Path
 import sys
@@ -10,9 +13,19 @@ from datetime import datetime
 from cdislogging import get_logger
 
 from gen3.utils import get_delimiter_from_extension
+from gen3.tools.utils import read_manifest_in_parallel
 
 logging = get_logger("__name__")
 
+# size of the write buffer for merged output, rows are only flushed to disk
+# when this fills up
+OUTPUT_BUFFER_SIZE = 1024 * 1024
+OUTPUT_COMPRESSION_TYPES = ("gzip", "zstd")
+
+# length of the substrings indexed for partial matching, keys from the metadata
+# manifest shorter than this fall back to scanning every key
+PARTIAL_MATCH_NGRAM_SIZE = 4
+
 
 def _get_guids_for_manifest_row(row, data_from_indexing_manifest, config, **kwargs):
     """
@@ -51,12 +64,15 @@ def get_guids_for_manifest_row_partial_match(
     Given a row from the manifest, return the guid to use for the metadata object by
     partially matching against the keys.
 
-    WARNING: This iterates over the entire data_from_indexing_manifest dict EVERY TIME
-             IT'S CALLED. So this is O(n2).
+    When a `partial_match_index` (an _NgramIndex over the keys of
+    data_from_indexing_manifest, built once per merge by merge_guids_into_metadata)
+    is passed, each row only checks the keys that share the rarest n-gram with it
+    instead of iterating over the entire dict. Keys from the row shorter than
+    PARTIAL_MATCH_NGRAM_SIZE still iterate over the entire dict.
 
-    ANOTHER WARNING: This does not support GUIDs matching multiple rows
-                     of metadata, it only supports metadata matching multiple
-                     GUIDs.
+    WARNING: This does not support GUIDs matching multiple rows
+             of metadata, it only supports metadata matching multiple
+             GUIDs.
 
     Example:
         row = {"submitted_sample_id": "123", "foo": "bar", "fizz": "buzz"}
@@ -81,8 +97,16 @@ def get_guids_for_manifest_row_partial_match(
     logging.info(
         f"{len(data_from_indexing_manifest)} unmatched records remaining in indexing manifest file."
     )
-    for key, matching_rows in data_from_indexing_manifest.items():
-        if key_from_row in key and matching_rows:
+    index = kwargs.get("partial_match_index")
+    if index is not None:
+        matching_candidates = index.get_keys_containing(key_from_row)
+    else:
+        matching_candidates = [
+            key for key in data_from_indexing_manifest if key_from_row in key
+        ]
+    for key in matching_candidates:
+        matching_rows = data_from_indexing_manifest[key]
+        if matching_rows:
             matching_keys.append(key)
             matching_guids.extend(
                 [
@@ -99,11 +123,64 @@ def get_guids_for_manifest_row_partial_match(
     return matching_guids
 
 
+class _NgramIndex:
+    """
+    Inverted index from each n-gram in the keys of a dict to the positions of the
+    keys that contain it.
+
+    Keys deleted from the dict after the index is built are skipped when
+    searching, so the dict can shrink without rebuilding the index. Keys added
+    after the index is built are not found.
+
+    Attributes:
+        data (dict): the dict whose keys are indexed
+    """
+
+    def __init__(self, data, ngram_size=PARTIAL_MATCH_NGRAM_SIZE):
+        self.data = data
+        self.ngram_size = ngram_size
+        self.keys = list(data.keys())
+        self.postings = {}
+        for position, key in enumerate(self.keys):
+            for ngram in self._get_ngrams(key):
+                positions = self.postings.get(ngram)
+                if positions is None:
+                    positions = self.postings[ngram] = array("L")
+                positions.append(position)
+
+    def _get_ngrams(self, value):
+        return {
+            value[i : i + self.ngram_size]
+            for i in range(len(value) - self.ngram_size + 1)
+        }
+
+    def get_keys_containing(self, substring):
+        """
+        Returns:
+            List[str]: keys still in data that contain substring, in data's order
+        """
+        if len(substring) < self.ngram_size:
+            return [key for key in self.data if substring in key]
+
+        # every key containing substring contains all of its n-grams, so only
+        # the keys with the least common one need to be checked
+        candidates = min(
+            (self.postings.get(ngram, ()) for ngram in self._get_ngrams(substring)),
+            key=len,
+        )
+        return [
+            self.keys[position]
+            for position in candidates
+            if substring in self.keys[position] and self.keys[position] in self.data
+        ]
+
+
 def _get_data_from_indexing_manifest(
     manifest_file,
     config,
     delimiter="\t",
     include_all_indexing_cols_in_output=True,
+    num_processes=1,
     **kwargs,
 ):
     """
@@ -114,27 +191,34 @@ def _get_data_from_indexing_manifest(
         manifest_file (string)
         delimiter (string): delimiter used to separate entries in the file. for a tsv,
             this is \t
+        num_processes (int): number of processes to parse the manifest with, see
+            gen3.tools.utils.read_manifest_in_parallel
 
     Returns:
         column_to_matching_rows (dict): maps a key to a list and appends data from rows
             with matching columns
     """
-    key_column_name = config.get("indexing_manifest_column_name")
-
-    column_to_matching_rows = {}
-    with open(manifest_file, "rt", encoding="utf-8-sig") as csvfile:
-        csvReader = csv.DictReader(csvfile, delimiter=delimiter)
-
-        value_column_names = [item for item in [config.get("guid_column_name")] if item]
-
-        if include_all_indexing_cols_in_output:
-            value_column_names = value_column_names + csvReader.fieldnames
+    get_matching_rows = functools.partial(
+        _get_matching_rows_from_indexing_manifest,
+        config.get("indexing_manifest_column_name"),
+        config.get("guid_column_name"),
+        include_all_indexing_cols_in_output,
+    )
 
-        for row in csvReader:
-            key = str(row[key_column_name]).strip()
-            column_to_matching_rows.setdefault(key, []).append(
-                {item: row.get(item) for item in value_column_names}
+    if num_processes == 1:
+        with open(manifest_file, "rt", encoding="utf-8-sig") as csvfile:
+            column_to_matching_rows = get_matching_rows(
+                csv.DictReader(csvfile, delimiter=delimiter)
             )
+    else:
+        column_to_matching_rows = read_manifest_in_parallel(
+            manifest_file,
+            get_matching_rows,
+            delimiter,
+            num_processes=num_processes,
+            reduce_function=_extend_matching_rows,
+            initial={},
+        )
 
     logging.debug(
         f"sample data from indexing manifest file: {str(column_to_matching_rows)[:250]}"
@@ -142,6 +226,35 @@ def _get_data_from_indexing_manifest(
     return column_to_matching_rows
 
 
+def _get_matching_rows_from_indexing_manifest(
+    key_column_name,
+    guid_column_name,
+    include_all_indexing_cols_in_output,
+    rows,
+    first_line_number=2,
+):
+    """
+    Map the key column of each row to a list of the rows with that key
+    """
+    value_column_names = [item for item in [guid_column_name] if item]
+    if include_all_indexing_cols_in_output:
+        value_column_names = value_column_names + rows.fieldnames
+
+    column_to_matching_rows = {}
+    for row in rows:
+        key = str(row[key_column_name]).strip()
+        column_to_matching_rows.setdefault(key, []).append(
+            {item: row.get(item) for item in value_column_names}
+        )
+    return column_to_matching_rows
+
+
+def _extend_matching_rows(column_to_matching_rows, shard_matching_rows):
+    for key, matching_rows in shard_matching_rows.items():
+        column_to_matching_rows.setdefault(key, []).extend(matching_rows)
+    return column_to_matching_rows
+
+
 manifest_row_parsers = {
     "guids_for_manifest_row": _get_guids_for_manifest_row,
     "get_data_from_indexing_manifest": _get_data_from_indexing_manifest,
@@ -162,7 +275,30 @@ def merge_guids_into_metadata(
     manifests_mapping_config=manifests_mapping_config,
     output_filename="merged-metadata-manifest.tsv",
     include_all_indexing_cols_in_output=True,
+    output_compression=None,
+    num_processes=1,
 ):
+    """
+    Merge GUIDs from an indexing manifest into a metadata manifest, writing the
+    result to output_filename as a TSV.
+
+    All rows are written through a single buffered file handle for the whole
+    run, optionally compressed.
+
+    Args:
+        output_compression (str, optional): "gzip" or "zstd" to compress the output
+            (zstd requires the zstandard package, from the zstd extra). The
+            output_filename is used as-is, so include the appropriate extension
+            (ex: .tsv.gz)
+        num_processes (int, optional): number of processes to parse the indexing
+            manifest with
+    """
+    if output_compression and output_compression not in OUTPUT_COMPRESSION_TYPES:
+        raise ValueError(
+            f"Unsupported output compression {output_compression}, must be one of "
+            f"{OUTPUT_COMPRESSION_TYPES}"
+        )
+
     start_time = time.perf_counter()
     logging.debug(f"start time: {start_time}")
 
@@ -184,8 +320,21 @@ def merge_guids_into_metadata(
         config=manifests_mapping_config,
         delimiter=indexing_manifest_file_delimiter,
         include_all_indexing_cols_in_output=include_all_indexing_cols_in_output,
+        num_processes=num_processes,
     )
 
+    row_parser_kwargs = {}
+    if (
+        manifest_row_parsers["guids_for_manifest_row"]
+        is get_guids_for_manifest_row_partial_match
+    ):
+        logging.debug(
+            f"indexing {len(data_from_indexing_manifest)} keys for partial matching"
+        )
+        row_parser_kwargs["partial_match_index"] = _NgramIndex(
+            data_from_indexing_manifest
+        )
+
     logging.debug(
         f"Iterating over {metadata_manifest} and finding matches using dict created "
         f"from {indexing_manifest}."
@@ -210,79 +359,105 @@ def merge_guids_into_metadata(
         headers = unique_headers
 
         logging.debug(f"writing headers to {output_filename}: {headers}")
-        write_header_to_file(
-            filename=output_filename, fieldnames=headers, delimiter="\t"
-        )
-
-        logging.debug(f"beginning iteration over rows in {metadata_manifest}")
-        for row in reader:
-            guids = manifest_row_parsers["guids_for_manifest_row"](
-                row, data_from_indexing_manifest, config=manifests_mapping_config
+        with _open_output_file(output_filename, output_compression) as outfile:
+            writer = csv.DictWriter(
+                outfile, delimiter="\t", fieldnames=headers, extrasaction="ignore"
             )
+            writer.writeheader()
+            rows_written = 0
+
+            logging.debug(f"beginning iteration over rows in {metadata_manifest}")
+            for row in reader:
+                guids = manifest_row_parsers["guids_for_manifest_row"](
+                    row,
+                    data_from_indexing_manifest,
+                    config=manifests_mapping_config,
+                    **row_parser_kwargs,
+                )
+
+                if not guids:
+                    # warning but write to output anyway
+                    row.update({"guid": ""})
 
-            if not guids:
-                # warning but write to output anyway
-                row.update({"guid": ""})
-
-                if include_all_indexing_cols_in_output:
-                    row_key = manifests_mapping_config.get("row_column_name")
-                    key_id_from_row = row.get(row_key, "").strip()
-                    rows_to_add = data_from_indexing_manifest.get(key_id_from_row, {})
-
-                    for new_row in rows_to_add:
-                        for key, value in row.items():
-                            # only replace if there's content
-                            if value:
-                                new_row.update({key: value})
-                        append_row_to_file(
-                            filename=output_filename,
-                            row=new_row,
-                            fieldnames=headers,
-                            delimiter="\t",
+                    if include_all_indexing_cols_in_output:
+                        row_key = manifests_mapping_config.get("row_column_name")
+                        key_id_from_row = row.get(row_key, "").strip()
+                        rows_to_add = data_from_indexing_manifest.get(
+                            key_id_from_row, {}
                         )
-                else:
-                    append_row_to_file(
-                        filename=output_filename,
-                        row=row,
-                        fieldnames=headers,
-                        delimiter="\t",
-                    )
-            else:
-                logging.debug(f"found guids {guids} matching row: {row}")
-
-            for guid in guids:
-                row.update({"guid": guid})
-
-                if include_all_indexing_cols_in_output:
-                    row_key = manifests_mapping_config.get("row_column_name")
-                    key_id_from_row = row.get(row_key, "").strip()
-                    for new_row in data_from_indexing_manifest.get(key_id_from_row, {}):
-                        if new_row.get("guid") == guid:
+
+                        for new_row in rows_to_add:
                             for key, value in row.items():
                                 # only replace if there's content
                                 if value:
                                     new_row.update({key: value})
-                            append_row_to_file(
-                                filename=output_filename,
-                                row=new_row,
-                                fieldnames=headers,
-                                delimiter="\t",
-                            )
+                            writer.writerow(new_row)
+                            rows_written += 1
+                    else:
+                        writer.writerow(row)
+                        rows_written += 1
                 else:
-                    append_row_to_file(
-                        filename=output_filename,
-                        row=row,
-                        fieldnames=headers,
-                        delimiter="\t",
-                    )
+                    logging.debug(f"found guids {guids} matching row: {row}")
+
+                for guid in guids:
+                    row.update({"guid": guid})
+
+                    if include_all_indexing_cols_in_output:
+                        row_key = manifests_mapping_config.get("row_column_name")
+                        key_id_from_row = row.get(row_key, "").strip()
+                        for new_row in data_from_indexing_manifest.get(
+                            key_id_from_row, {}
+                        ):
+                            if new_row.get("guid") == guid:
+                                for key, value in row.items():
+                                    # only replace if there's content
+                                    if value:
+                                        new_row.update({key: value})
+                                writer.writerow(new_row)
+                                rows_written += 1
+                    else:
+                        writer.writerow(row)
+                        rows_written += 1
 
     end_time = time.perf_counter()
+    run_time = end_time - start_time
     logging.debug(f"end time: {end_time}")
-    logging.debug(f"run time: {end_time-start_time}")
+    logging.debug(f"run time: {run_time}")
+    logging.info(
+        f"wrote {rows_written} rows to {output_filename} in {run_time:.2f}s "
+        f"({rows_written / max(run_time, 1e-9):.0f} rows/s)"
+    )
 
     logging.debug(f"output file:\n{os.path.abspath(output_filename)}")
 
 
+def _open_output_file(filename, compression=None):
+    """
+    Open filename for writing text with a large buffer, optionally compressed.
+
+    Args:
+        filename (str): file to write
+        compression (str, optional): "gzip", "zstd" or None for uncompressed
+
+    Returns:
+        TextIO: file handle to write to
+    """
+    if compression == "gzip":
+        return gzip.open(filename, mode="wt", encoding="utf-8-sig")
+
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError(
+                "zstd output compression requires the zstandard package, "
+                "install it with: pip install gen3[zstd]"
+            )
+        return zstandard.open(filename, mode="wt", encoding="utf-8-sig")
+
+    return open(filename, mode="w", encoding="utf-8-sig", buffering=OUTPUT_BUFFER_SIZE)
+
+
 def write_header_to_file(filename, fieldnames, delimiter="\t"):
     """
     Writes to a file in TSV format.
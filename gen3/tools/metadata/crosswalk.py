@@ -1,6 +1,8 @@
 import asyncio
+import contextlib
 import csv
 import datetime
+import functools
 import json
 import os
 import tempfile
@@ -12,10 +14,12 @@ from cdislogging import get_logger
 from gen3.index import Gen3Index
 from gen3.metadata import Gen3Metadata
 from gen3.tools import metadata
-from gen3.utils import deep_dict_update
+from gen3.utils import BoundedAsyncExecutor, deep_dict_update
 
 MAX_GUIDS_PER_REQUEST = 2000
 MAX_CONCURRENT_REQUESTS = 5
+# target number of crosswalk rows held in memory at once when grouping rows
+MAX_ROWS_IN_MEMORY = 100000
 BASE_CSV_PARSER_SETTINGS = {
     "delimiter": ",",
     "quoting": csv.QUOTE_NONE,
@@ -224,9 +228,15 @@ async def publish_crosswalk_metadata(
     info_file=None,
     guid_type=GUID_TYPE,
     mapping_methodologies=None,
+    max_concurrent_requests=MAX_CONCURRENT_REQUESTS,
 ):
     """
     Publish crosswalk metadata from a tsv file
+
+    Rows that share any identifier value describe the same subject, so they are
+    grouped (spilling to disk for large files) and merged in file order first.
+    Each group is then merged with any existing crosswalk record and written to
+    MDS exactly once, keeping up to `max_concurrent_requests` writes in flight.
     """
     mapping_methodologies = mapping_methodologies or []
 
@@ -295,48 +305,11 @@ async def publish_crosswalk_metadata(
 
         logging.debug(f"crosswalk_columns_parts: {crosswalk_columns_parts}")
 
-        pending_requests = []
-
         logging.debug(f"Attempting to get valid GUIDs...")
         guids_available_for_use = index.get_valid_guids(count=1000)
         logging.debug(f"Got {len(guids_available_for_use)} valid GUIDs for use.")
 
-        for metadata_line in metadata_reader:
-            raw_crosswalk_metadata = {
-                key.strip(): value.strip() for key, value in metadata_line.items()
-            }
-
-            logging.debug(
-                f"raw_crosswalk_metadata: {raw_crosswalk_metadata}, "
-                f"from line: {metadata_line}"
-            )
-
-            metadata = {}
-            metadata_aliases = []
-            for column, value in raw_crosswalk_metadata.items():
-                commons_url, identifier_type, identifier_name = crosswalk_columns_parts[
-                    column
-                ]
-                metadata_aliases.append(value)
-
-                to_update = {
-                    "value": value,
-                    "type": identifier_type,
-                }
-                description = crosswalk_info.get(
-                    commons_url + "|" + identifier_name, ""
-                )
-                # only override the potentially existing description if a new one is
-                # provided by the new crosswalk
-                if description:
-                    to_update.update({"description": description})
-
-                metadata.setdefault(commons_url, {}).setdefault(
-                    identifier_name, {}
-                ).update(to_update)
-
-            logging.debug(f"new crosswalk metadata: {metadata}")
-
+        async def _publish_crosswalk_row(guid, metadata, metadata_aliases):
             # MDS does not support a deep merge, so we need to merge any existing crosswalk
             # data with this new data here before updating
 
@@ -388,31 +361,79 @@ async def publish_crosswalk_metadata(
                 },
             }
 
-            # refresh list if needed, then get a guid
-            if not guids_available_for_use:
-                guids_available_for_use = index.get_valid_guids(count=1000)
-            guid = guids_available_for_use.pop(-1)
-
             logging.info(f"crosswalk metadata for {guid}: {final_metadata}")
 
             # call update with merge to ensure this doesn't wipe out any
             # non-crosswalk namespaced blocks of metadata
             if mds_record:
-                pending_requests += [
-                    mds.async_update(
-                        guid, final_metadata, aliases=metadata_aliases, merge=True
-                    )
-                ]
-            else:
-                pending_requests += [
-                    mds.async_create(guid, final_metadata, aliases=metadata_aliases)
-                ]
+                return await mds.async_update(
+                    guid, final_metadata, aliases=metadata_aliases, merge=True
+                )
+
+            return await mds.async_create(
+                guid, final_metadata, aliases=metadata_aliases
+            )
+
+        def _get_crosswalk_rows():
+            for metadata_line in metadata_reader:
+                raw_crosswalk_metadata = {
+                    key.strip(): value.strip() for key, value in metadata_line.items()
+                }
+
+                logging.debug(
+                    f"raw_crosswalk_metadata: {raw_crosswalk_metadata}, "
+                    f"from line: {metadata_line}"
+                )
 
-            if len(pending_requests) == MAX_CONCURRENT_REQUESTS:
-                await asyncio.gather(*pending_requests)
-                pending_requests = []
+                metadata = {}
+                metadata_aliases = []
+                for column, value in raw_crosswalk_metadata.items():
+                    (
+                        commons_url,
+                        identifier_type,
+                        identifier_name,
+                    ) = crosswalk_columns_parts[column]
+                    metadata_aliases.append(value)
+
+                    to_update = {
+                        "value": value,
+                        "type": identifier_type,
+                    }
+                    description = crosswalk_info.get(
+                        commons_url + "|" + identifier_name, ""
+                    )
+                    # only override the potentially existing description if a new one is
+                    # provided by the new crosswalk
+                    if description:
+                        to_update.update({"description": description})
+
+                    metadata.setdefault(commons_url, {}).setdefault(
+                        identifier_name, {}
+                    ).update(to_update)
+
+                logging.debug(f"new crosswalk metadata: {metadata}")
+                yield metadata, metadata_aliases
+
+        def _get_publish_requests():
+            nonlocal guids_available_for_use
+
+            for metadata, metadata_aliases in _group_crosswalk_rows(
+                _get_crosswalk_rows(), max_rows_in_memory=MAX_ROWS_IN_MEMORY
+            ):
+                # refresh list if needed, then get a guid
+                if not guids_available_for_use:
+                    guids_available_for_use = index.get_valid_guids(count=1000)
+                guid = guids_available_for_use.pop(-1)
+
+                yield (
+                    guid,
+                    functools.partial(
+                        _publish_crosswalk_row, guid, metadata, metadata_aliases
+                    ),
+                )
 
-        await asyncio.gather(*pending_requests)
+        executor = BoundedAsyncExecutor(max_concurrent_requests)
+        await executor.run_all(_get_publish_requests())
 
 
 def try_delete_crosswalk_guid(auth, guid):
@@ -432,6 +453,82 @@ def try_delete_crosswalk_guid(auth, guid):
         logging.warning(e)
 
 
+def _group_crosswalk_rows(rows, max_rows_in_memory=MAX_ROWS_IN_MEMORY):
+    """
+    Group crosswalk rows that share any (non-empty) identifier value, directly or
+    through other rows, and merge each group in row order.
+
+    Only the identifier values are kept in memory while reading. Rows are
+    spilled to disk and partitioned by group so that roughly
+    `max_rows_in_memory` rows are loaded at a time when merging.
+
+    Args:
+        rows (Iterable[Tuple[dict, List[str]]]): crosswalk metadata and aliases
+            for each row
+        max_rows_in_memory (int): target number of rows per partition
+
+    Yields:
+        Tuple[dict, List[str]]: merged crosswalk metadata and deduplicated aliases
+            for each group
+    """
+    # union-find over identifier values
+    parent = {}
+
+    def _find(value):
+        root = value
+        while parent.setdefault(root, root) != root:
+            root = parent[root]
+        while parent[value] != root:
+            parent[value], value = root, parent[value]
+        return root
+
+    with tempfile.TemporaryDirectory() as spill_dir:
+        row_count = 0
+        spill_filename = os.path.join(spill_dir, "rows")
+        with open(spill_filename, "w", encoding="utf-8") as spill_file:
+            for metadata, aliases in rows:
+                identifiers = [alias for alias in aliases if alias]
+                for identifier in identifiers[1:]:
+                    root, other_root = _find(identifiers[0]), _find(identifier)
+                    if root != other_root:
+                        parent[other_root] = root
+
+                spill_file.write(json.dumps([row_count, metadata, aliases]) + "\n")
+                row_count += 1
+
+        num_partitions = max(1, -(-row_count // max_rows_in_memory))
+        partition_filenames = [
+            os.path.join(spill_dir, f"partition_{partition}")
+            for partition in range(num_partitions)
+        ]
+        with contextlib.ExitStack() as stack:
+            partition_files = [
+                stack.enter_context(open(filename, "w", encoding="utf-8"))
+                for filename in partition_filenames
+            ]
+            with open(spill_filename, encoding="utf-8") as spill_file:
+                for line in spill_file:
+                    row_number, metadata, aliases = json.loads(line)
+                    identifiers = [alias for alias in aliases if alias]
+                    # rows without identifiers can't be matched to anything
+                    key = _find(identifiers[0]) if identifiers else row_number
+                    partition_files[hash(key) % num_partitions].write(
+                        json.dumps([key, metadata, aliases]) + "\n"
+                    )
+
+        for filename in partition_filenames:
+            groups = {}
+            with open(filename, encoding="utf-8") as partition_file:
+                for line in partition_file:
+                    key, metadata, aliases = json.loads(line)
+                    group_metadata, group_aliases = groups.setdefault(key, ({}, {}))
+                    deep_dict_update(group_metadata, metadata)
+                    group_aliases.update(dict.fromkeys(aliases))
+
+            for group_metadata, group_aliases in groups.values():
+                yield group_metadata, list(group_aliases)
+
+
 def _get_crosswalk_columns_parts(column):
     commons_url, identifier_type, identifier_name = column.strip().split("|")
     return (
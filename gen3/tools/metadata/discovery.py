@@ -1,11 +1,13 @@
 import csv
 import copy
+import functools
+import hashlib
 import json
 from cdislogging import get_logger
 import tempfile
 import asyncio
 import os
-from urllib.parse import urlparse
+from urllib.parse import urlencode, urlparse
 
 import requests.exceptions
 
@@ -19,7 +21,7 @@ from gen3.tools.merge import (
     get_delimiter_from_extension,
 )
 
-from gen3.utils import make_folders_for_filename
+from gen3.utils import make_folders_for_filename, BoundedAsyncExecutor
 
 MAX_GUIDS_PER_REQUEST = 2000
 MAX_CONCURRENT_REQUESTS = 5
@@ -42,6 +44,8 @@ async def output_expanded_discovery_metadata(
     guid_type="discovery_metadata",
     output_format="tsv",
     output_filename_suffix="",
+    fields=None,
+    filters=None,
 ):
     """
     fetch discovery metadata from a commons and output to {commons}-{guid_type}.tsv or {commons}-{guid_type}.json
@@ -54,6 +58,8 @@ async def output_expanded_discovery_metadata(
         guid_type (str): intended GUID type for query, defaults to discovery_metadata
         output_format (str): format of output file (can only be either tsv or json), defaults to tsv
         output_filename_suffix (str): additional suffix for the output file name, defaults to ""
+        fields (List[str]): only export these discovery metadata fields (plus the guid), defaults to None (all fields)
+        filters (Dict[str, object]): only export records whose discovery metadata matches, see read_mds_into_cache, defaults to None
     """
 
     if output_format != "tsv" and output_format != "json":
@@ -82,6 +88,8 @@ async def output_expanded_discovery_metadata(
             guid_type,
             use_agg_mds,
             metadata_cache_dir,
+            fields=fields,
+            filters=filters,
         )
 
         # output as TSV
@@ -89,10 +97,17 @@ async def output_expanded_discovery_metadata(
             output_filename = _create_metadata_output_filename(
                 auth, guid_type, output_filename_suffix, ".tsv"
             )
+            if fields:
+                # keep the requested order, even for fields no record had
+                data_columns = [
+                    field for field in fields if field not in ("guid", "tags")
+                ]
+            else:
+                data_columns = sorted(list(all_fields - set(["tags"])))
             output_columns = (
                 ["guid"]
                 # "tags" is flattened to _tag_0 through _tag_n
-                + sorted(list(all_fields - set(["tags"])))
+                + data_columns
                 + [f"_tag_{n}" for n in range(num_tags)]
             )
             base_schema = {column: "" for column in output_columns}
@@ -144,11 +159,24 @@ async def output_expanded_discovery_metadata(
 
 
 def read_mds_into_cache(
-    limit, max_guids_per_request, mds, guid_type, use_agg_mds, metadata_cache_dir
+    limit,
+    max_guids_per_request,
+    mds,
+    guid_type,
+    use_agg_mds,
+    metadata_cache_dir,
+    fields=None,
+    filters=None,
 ):
     """
     Queries an mds instance for all metadata of a guid_type, and writes the data for each guid to a file in metadata_cache_dir
 
+    Filters with plain values are pushed down to mds as query params
+    (ex: {"study_id": ["a", "b"]} becomes ?gen3_discovery.study_id=a&gen3_discovery.study_id=b).
+    Filters with callables, and every filter when using AggMDS (which doesn't
+    support filtering), are applied to each page of results as it comes in,
+    before anything is cached. Dotted field names match nested values.
+
     Args:
         limit (int): max number of records in one operation
         max_guids_per_request (int): max number records for one request to mds
@@ -156,13 +184,18 @@ def read_mds_into_cache(
         guid_type (str): intended GUID type for query, defaults to discovery_metadata
         use_agg_mds (bool): whether to use AggMDS during export, defaults to False
         metadata_cache_dir (TemporaryDirectory): the temporary directory to write the mds query results to
+        fields (List[str], optional): only keep these discovery metadata fields
+        filters (Dict[str, object], optional): discovery metadata field to
+            either an allowed value, a list of allowed values or a callable
+            that takes the field's value and returns whether to keep the record
     """
     all_fields = set()
     num_tags = 0
+    query, local_filters = _get_discovery_query(guid_type, filters, use_agg_mds)
 
     for offset in range(0, limit, max_guids_per_request):
         partial_metadata = mds.query(
-            f"_guid_type={guid_type}",
+            query,
             return_full_metadata=True,
             limit=min(limit, max_guids_per_request),
             offset=offset,
@@ -181,18 +214,37 @@ def read_mds_into_cache(
             }
 
         if len(partial_metadata):
+            kept_metadata = {}
             for guid, guid_metadata in partial_metadata.items():
+                guid_discovery_metadata = guid_metadata["gen3_discovery"]
+                if local_filters and not _matches_discovery_filters(
+                    guid_discovery_metadata, local_filters
+                ):
+                    continue
+
+                if fields:
+                    guid_discovery_metadata = {
+                        field: guid_discovery_metadata[field]
+                        for field in fields
+                        if field in guid_discovery_metadata
+                    }
+                    guid_metadata = {
+                        **guid_metadata,
+                        "gen3_discovery": guid_discovery_metadata,
+                    }
+                kept_metadata[guid] = guid_metadata
+
                 with open(
                     f"{metadata_cache_dir}/{guid.replace('/', '_')}",
                     "w+",
                     encoding="utf-8",
                 ) as cached_guid_file:
-                    guid_discovery_metadata = guid_metadata["gen3_discovery"]
                     json.dump(guid_discovery_metadata, cached_guid_file)
                     all_fields |= set(guid_discovery_metadata.keys())
                     num_tags = max(
                         num_tags, len(guid_discovery_metadata.get("tags", []))
                     )
+            partial_metadata = kept_metadata
         else:
             break
     return (partial_metadata, all_fields, num_tags)
@@ -393,10 +445,17 @@ async def publish_discovery_metadata(
     is_unregistered_metadata=False,
     reset_unregistered_metadata=False,
     update_registered_metadata=True,
+    max_concurrent_requests=MAX_CONCURRENT_REQUESTS,
+    skip_unchanged=False,
+    delete_missing=False,
 ):
     """
     Publish discovery metadata from a tsv or json file
 
+    When skip_unchanged or delete_missing is set, the current state of mds is
+    paged through first and compared against the local file using content
+    hashes, so only records that actually differ get written.
+
     Args:
         auth (Gen3Auth): a Gen3Auth object
         metadata_filename (str): the file path of the local metadata file to be published, must be in either JSON or TSV format
@@ -407,7 +466,15 @@ async def publish_discovery_metadata(
         is_unregistered_metadata (bool): (for use by "study registration" feature only) whether to publish metadata as unregistered study metadata, defaults to False
         reset_unregistered_metadata (bool): (for use by "study registration" feature only) whether to reset existing study metadata back to unregistered study metadata if they exists in the local file, defaults to False
         update_registered_metadata (bool): (for use by "study registration" feature only) whether to update existing study metadata with new values if they exists in the local file, defaults to True
+        max_concurrent_requests (int): maximum number of requests to mds in flight at any time, defaults to MAX_CONCURRENT_REQUESTS
+        skip_unchanged (bool): whether to skip publishing records whose metadata is identical to what's already in mds, defaults to False
+        delete_missing (bool): whether to delete records of this guid_type from mds that are not in the local file, only once every create and update has succeeded, defaults to False
     """
+    if delete_missing and is_unregistered_metadata:
+        raise ValueError(
+            "delete_missing cannot be used when publishing unregistered metadata"
+        )
+
     if endpoint:
         mds = Gen3Metadata(auth_provider=auth, endpoint=endpoint)
     else:
@@ -445,127 +512,181 @@ async def publish_discovery_metadata(
             tag_columns = [
                 column for column in metadata_reader.fieldnames if "_tag_" in column
             ]
-        pending_requests = []
 
-        registered_metadata_guids = []
+        registered_metadata_guids = set()
         registered_metadata = {}
         if is_unregistered_metadata:
             if not update_registered_metadata:
-                registered_metadata_guids = mds.query(
-                    f"_guid_type={guid_type}", limit=2000, offset=0
+                registered_metadata_guids = set(
+                    get_all_mds_records(mds, f"_guid_type={guid_type}")
                 )
             else:
-                registered_metadata = mds.query(
-                    f"_guid_type={guid_type}",
-                    return_full_metadata=True,
-                    limit=2000,
-                    offset=0,
+                registered_metadata = dict(
+                    get_all_mds_records(
+                        mds, f"_guid_type={guid_type}", return_full_metadata=True
+                    )
                 )
                 registered_metadata_guids = registered_metadata.keys()
 
-        for metadata_line in metadata_reader:
-            discovery_metadata = {}
-            extra_metadata = {}
-            if is_json_metadata:
-                if "gen3_discovery" in metadata_line:
-                    # likely to be a JSON dump from the output_expanded_discovery_metadata() function
-                    discovery_metadata = metadata_line.pop("gen3_discovery")
-                    # remove unneeded fields
-                    try:
-                        del metadata_line["_guid_type"]
-                    except KeyError:
-                        pass
-                    extra_metadata = metadata_line
-                # no 'gen3_discovery' in JSON, treat entire JSON as discovery metadata
-                else:
-                    discovery_metadata = metadata_line
-            else:
-                discovery_metadata = {
-                    key: _try_parse(value) for key, value in metadata_line.items()
-                }
-
-            if guid_field is None:
-                guid = discovery_metadata.pop("guid")
-            else:
-                guid = discovery_metadata[guid_field]
-
-            if not guid:
-                logging.warning(
-                    f"{metadata_line} has no GUID information and has been skipped."
-                )
-                continue
-
-            # remove unneeded fields
-            if extra_metadata:
-                extra_metadata.pop("guid", None)
-
-            # when publishing unregistered metadata, skip those who are already
-            # registered if both reset_unregistered_metadata and
-            # update_registered_metadata are set to false
-            if (
-                is_unregistered_metadata
-                and str(guid) in registered_metadata_guids
-                and not reset_unregistered_metadata
-                and not update_registered_metadata
-            ):
-                continue
-
-            if len(tag_columns):
-                # all columns _tag_0 -> _tag_n are pushed to a "tags" column
-                coalesced_tags = [
-                    {"name": tag_name.strip(), "category": tag_category.strip()}
-                    for tag_category, tag_name in [
-                        tag.split(":")
-                        for tag in map(discovery_metadata.pop, tag_columns)
-                        if tag != ""
-                    ]
-                ]
-                discovery_metadata["tags"] = coalesced_tags
-
-            if omit_empty_values:
-                discovery_metadata = {
-                    key: value
-                    for key, value in discovery_metadata.items()
-                    if value not in ["", [], {}]
-                }
-
-            new_guid_type = guid_type
+        # content hashes of what's currently in mds, used to only publish
+        # records that differ from the local file
+        existing_metadata_hashes = None
+        published_guids = set()
+        publish_counts = {"created": 0, "updated": 0, "unchanged": 0, "deleted": 0}
+        if skip_unchanged or delete_missing:
+            existing_guid_types = [guid_type]
             if is_unregistered_metadata:
-                if reset_unregistered_metadata or (
-                    str(guid) not in registered_metadata_guids
+                existing_guid_types.append(f"unregistered_{guid_type}")
+
+            existing_metadata_hashes = {}
+            for existing_guid_type in existing_guid_types:
+                for guid, metadata in get_all_mds_records(
+                    mds, f"_guid_type={existing_guid_type}", return_full_metadata=True
                 ):
-                    # only set GUID type to "unregistered_discovery_metadata"
-                    # for unregistered metadata, or reset_unregistered_metadata is set
-                    new_guid_type = f"unregistered_{guid_type}"
-                elif str(guid) in registered_metadata_guids:
-                    if update_registered_metadata:
-                        existing_registered_metadata = {}
+                    existing_metadata_hashes[guid] = get_metadata_hash(metadata)
+            logging.info(
+                f"got {len(existing_metadata_hashes)} existing records to compare against"
+            )
+
+        def _get_publish_requests():
+            # requests are generated lazily so the executor only reads as far
+            # into the file as the number of open request slots
+            for metadata_line in metadata_reader:
+                discovery_metadata = {}
+                extra_metadata = {}
+                if is_json_metadata:
+                    if "gen3_discovery" in metadata_line:
+                        # likely to be a JSON dump from the output_expanded_discovery_metadata() function
+                        discovery_metadata = metadata_line.pop("gen3_discovery")
+                        # remove unneeded fields
                         try:
-                            existing_registered_metadata = registered_metadata.get(
-                                str(guid)
-                            ).get("gen3_discovery")
-                        except AttributeError:
+                            del metadata_line["_guid_type"]
+                        except KeyError:
                             pass
-                        discovery_metadata = {
-                            **existing_registered_metadata,
-                            **discovery_metadata,
-                        }
+                        extra_metadata = metadata_line
+                    # no 'gen3_discovery' in JSON, treat entire JSON as discovery metadata
                     else:
-                        logging.warning(f"{guid} is not already registered. Skipping.")
+                        discovery_metadata = metadata_line
+                else:
+                    discovery_metadata = {
+                        key: _try_parse(value) for key, value in metadata_line.items()
+                    }
+
+                if guid_field is None:
+                    guid = discovery_metadata.pop("guid")
+                else:
+                    guid = discovery_metadata[guid_field]
+
+                if not guid:
+                    logging.warning(
+                        f"{metadata_line} has no GUID information and has been skipped."
+                    )
+                    continue
+
+                published_guids.add(str(guid))
+
+                # remove unneeded fields
+                if extra_metadata:
+                    extra_metadata.pop("guid", None)
+
+                # when publishing unregistered metadata, skip those who are already
+                # registered if both reset_unregistered_metadata and
+                # update_registered_metadata are set to false
+                if (
+                    is_unregistered_metadata
+                    and str(guid) in registered_metadata_guids
+                    and not reset_unregistered_metadata
+                    and not update_registered_metadata
+                ):
+                    continue
+
+                if len(tag_columns):
+                    # all columns _tag_0 -> _tag_n are pushed to a "tags" column
+                    coalesced_tags = [
+                        {"name": tag_name.strip(), "category": tag_category.strip()}
+                        for tag_category, tag_name in [
+                            tag.split(":")
+                            for tag in map(discovery_metadata.pop, tag_columns)
+                            if tag != ""
+                        ]
+                    ]
+                    discovery_metadata["tags"] = coalesced_tags
+
+                if omit_empty_values:
+                    discovery_metadata = {
+                        key: value
+                        for key, value in discovery_metadata.items()
+                        if value not in ["", [], {}]
+                    }
+
+                new_guid_type = guid_type
+                if is_unregistered_metadata:
+                    if reset_unregistered_metadata or (
+                        str(guid) not in registered_metadata_guids
+                    ):
+                        # only set GUID type to "unregistered_discovery_metadata"
+                        # for unregistered metadata, or reset_unregistered_metadata is set
+                        new_guid_type = f"unregistered_{guid_type}"
+                    elif str(guid) in registered_metadata_guids:
+                        if update_registered_metadata:
+                            existing_registered_metadata = {}
+                            try:
+                                existing_registered_metadata = registered_metadata.get(
+                                    str(guid)
+                                ).get("gen3_discovery")
+                            except AttributeError:
+                                pass
+                            discovery_metadata = {
+                                **existing_registered_metadata,
+                                **discovery_metadata,
+                            }
+                        else:
+                            logging.warning(
+                                f"{guid} is not already registered. Skipping."
+                            )
+                            continue
+
+                metadata = get_discovery_metadata(
+                    provided_metadata=discovery_metadata, guid_type=new_guid_type
+                )
+                if extra_metadata:
+                    metadata = {**metadata, **extra_metadata}
+
+                if existing_metadata_hashes is not None:
+                    existing_hash = existing_metadata_hashes.get(str(guid))
+                    if existing_hash is None:
+                        publish_counts["created"] += 1
+                    elif skip_unchanged and existing_hash == get_metadata_hash(
+                        metadata
+                    ):
+                        publish_counts["unchanged"] += 1
                         continue
+                    else:
+                        publish_counts["updated"] += 1
 
-            metadata = get_discovery_metadata(
-                provided_metadata=discovery_metadata, guid_type=new_guid_type
-            )
-            if extra_metadata:
-                metadata = {**metadata, **extra_metadata}
+                yield (
+                    guid,
+                    functools.partial(mds.async_create, guid, metadata, overwrite=True),
+                )
 
-            pending_requests += [mds.async_create(guid, metadata, overwrite=True)]
-            if len(pending_requests) == MAX_CONCURRENT_REQUESTS:
-                await asyncio.gather(*pending_requests)
-                pending_requests = []
+        executor = BoundedAsyncExecutor(max_concurrent_requests)
+        # raises if any create or update failed, so nothing gets deleted after a
+        # partially failed publish
+        await executor.run_all(_get_publish_requests())
+
+    if delete_missing:
+        # only known once the whole file has been read
+        missing_guids = existing_metadata_hashes.keys() - published_guids
+        publish_counts["deleted"] = len(missing_guids)
+        await executor.run_all(
+            (guid, functools.partial(mds.async_delete, guid)) for guid in missing_guids
+        )
 
-        await asyncio.gather(*pending_requests)
+    if existing_metadata_hashes is not None:
+        logging.info(
+            f"published changes for {metadata_filename}: "
+            + ", ".join(f"{count} {name}" for name, count in publish_counts.items())
+        )
 
 
 def get_discovery_metadata(
@@ -586,6 +707,62 @@ def get_discovery_metadata(
     }
 
 
+def get_all_mds_records(
+    mds, query, return_full_metadata=False, page_size=MAX_GUIDS_PER_REQUEST
+):
+    """
+    Page through every record matching the query instead of stopping after the
+    first page of results.
+
+    Args:
+        mds (Gen3Metadata): an instance of Gen3Metadata for an endpoint
+        query (str): mds query, ex: "_guid_type=discovery_metadata"
+        return_full_metadata (bool, optional): whether to yield the metadata
+            along with the guid
+        page_size (int, optional): max number of records for one request to mds
+
+    Yields:
+        str: guid
+            OR if return_full_metadata=True
+        Tuple[str, Dict]: guid and its metadata
+    """
+    offset = 0
+    while True:
+        records = mds.query(
+            query,
+            return_full_metadata=return_full_metadata,
+            limit=page_size,
+            offset=offset,
+        )
+        if not records:
+            break
+
+        if return_full_metadata:
+            yield from records.items()
+        else:
+            yield from records
+
+        # mds may cap the limit lower than requested, so only stop on an
+        # empty page
+        offset += len(records)
+
+
+def get_metadata_hash(metadata):
+    """
+    Return a content hash of a metadata blob that doesn't depend on key order.
+
+    Args:
+        metadata (Dict): metadata blob
+
+    Returns:
+        bytes: 16 byte digest
+    """
+    return hashlib.md5(
+        json.dumps(metadata, sort_keys=True, separators=(",", ":")).encode("utf-8"),
+        usedforsecurity=False,
+    ).digest()
+
+
 def try_delete_discovery_guid(auth, guid):
     """
     Deletes all discovery metadata under [guid] if it exists
@@ -624,6 +801,50 @@ def sanitize_tsv_row(tsv_row, escape_new_lines=True):
     return sanitized
 
 
+def _get_discovery_query(guid_type, filters, use_agg_mds):
+    """
+    Build the mds query for discovery metadata, pushing down as many filters as
+    possible.
+
+    Returns:
+        Tuple[str, Dict]: the query string and the filters that must be applied
+            locally instead
+    """
+    query_params = [("_guid_type", guid_type)]
+    local_filters = {}
+    for field, expected in (filters or {}).items():
+        if use_agg_mds or callable(expected):
+            local_filters[field] = expected
+            continue
+
+        values = expected if isinstance(expected, (list, tuple, set)) else [expected]
+        query_params.extend((f"gen3_discovery.{field}", value) for value in values)
+
+    return urlencode(query_params), local_filters
+
+
+def _matches_discovery_filters(discovery_metadata, filters):
+    """
+    Local equivalent of mds filtering: values are compared as strings and a
+    list of values matches any of them.
+    """
+    for field, expected in filters.items():
+        value = discovery_metadata
+        for key in field.split("."):
+            value = value.get(key) if isinstance(value, dict) else None
+
+        if callable(expected):
+            if not expected(value):
+                return False
+            continue
+
+        values = expected if isinstance(expected, (list, tuple, set)) else [expected]
+        if value is None or str(value) not in {str(item) for item in values}:
+            return False
+
+    return True
+
+
 def _try_parse(data):
     if data:
         data = data.replace("\\n", "\n")
@@ -1,4 +1,5 @@
 import csv
+import functools
 import json
 import tempfile
 import asyncio
@@ -8,6 +9,7 @@ from cdislogging import get_logger
 from urllib.parse import urlparse
 
 from gen3.metadata import Gen3Metadata
+from gen3.utils import BoundedAsyncExecutor
 
 from gen3.tools.metadata.discovery import (
     MAX_GUIDS_PER_REQUEST,
@@ -179,6 +181,7 @@ async def publish_discovery_object_metadata(
     endpoint=None,
     guid_type="discovery_metadata",
     overwrite=False,
+    max_concurrent_requests=MAX_CONCURRENT_REQUESTS,
 ):
     """
     Publish discovery objects from a TSV file
@@ -189,6 +192,7 @@ async def publish_discovery_object_metadata(
         endpoint (str): HOSTNAME of a Gen3 environment, defaults to None
         guid_type (str): intended GUID type for publishing, defaults to discovery_metadata
         overwrite (bool): whether to allow replacing objects to a dataset_guid instead of appending
+        max_concurrent_requests (int): maximum number of requests to mds in flight at any time, defaults to MAX_CONCURRENT_REQUESTS
     """
     if not is_valid_object_manifest(metadata_filename):
         raise ValueError(f"Invalid objects file supplied {metadata_filename}")
@@ -207,7 +211,6 @@ async def publish_discovery_object_metadata(
     with open(metadata_filename, encoding="utf-8") as metadata_file:
         csv_parser_setting = {**BASE_CSV_PARSER_SETTINGS, "delimiter": delimiter}
         metadata_reader = csv.DictReader(metadata_file, **{**csv_parser_setting})
-        pending_requests = []
         dataset_dict = {}
 
         for obj_line in metadata_reader:
@@ -226,45 +229,53 @@ async def publish_discovery_object_metadata(
                 dataset_dict[dataset_guid] = {"objects": []}
             dataset_dict[dataset_guid]["objects"].append(obj_line)
 
-        for dataset_guid in dataset_dict.keys():
-            # if dataset_guid already exists, update (noting the use of --overwrite), if it doesn’t already exist, create it
-            try:
-                curr_dataset_metadata = mds.get(dataset_guid)
-            except requests.exceptions.HTTPError as e:
-                if e.response.status_code == 404:
-                    curr_dataset_metadata = get_discovery_metadata(
-                        provided_metadata={}, guid_type=guid_type
-                    )
-                else:
-                    raise
-
-            # allow replacing instead of appending
-            if overwrite or not (
-                "objects" in curr_dataset_metadata["gen3_discovery"].keys()
-            ):
-                curr_dataset_metadata["gen3_discovery"]["objects"] = dataset_dict[
-                    dataset_guid
-                ]["objects"]
-            else:
-                curr_dataset_dict = {
-                    curr_obj["guid"]: curr_obj
-                    for curr_obj in curr_dataset_metadata["gen3_discovery"]["objects"]
-                }
-                for new_obj in dataset_dict[dataset_guid]["objects"]:
-                    curr_dataset_dict[new_obj["guid"]] = new_obj
-
-                curr_dataset_metadata["gen3_discovery"]["objects"] = list(
-                    curr_dataset_dict.values()
+    async def _publish_dataset_objects(dataset_guid, objects):
+        # if dataset_guid already exists, update (noting the use of --overwrite), if it doesn’t already exist, create it
+        try:
+            # Gen3Metadata.async_get doesn't send auth, so use the authenticated
+            # get in a thread to keep metadata only readable when logged in working
+            curr_dataset_metadata = await asyncio.to_thread(mds.get, dataset_guid)
+        except requests.exceptions.HTTPError as e:
+            if e.response.status_code == 404:
+                curr_dataset_metadata = get_discovery_metadata(
+                    provided_metadata={}, guid_type=guid_type
                 )
+            else:
+                raise
+
+        # allow replacing instead of appending
+        if overwrite or not (
+            "objects" in curr_dataset_metadata["gen3_discovery"].keys()
+        ):
+            curr_dataset_metadata["gen3_discovery"]["objects"] = objects
+        else:
+            curr_dataset_dict = {
+                curr_obj["guid"]: curr_obj
+                for curr_obj in curr_dataset_metadata["gen3_discovery"]["objects"]
+            }
+            for new_obj in objects:
+                curr_dataset_dict[new_obj["guid"]] = new_obj
+
+            curr_dataset_metadata["gen3_discovery"]["objects"] = list(
+                curr_dataset_dict.values()
+            )
 
-            pending_requests += [
-                mds.async_create(dataset_guid, curr_dataset_metadata, overwrite=True)
-            ]
-            if len(pending_requests) == MAX_CONCURRENT_REQUESTS:
-                await asyncio.gather(*pending_requests)
-                pending_requests = []
-            logging.info(f"Updated objects for Discovery Dataset: {dataset_guid}")
-        await asyncio.gather(*pending_requests)
+        response = await mds.async_create(
+            dataset_guid, curr_dataset_metadata, overwrite=True
+        )
+        logging.info(f"Updated objects for Discovery Dataset: {dataset_guid}")
+        return response
+
+    executor = BoundedAsyncExecutor(max_concurrent_requests)
+    await executor.run_all(
+        (
+            dataset_guid,
+            functools.partial(
+                _publish_dataset_objects, dataset_guid, dataset["objects"]
+            ),
+        )
+        for dataset_guid, dataset in dataset_dict.items()
+    )
 
 
 def try_delete_discovery_objects_from_dict(auth, delete_objs):
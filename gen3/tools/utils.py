@@ -1,8 +1,15 @@
 from abc import ABC
 from base64 import b64encode, b64decode
 
+from collections.abc import MutableMapping
+from concurrent.futures import ProcessPoolExecutor
 import csv
 from enum import Enum, unique
+import functools
+import io
+import itertools
+import mmap
+import operator
 import os
 import string
 import sys
@@ -62,38 +69,675 @@ TYPE_COLUMN_NAME = ["type", "types"]
 
 ALIASES_COLUMN_NAME = ["alias", "aliases"]
 
+# manifest formats, determined by file extension. csv is the default
+PARQUET_FILE_EXTENSIONS = [".parquet", ".pq"]
+ARROW_FILE_EXTENSIONS = [".arrow", ".feather", ".ipc"]
+COLUMNAR_MANIFEST_FORMATS = ["parquet", "arrow"]
+
+# rows per record batch when reading or writing columnar manifests
+ARROW_BATCH_SIZE = 65536
+
+# target size in bytes of each shard of a manifest parsed in parallel
+MANIFEST_SHARD_SIZE = 64 * 1024 * 1024
+
+# operators allowed in manifest read filters: (column, op, value)
+MANIFEST_FILTER_OPERATORS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+
+def get_manifest_format(manifest_file):
+    """
+    Get the format of a manifest from its file extension
+
+    Args:
+        manifest_file(str): path to the manifest
+
+    Returns:
+        str: "tsv", "parquet", "arrow" or "csv" (the default)
+    """
+    manifest_file_ext = os.path.splitext(manifest_file)[-1].lower()
+    if manifest_file_ext == ".tsv":
+        return "tsv"
+    if manifest_file_ext in PARQUET_FILE_EXTENSIONS:
+        return "parquet"
+    if manifest_file_ext in ARROW_FILE_EXTENSIONS:
+        return "arrow"
+    return "csv"
+
+
+def get_manifest_delimiter(manifest_file):
+    """
+    Get the delimiter of a delimiter-separated manifest from its file extension,
+    None for columnar formats
+    """
+    manifest_format = get_manifest_format(manifest_file)
+    if manifest_format in COLUMNAR_MANIFEST_FORMATS:
+        return None
+    return "\t" if manifest_format == "tsv" else ","
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.dataset
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError(
+            "Parquet and Arrow files require the pyarrow package, "
+            "install it with: pip install gen3[arrow]"
+        )
+    return pyarrow
+
+
+class ManifestReader(object):
+    """
+    Reads rows from a CSV, TSV, Parquet or Arrow IPC manifest as dicts, like a
+    csv.DictReader. Values from columnar manifests are converted to strings the way
+    they'd appear in a CSV, so the rest of the tools can treat every format the same.
+
+    For columnar manifests, only the requested columns are read and filters are
+    pushed down to the file, so row groups that can't match are skipped without
+    being decoded. iter_batches() provides the pyarrow.RecordBatch objects
+    themselves without any conversion.
+
+    Example:
+        with ManifestReader("manifest.parquet", columns=["guid", "md5"],
+                filters=[("size", ">", 0)]) as reader:
+            for row in reader:
+                ...
+
+    Attributes:
+        manifest_file(str): path to the manifest
+        fieldnames(list[str]): columns in the manifest, or the requested columns
+        manifest_format(str): "csv", "tsv", "parquet" or "arrow"
+    """
+
+    def __init__(
+        self,
+        manifest_file,
+        manifest_file_delimiter=None,
+        columns=None,
+        filters=None,
+        batch_size=ARROW_BATCH_SIZE,
+    ):
+        """
+        Args:
+            manifest_file(str): path to the manifest
+            manifest_file_delimiter(str): delimiter for CSV/TSV manifests, determined
+                from the file extension if not provided
+            columns(list[str]): only read these columns
+            filters(list[tuple]): only read rows matching all of these
+                (column, op, value) filters. op is one of ==, !=, <, <=, >, >=, in
+                or "not in". CSV/TSV values are strings, so compare them to strings
+            batch_size(int): rows per record batch for columnar manifests
+        """
+        self.manifest_file = manifest_file
+        self.manifest_format = get_manifest_format(manifest_file)
+        self.columns = columns
+        self.filters = filters or []
+        self.batch_size = batch_size
+        self.fieldnames = None
+
+        self._delimiter = manifest_file_delimiter or get_manifest_delimiter(
+            manifest_file
+        )
+        self._file = None
+        self._reader = None
+        self._scanner = None
+
+        for _, op, _ in self.filters:
+            if op not in MANIFEST_FILTER_OPERATORS and op not in ("in", "not in"):
+                raise ValueError(f"Unsupported manifest filter operator: {op}")
+
+    def __enter__(self):
+        if self.manifest_format in COLUMNAR_MANIFEST_FORMATS:
+            pyarrow = _import_pyarrow()
+            dataset = pyarrow.dataset.dataset(
+                self.manifest_file,
+                format="parquet" if self.manifest_format == "parquet" else "ipc",
+            )
+            self._scanner = dataset.scanner(
+                columns=self.columns,
+                filter=self._get_filter_expression(),
+                batch_size=self.batch_size,
+            )
+            self.fieldnames = list(self.columns or dataset.schema.names)
+        else:
+            csv.field_size_limit(sys.maxsize)
+            self._file = open(self.manifest_file, "r", encoding="utf-8-sig")
+            self._reader = csv.DictReader(
+                self._file, delimiter=self._delimiter, restval=""
+            )
+            self.fieldnames = self._reader.fieldnames or []
+            if self.columns:
+                self.fieldnames = [
+                    column for column in self.fieldnames if column in self.columns
+                ]
+        return self
+
+    def __exit__(self, *args):
+        if self._file:
+            self._file.close()
+
+    def __iter__(self):
+        if self._scanner is not None:
+            for batch in self.iter_batches():
+                for row in batch.to_pylist():
+                    yield {
+                        column: _get_manifest_string(value)
+                        for column, value in row.items()
+                    }
+            return
+
+        for row in self._reader:
+            if not all(
+                self._matches_filter(row, *manifest_filter)
+                for manifest_filter in self.filters
+            ):
+                continue
+            if self.columns:
+                row = {column: row.get(column, "") for column in self.fieldnames}
+            yield row
+
+    def iter_batches(self):
+        """
+        Yields the pyarrow.RecordBatch objects of a columnar manifest, with only the
+        requested columns and rows
+        """
+        if self._scanner is None:
+            raise ValueError(
+                f"{self.manifest_file} is not a columnar manifest, record batches are "
+                "only available for Parquet and Arrow manifests"
+            )
+        yield from self._scanner.to_batches()
+
+    def _get_filter_expression(self):
+        if not self.filters:
+            return None
+
+        pyarrow = _import_pyarrow()
+        expression = None
+        for column, op, value in self.filters:
+            field = pyarrow.dataset.field(column)
+            if op == "in":
+                condition = field.isin(value)
+            elif op == "not in":
+                condition = ~field.isin(value)
+            else:
+                condition = MANIFEST_FILTER_OPERATORS[op](field, value)
+            expression = condition if expression is None else expression & condition
+        return expression
+
+    @staticmethod
+    def _matches_filter(row, column, op, value):
+        if op == "in":
+            return row.get(column) in value
+        if op == "not in":
+            return row.get(column) not in value
+        return MANIFEST_FILTER_OPERATORS[op](row.get(column), value)
+
+
+class ManifestWriter(object):
+    """
+    Writes rows to a CSV, TSV, Parquet or Arrow IPC manifest from dicts, like a
+    csv.DictWriter with extrasaction="ignore". The format is determined from the
+    file extension.
+
+    Columnar manifests are written in record batches of batch_size rows. Every
+    column is written as a string, except size which is written as an integer so it
+    can be filtered on when read.
+
+    Example:
+        with ManifestWriter("manifest.parquet", ["guid", "md5", "size"]) as writer:
+            writer.writeheader()
+            writer.writerow({"guid": "...", "md5": "...", "size": 1})
+    """
+
+    def __init__(
+        self,
+        manifest_file,
+        fieldnames,
+        manifest_file_delimiter=None,
+        batch_size=ARROW_BATCH_SIZE,
+    ):
+        """
+        Args:
+            manifest_file(str): path to the manifest
+            fieldnames(list[str]): columns to write
+            manifest_file_delimiter(str): delimiter for CSV/TSV manifests, determined
+                from the file extension if not provided
+            batch_size(int): rows per record batch for columnar manifests
+        """
+        self.manifest_file = manifest_file
+        self.manifest_format = get_manifest_format(manifest_file)
+        self.fieldnames = list(fieldnames)
+        self.batch_size = batch_size
+
+        self._delimiter = manifest_file_delimiter or get_manifest_delimiter(
+            manifest_file
+        )
+        self._file = None
+        self._writer = None
+        self._arrow_writer = None
+        self._schema = None
+        self._rows = []
+
+    def __enter__(self):
+        if self.manifest_format in COLUMNAR_MANIFEST_FORMATS:
+            pyarrow = _import_pyarrow()
+            self._schema = pyarrow.schema(
+                [
+                    (
+                        column,
+                        pyarrow.int64()
+                        if column == SIZE_STANDARD_KEY
+                        else pyarrow.string(),
+                    )
+                    for column in self.fieldnames
+                ]
+            )
+            if self.manifest_format == "parquet":
+                self._arrow_writer = pyarrow.parquet.ParquetWriter(
+                    self.manifest_file, self._schema
+                )
+            else:
+                self._arrow_writer = pyarrow.ipc.new_file(
+                    self.manifest_file, self._schema
+                )
+        else:
+            self._file = open(self.manifest_file, "w")
+            self._writer = csv.DictWriter(
+                self._file,
+                delimiter=self._delimiter,
+                fieldnames=self.fieldnames,
+                extrasaction="ignore",
+            )
+        return self
+
+    def __exit__(self, *args):
+        if self._arrow_writer is not None:
+            self._write_batch()
+            self._arrow_writer.close()
+        if self._file:
+            self._file.close()
+
+    def writeheader(self):
+        """
+        Write the header row, columnar manifests always have their columns so this
+        does nothing for them
+        """
+        if self._writer:
+            self._writer.writeheader()
+
+    def writerow(self, row):
+        if self._writer:
+            self._writer.writerow(row)
+            return
+
+        self._rows.append(
+            {
+                column: _get_arrow_value(
+                    row.get(column), is_integer=column == SIZE_STANDARD_KEY
+                )
+                for column in self.fieldnames
+            }
+        )
+        if len(self._rows) >= self.batch_size:
+            self._write_batch()
+
+    def writerows(self, rows):
+        for row in rows:
+            self.writerow(row)
+
+    def _write_batch(self):
+        if not self._rows:
+            return
+        pyarrow = _import_pyarrow()
+        self._arrow_writer.write_batch(
+            pyarrow.RecordBatch.from_pylist(self._rows, schema=self._schema)
+        )
+        self._rows = []
+
+
+def _get_manifest_string(value):
+    """
+    Convert a value from a columnar manifest to how it would be in a CSV
+    """
+    if value is None:
+        return ""
+    return str(value)
+
+
+def _get_arrow_value(value, is_integer=False):
+    """
+    Convert a value to how it's stored in a columnar manifest, empty values are null
+    """
+    if value is None or value == "":
+        return None
+    if is_integer:
+        return int(value)
+    return str(value)
+
+
+class ManifestColumns(object):
+    """
+    Column names shared by every ManifestRecord with the same columns, so each
+    record only has to store its values. Get instances with get() instead of
+    creating them so that they're shared.
+
+    Attributes:
+        names(tuple[str]): interned column names, in order
+        indexes(dict): column name to index of its value
+    """
+
+    _instances = {}
+
+    def __init__(self, names):
+        self.names = tuple(sys.intern(name) for name in names)
+        self.indexes = {name: index for index, name in enumerate(self.names)}
+
+    @classmethod
+    def get(cls, names):
+        names = tuple(names)
+        columns = cls._instances.get(names)
+        if columns is None:
+            columns = cls._instances.setdefault(names, cls(names))
+        return columns
+
+
+class ManifestRecord(MutableMapping):
+    """
+    Compact, dict-like manifest row for holding many rows in memory.
+
+    Rows only store a tuple of values plus a reference to a shared ManifestColumns,
+    instead of a hash table of repeated keys per row. Lowercase hex md5s are stored
+    as 16 bytes and converted back to hex when read, and sizes are stored as ints.
+
+    Supports everything a dict of the row would (record["md5"], get(), items(),
+    assigning and deleting columns, == with a dict), except for being passed to
+    things that need an actual dict, like json.dumps. Use dict(record) for those.
+
+    Example:
+        record = ManifestRecord({"guid": "dg.1234/0", "md5": "f7cb...", "size": 1})
+    """
+
+    __slots__ = ("_columns", "_values")
+
+    def __init__(self, row=None):
+        """
+        Args:
+            row(dict or ManifestRecord): column names to values
+        """
+        if isinstance(row, ManifestRecord):
+            self._columns = row._columns
+            self._values = row._values
+            return
+
+        row = row or {}
+        self._columns = ManifestColumns.get(row.keys())
+        self._values = tuple(
+            _compact_manifest_value(name, value)
+            for name, value in zip(self._columns.names, row.values())
+        )
+
+    def __getitem__(self, name):
+        value = self._values[self._columns.indexes[name]]
+        if type(value) is bytes:
+            return value.hex()
+        return value
+
+    def __setitem__(self, name, value):
+        value = _compact_manifest_value(name, value)
+        index = self._columns.indexes.get(name)
+        if index is None:
+            self._columns = ManifestColumns.get(self._columns.names + (name,))
+            self._values = self._values + (value,)
+        else:
+            self._values = self._values[:index] + (value,) + self._values[index + 1 :]
+
+    def __delitem__(self, name):
+        index = self._columns.indexes[name]
+        names = self._columns.names
+        self._columns = ManifestColumns.get(names[:index] + names[index + 1 :])
+        self._values = self._values[:index] + self._values[index + 1 :]
+
+    def __contains__(self, name):
+        return name in self._columns.indexes
+
+    def __iter__(self):
+        return iter(self._columns.names)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({dict(self)})"
+
+    def __reduce__(self):
+        # rebuild from a dict so unpickled records share ManifestColumns again
+        return (self.__class__, (dict(self),))
+
+    def copy(self):
+        return self.__class__(self)
+
+
+def _compact_manifest_value(name, value):
+    """
+    Convert a manifest value to how ManifestRecord stores it
+    """
+    if name == MD5_STANDARD_KEY and type(value) is str and len(value) == 32:
+        try:
+            md5 = bytes.fromhex(value)
+        except ValueError:
+            return value
+        # only if it'll convert back exactly
+        if md5.hex() == value:
+            return md5
+    elif name == SIZE_STANDARD_KEY and type(value) is str and value.isdigit():
+        return int(value)
+    return value
+
+
+def read_manifest_in_parallel(
+    manifest_file,
+    parse_rows,
+    manifest_file_delimiter=None,
+    num_processes=None,
+    shard_size=None,
+    reduce_function=None,
+    initial=None,
+    **reader_kwargs,
+):
+    """
+    Parse a large CSV/TSV manifest on multiple cores.
+
+    The manifest is split into shards of about shard_size bytes at newline-aligned
+    byte offsets and each shard is parsed in a process pool. In each worker,
+    parse_rows(rows, first_line_number) is called with a csv.DictReader over the
+    rows in that shard (with the manifest's header as fieldnames) and the line
+    number of the shard's first row in the manifest, where the header is line 1.
+
+    Since shards are split on newlines, no value in the manifest can contain a
+    newline.
+
+    parse_rows and its return value have to be picklable, so parse_rows should be
+    a module-level function, or a functools.partial of one.
+
+    Args:
+        manifest_file(str): path to the manifest
+        parse_rows(callable): parse_rows(rows, first_line_number) is called for
+            every shard and returns that shard's result
+        manifest_file_delimiter(str): delimiter, determined from the file extension
+            if not provided
+        num_processes(int): number of processes to parse with, defaults to the
+            number of cores. with 1, shards are parsed in this process
+        shard_size(int): approximate number of bytes per shard, defaults to
+            MANIFEST_SHARD_SIZE
+        reduce_function(callable): if provided, results are combined in file order
+            with reduce_function(accumulated, result), starting from initial
+        initial: initial value for reduce_function
+        **reader_kwargs: additional arguments to csv.DictReader, ex: restval
+
+    Returns:
+        list: parse_rows result for every shard in file order, or the result of
+            reduce_function if provided
+    """
+    delimiter = manifest_file_delimiter or get_manifest_delimiter(manifest_file)
+    if delimiter is None:
+        raise ValueError(
+            f"{manifest_file} is not a delimiter-separated manifest, "
+            "use ManifestReader to read columnar manifests"
+        )
+
+    with open(manifest_file, "rb") as manifest:
+        header = manifest.readline()
+    fieldnames = next(csv.reader([header.decode("utf-8-sig")], delimiter=delimiter), [])
+
+    shard_offsets = _get_manifest_shards(
+        manifest_file, len(header), shard_size or MANIFEST_SHARD_SIZE
+    )
+    logging.debug(f"parsing {manifest_file} in {len(shard_offsets)} shards")
+    count_lines = functools.partial(_count_manifest_lines, manifest_file)
+    parse_shard = functools.partial(
+        _parse_manifest_shard,
+        manifest_file,
+        fieldnames,
+        delimiter,
+        parse_rows,
+        reader_kwargs,
+    )
+
+    def _get_shards(line_counts):
+        # the header is line 1, so the first shard starts on line 2
+        first_line_numbers = itertools.accumulate(line_counts, initial=2)
+        return [
+            (start, end, first_line_number)
+            for (start, end), first_line_number in zip(
+                shard_offsets, first_line_numbers
+            )
+        ]
+
+    def _get_results(results):
+        if reduce_function is None:
+            return list(results)
+        return functools.reduce(reduce_function, results, initial)
+
+    if num_processes == 1 or len(shard_offsets) <= 1:
+        shards = _get_shards(map(count_lines, shard_offsets[:-1]))
+        return _get_results(map(parse_shard, shards))
+
+    with ProcessPoolExecutor(max_workers=num_processes) as executor:
+        # each worker counts the lines in its own shard, so the manifest is never
+        # read in this process before parsing starts
+        shards = _get_shards(executor.map(count_lines, shard_offsets[:-1]))
+        return _get_results(executor.map(parse_shard, shards))
+
+
+def _get_manifest_shards(manifest_file, header_size, shard_size):
+    """
+    Split the rows of a manifest into shards that start and end on a newline,
+    only seeking to each newline boundary
+
+    Returns:
+        list[tuple]: (start offset, end offset) of every shard
+    """
+    shards = []
+    file_size = os.path.getsize(manifest_file)
+    start = header_size
+    with open(manifest_file, "rb") as manifest:
+        while start < file_size:
+            manifest.seek(min(start + max(shard_size, 1), file_size) - 1)
+            manifest.readline()
+            end = manifest.tell()
+            shards.append((start, end))
+            start = end
+    return shards
+
+
+def _count_manifest_lines(manifest_file, shard):
+    """
+    Count the lines in a shard of a manifest
+    """
+    start, end = shard
+    return _read_manifest_bytes(manifest_file, start, end).count(b"\n")
+
+
+def _read_manifest_bytes(manifest_file, start, end):
+    """
+    Read bytes from start to end of a manifest, memory mapping it if possible
+    """
+    with open(manifest_file, "rb") as manifest:
+        try:
+            with mmap.mmap(manifest.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return data[start:end]
+        except (ValueError, OSError):
+            manifest.seek(start)
+            return manifest.read(end - start)
+
+
+def _parse_manifest_shard(
+    manifest_file, fieldnames, delimiter, parse_rows, reader_kwargs, shard
+):
+    start, end, first_line_number = shard
+    csv.field_size_limit(sys.maxsize)
+    text = _read_manifest_bytes(manifest_file, start, end).decode("utf-8")
+    rows = csv.DictReader(
+        io.StringIO(text, newline=""),
+        fieldnames=fieldnames,
+        delimiter=delimiter,
+        **reader_kwargs,
+    )
+    return parse_rows(rows, first_line_number)
+
 
 def get_and_verify_fileinfos_from_manifest(
-    manifest_file, manifest_file_delimiter=None, include_additional_columns=False
+    manifest_file,
+    manifest_file_delimiter=None,
+    include_additional_columns=False,
+    num_processes=1,
+    compact_rows=False,
 ):
     """
     Wrapper for above function to determine the delimiter based on file extention
     """
     # if delimiter not specified, try to get based on file ext
     if not manifest_file_delimiter:
-        manifest_file_ext = os.path.splitext(manifest_file)
-        if manifest_file_ext[-1].lower() == ".tsv":
-            manifest_file_delimiter = "\t"
-        else:
-            # default, assume CSV
-            manifest_file_delimiter = ","
+        manifest_file_delimiter = get_manifest_delimiter(manifest_file)
 
     return get_and_verify_fileinfos_from_tsv_manifest(
         manifest_file=manifest_file,
         manifest_file_delimiter=manifest_file_delimiter,
         include_additional_columns=include_additional_columns,
+        num_processes=num_processes,
+        compact_rows=compact_rows,
     )
 
 
 def get_and_verify_fileinfos_from_tsv_manifest(
-    manifest_file, manifest_file_delimiter="\t", include_additional_columns=False
+    manifest_file,
+    manifest_file_delimiter="\t",
+    include_additional_columns=False,
+    num_processes=1,
+    compact_rows=False,
 ):
     """
-    get and verify file infos from tsv manifest
+    get and verify file infos from tsv manifest, or any other format supported by
+    ManifestReader
 
     Args:
         manifest_file(str): the path to the input manifest
-        manifest_file_delimiter(str): delimiter
+        manifest_file_delimiter(str): delimiter, ignored for columnar manifests
+        num_processes(int): number of processes to parse a CSV/TSV manifest with,
+            see read_manifest_in_parallel
+        compact_rows(bool): return each file info as a ManifestRecord instead of a
+            dict, which takes much less memory for large manifests
 
     Returns:
         list(dict): list of file info
@@ -109,12 +753,8 @@ def get_and_verify_fileinfos_from_tsv_manifest(
         headers(list(str)): field names
 
     """
-    csv.field_size_limit(sys.maxsize)  # handle large values such as "package_contents"
     files = []
-    with open(manifest_file, "r", encoding="utf-8-sig") as csvfile:
-        csvReader = csv.DictReader(
-            csvfile, delimiter=manifest_file_delimiter, restval=""
-        )
+    with ManifestReader(manifest_file, manifest_file_delimiter) as csvReader:
         fieldnames = csvReader.fieldnames
         if len(fieldnames) < 2:
             logging.warning(
@@ -122,151 +762,29 @@ def get_and_verify_fileinfos_from_tsv_manifest(
             )
 
         logging.debug(f"got fieldnames from {manifest_file}: {fieldnames}")
-        pass_verification = True
-        is_row_valid = True
-        for row_number, row in enumerate(csvReader, 1):
-            output_row = {}
-            for current_column_name in row.keys():
-                output_column_name = None
-                if (
-                    current_column_name
-                    and current_column_name.lower() in GUID_COLUMN_NAMES
-                ):
-                    fieldnames[
-                        fieldnames.index(current_column_name)
-                    ] = GUID_STANDARD_KEY
-                    output_column_name = GUID_STANDARD_KEY
-                elif (
-                    current_column_name
-                    and current_column_name.lower() in FILENAME_COLUMN_NAMES
-                ):
-                    fieldnames[
-                        fieldnames.index(current_column_name)
-                    ] = FILENAME_STANDARD_KEY
-                    output_column_name = FILENAME_STANDARD_KEY
-                elif (
-                    current_column_name
-                    and current_column_name.lower() in MD5_COLUMN_NAMES
-                ):
-                    fieldnames[fieldnames.index(current_column_name)] = MD5_STANDARD_KEY
-                    output_column_name = MD5_STANDARD_KEY
-                    if not _verify_format(row[current_column_name], MD5_FORMAT):
-                        logging.error(
-                            f"ERROR: {row[current_column_name]} is not in md5 format"
-                        )
-                        is_row_valid = False
-                elif (
-                    current_column_name
-                    and current_column_name.lower() in ACLS_COLUMN_NAMES
-                ):
-                    fieldnames[fieldnames.index(current_column_name)] = ACL_STANDARD_KEY
-                    output_column_name = ACL_STANDARD_KEY
-                    if not _verify_format(row[current_column_name], ACL_FORMAT):
-                        logging.error(
-                            f"ERROR: {row[current_column_name]} is not in acl format"
-                        )
-                        is_row_valid = False
-                elif (
-                    current_column_name
-                    and current_column_name.lower() in URLS_COLUMN_NAMES
-                ):
-                    fieldnames[
-                        fieldnames.index(current_column_name)
-                    ] = URLS_STANDARD_KEY
-                    output_column_name = URLS_STANDARD_KEY
-                    if not _verify_format(row[current_column_name], URL_FORMAT):
-                        logging.error(
-                            f"ERROR: {row[current_column_name]} is not in urls format"
-                        )
-                        is_row_valid = False
-                elif (
-                    current_column_name
-                    and current_column_name.lower() in AUTHZ_COLUMN_NAMES
-                ):
-                    fieldnames[
-                        fieldnames.index(current_column_name)
-                    ] = AUTHZ_STANDARD_KEY
-                    output_column_name = AUTHZ_STANDARD_KEY
-                    if not _verify_format(row[current_column_name], AUTHZ_FORMAT):
-                        logging.error(
-                            f"ERROR: {row[current_column_name]} is not in authz format"
-                        )
-                        is_row_valid = False
-                elif (
-                    current_column_name
-                    and current_column_name.lower() in SIZE_COLUMN_NAMES
-                ):
-                    fieldnames[
-                        fieldnames.index(current_column_name)
-                    ] = SIZE_STANDARD_KEY
-                    output_column_name = SIZE_STANDARD_KEY
-                    if not _verify_format(row[current_column_name], SIZE_FORMAT):
-                        logging.error(
-                            f"ERROR: {row[current_column_name]} is not in int format"
-                        )
-                        is_row_valid = False
-                elif (
-                    current_column_name
-                    and current_column_name.lower() in PREV_GUID_COLUMN_NAMES
-                ):
-                    fieldnames[
-                        fieldnames.index(current_column_name)
-                    ] = PREV_GUID_STANDARD_KEY
-                    output_column_name = PREV_GUID_STANDARD_KEY
-                    # only validate format if value is provided (since this is optional)
-                    if row[current_column_name] and not _verify_format(
-                        row[current_column_name], UUID_FORMAT
-                    ):
-                        logging.error(
-                            f"ERROR: {row[current_column_name]} is not in UUID_FORMAT format"
-                        )
-                        is_row_valid = False
-                elif (
-                    current_column_name
-                    and current_column_name.lower() == RECORD_TYPE_STANDARD_KEY
-                ):
-                    output_column_name = RECORD_TYPE_STANDARD_KEY
-                    if row[current_column_name] not in RECORD_TYPE_ALLOWED_VALUES:
-                        logging.error(
-                            f"ERROR: '{row[current_column_name]}' is not one of the valid record types: {RECORD_TYPE_ALLOWED_VALUES}"
-                        )
-                        is_row_valid = False
-                elif include_additional_columns:
-                    output_column_name = current_column_name
-
-                if output_column_name:
-                    try:
-                        output_row[output_column_name] = (
-                            int(row[current_column_name])
-                            if output_column_name == SIZE_STANDARD_KEY
-                            else row[current_column_name].strip()
-                            if type(row[current_column_name]) == str
-                            else row[current_column_name]
-                        )
-                    except ValueError:
-                        # don't break
-                        pass
-
-            if not {URLS_STANDARD_KEY, MD5_STANDARD_KEY, SIZE_STANDARD_KEY}.issubset(
-                set(output_row.keys())
+        verify_rows = functools.partial(
+            _verify_manifest_rows,
+            include_additional_columns=include_additional_columns,
+            compact_rows=compact_rows,
+        )
+        if num_processes == 1 or csvReader.manifest_format in COLUMNAR_MANIFEST_FORMATS:
+            files, fieldnames, pass_verification = verify_rows(csvReader)
+        else:
+            pass_verification = True
+            for (
+                shard_files,
+                shard_fieldnames,
+                shard_passed,
+            ) in read_manifest_in_parallel(
+                manifest_file,
+                verify_rows,
+                manifest_file_delimiter,
+                num_processes=num_processes,
+                restval="",
             ):
-                logging.error(
-                    f"ERROR: '{row[current_column_name]}' (columns names: "
-                    f"{set(output_row.keys())}) does not have some required rows: "
-                    f"{URLS_STANDARD_KEY}, {MD5_STANDARD_KEY}, {SIZE_STANDARD_KEY}"
-                )
-                is_row_valid = False
-
-            if not is_row_valid:
-                logging.error(
-                    f"row {row_number} with values {row} does not pass the validation"
-                )
-
-                # overall verification fails, but reset row validity
-                pass_verification = False
-                is_row_valid = True
-
-            files.append(output_row)
+                files.extend(shard_files)
+                fieldnames = shard_fieldnames
+                pass_verification = pass_verification and shard_passed
 
     if not pass_verification:
         logging.error("The manifest is not in the correct format!!!")
@@ -275,6 +793,170 @@ def get_and_verify_fileinfos_from_tsv_manifest(
     return files, fieldnames
 
 
+def _verify_manifest_rows(
+    rows,
+    first_line_number=2,
+    include_additional_columns=False,
+    compact_rows=False,
+    handle_file_info=None,
+):
+    """
+    Verify rows from a manifest and convert them to file infos with the standard
+    column names
+
+    Args:
+        rows(csv.DictReader): reader over manifest rows
+        first_line_number(int): line number of the first row, the header is line 1
+        include_additional_columns(bool): include non-standard columns
+        compact_rows(bool): make each file info a ManifestRecord instead of a dict
+        handle_file_info(callable): if provided, handle_file_info(file_info) is
+            called for each row as it's verified instead of collecting the file
+            infos, so the whole manifest never has to be in memory
+
+    Returns:
+        tuple: (list of file infos, empty with handle_file_info, fieldnames with
+            standard column names, whether every row passed verification)
+    """
+    files = []
+    fieldnames = rows.fieldnames
+    pass_verification = True
+    is_row_valid = True
+    for row_number, row in enumerate(rows, first_line_number - 1):
+        output_row = {}
+        for current_column_name in row.keys():
+            output_column_name = None
+            if current_column_name and current_column_name.lower() in GUID_COLUMN_NAMES:
+                fieldnames[fieldnames.index(current_column_name)] = GUID_STANDARD_KEY
+                output_column_name = GUID_STANDARD_KEY
+            elif (
+                current_column_name
+                and current_column_name.lower() in FILENAME_COLUMN_NAMES
+            ):
+                fieldnames[
+                    fieldnames.index(current_column_name)
+                ] = FILENAME_STANDARD_KEY
+                output_column_name = FILENAME_STANDARD_KEY
+            elif (
+                current_column_name and current_column_name.lower() in MD5_COLUMN_NAMES
+            ):
+                fieldnames[fieldnames.index(current_column_name)] = MD5_STANDARD_KEY
+                output_column_name = MD5_STANDARD_KEY
+                if not _verify_format(row[current_column_name], MD5_FORMAT):
+                    logging.error(
+                        f"ERROR: {row[current_column_name]} is not in md5 format"
+                    )
+                    is_row_valid = False
+            elif (
+                current_column_name and current_column_name.lower() in ACLS_COLUMN_NAMES
+            ):
+                fieldnames[fieldnames.index(current_column_name)] = ACL_STANDARD_KEY
+                output_column_name = ACL_STANDARD_KEY
+                if not _verify_format(row[current_column_name], ACL_FORMAT):
+                    logging.error(
+                        f"ERROR: {row[current_column_name]} is not in acl format"
+                    )
+                    is_row_valid = False
+            elif (
+                current_column_name and current_column_name.lower() in URLS_COLUMN_NAMES
+            ):
+                fieldnames[fieldnames.index(current_column_name)] = URLS_STANDARD_KEY
+                output_column_name = URLS_STANDARD_KEY
+                if not _verify_format(row[current_column_name], URL_FORMAT):
+                    logging.error(
+                        f"ERROR: {row[current_column_name]} is not in urls format"
+                    )
+                    is_row_valid = False
+            elif (
+                current_column_name
+                and current_column_name.lower() in AUTHZ_COLUMN_NAMES
+            ):
+                fieldnames[fieldnames.index(current_column_name)] = AUTHZ_STANDARD_KEY
+                output_column_name = AUTHZ_STANDARD_KEY
+                if not _verify_format(row[current_column_name], AUTHZ_FORMAT):
+                    logging.error(
+                        f"ERROR: {row[current_column_name]} is not in authz format"
+                    )
+                    is_row_valid = False
+            elif (
+                current_column_name and current_column_name.lower() in SIZE_COLUMN_NAMES
+            ):
+                fieldnames[fieldnames.index(current_column_name)] = SIZE_STANDARD_KEY
+                output_column_name = SIZE_STANDARD_KEY
+                if not _verify_format(row[current_column_name], SIZE_FORMAT):
+                    logging.error(
+                        f"ERROR: {row[current_column_name]} is not in int format"
+                    )
+                    is_row_valid = False
+            elif (
+                current_column_name
+                and current_column_name.lower() in PREV_GUID_COLUMN_NAMES
+            ):
+                fieldnames[
+                    fieldnames.index(current_column_name)
+                ] = PREV_GUID_STANDARD_KEY
+                output_column_name = PREV_GUID_STANDARD_KEY
+                # only validate format if value is provided (since this is optional)
+                if row[current_column_name] and not _verify_format(
+                    row[current_column_name], UUID_FORMAT
+                ):
+                    logging.error(
+                        f"ERROR: {row[current_column_name]} is not in UUID_FORMAT format"
+                    )
+                    is_row_valid = False
+            elif (
+                current_column_name
+                and current_column_name.lower() == RECORD_TYPE_STANDARD_KEY
+            ):
+                output_column_name = RECORD_TYPE_STANDARD_KEY
+                if row[current_column_name] not in RECORD_TYPE_ALLOWED_VALUES:
+                    logging.error(
+                        f"ERROR: '{row[current_column_name]}' is not one of the valid record types: {RECORD_TYPE_ALLOWED_VALUES}"
+                    )
+                    is_row_valid = False
+            elif include_additional_columns:
+                output_column_name = current_column_name
+
+            if output_column_name:
+                try:
+                    output_row[output_column_name] = (
+                        int(row[current_column_name])
+                        if output_column_name == SIZE_STANDARD_KEY
+                        else row[current_column_name].strip()
+                        if type(row[current_column_name]) == str
+                        else row[current_column_name]
+                    )
+                except ValueError:
+                    # don't break
+                    pass
+
+        if not {URLS_STANDARD_KEY, MD5_STANDARD_KEY, SIZE_STANDARD_KEY}.issubset(
+            set(output_row.keys())
+        ):
+            logging.error(
+                f"ERROR: '{row[current_column_name]}' (columns names: "
+                f"{set(output_row.keys())}) does not have some required rows: "
+                f"{URLS_STANDARD_KEY}, {MD5_STANDARD_KEY}, {SIZE_STANDARD_KEY}"
+            )
+            is_row_valid = False
+
+        if not is_row_valid:
+            logging.error(
+                f"row {row_number} with values {row} does not pass the validation"
+            )
+
+            # overall verification fails, but reset row validity
+            pass_verification = False
+            is_row_valid = True
+
+        file_info = ManifestRecord(output_row) if compact_rows else output_row
+        if handle_file_info:
+            handle_file_info(file_info)
+        else:
+            files.append(file_info)
+
+    return files, fieldnames, pass_verification
+
+
 """
 Classes to be used in the identification and validation of manifest columns
 """
@@ -1,12 +1,20 @@
 import asyncio
+import backoff
 import collections.abc
+import copy
+from dataclasses import dataclass
+import hashlib
+import json
 from jsonschema import Draft4Validator
 import sys
 import re
 import requests
+import requests.adapters
 import random
 import string
 import os
+import threading
+import time
 
 from urllib.parse import urlunsplit
 from urllib.parse import urlencode
@@ -377,3 +385,469 @@ BACKOFF_NO_LOG_IF_NOT_RETRIED = {
     "max_tries": int(os.environ.get("GEN3SDK_MAX_RETRIES", 3)),
     "giveup": exception_do_not_retry,
 }
+
+
+@dataclass
+class AsyncRequestResult:
+    """
+    Outcome of a single request run by a BoundedAsyncExecutor
+
+    Attributes:
+        key (object): identifier the request was submitted with (ex: a GUID)
+        result (object): return value of the request, None if it failed
+        error (Exception): the final exception if the request failed, otherwise None
+        tries (int): number of attempts made
+    """
+
+    key: object
+    result: object = None
+    error: Exception = None
+    tries: int = 0
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class BoundedAsyncExecutor:
+    """
+    Run asynchronous requests keeping up to `max_concurrent_requests` in flight
+    at all times. As soon as any request finishes the next one is started
+    (a sliding window), so one slow request only ever occupies a single slot
+    instead of stalling a whole batch.
+
+    Requests are provided as an iterable (or async iterable) of
+    `(key, request_func)` pairs, where `request_func` is a callable that returns
+    a new awaitable every time it's called, so failed requests can be retried.
+    The iterable is consumed lazily, so it can stream from a large file.
+
+    Example:
+        executor = BoundedAsyncExecutor(max_concurrent_requests=5)
+        requests = (
+            (guid, functools.partial(mds.async_create, guid, metadata))
+            for guid, metadata in records
+        )
+        async for result in executor.run(requests):
+            if not result.ok:
+                print(f"{result.key} failed: {result.error}")
+
+    Attributes:
+        max_concurrent_requests (int): maximum number of requests in flight
+        max_tries (int): attempts per request before giving up. Defaults to 1
+            since most SDK methods already retry internally
+        counts (Dict[str, int]): progress counters: "submitted", "in_flight",
+            "succeeded", "failed" and "retried"
+    """
+
+    def __init__(
+        self,
+        max_concurrent_requests=5,
+        max_tries=1,
+        giveup=exception_do_not_retry,
+        progress_callback=None,
+    ):
+        """
+        Args:
+            max_concurrent_requests (int): maximum number of requests in flight
+            max_tries (int, optional): attempts per request before giving up
+            giveup (Callable[[Exception], bool], optional): returns True if the
+                exception should NOT be retried
+            progress_callback (Callable[[Dict[str, int]], None], optional): called
+                with a copy of `counts` each time a request finishes
+        """
+        self.max_concurrent_requests = max(int(max_concurrent_requests), 1)
+        self.max_tries = max(int(max_tries), 1)
+        self.giveup = giveup
+        self.progress_callback = progress_callback
+        self.counts = {
+            "submitted": 0,
+            "in_flight": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "retried": 0,
+        }
+
+    async def run(self, requests):
+        """
+        Run all the requests, yielding an AsyncRequestResult for each one as
+        soon as it completes (in completion order, not submission order).
+
+        Args:
+            requests (Iterable|AsyncIterable[Tuple[object, Callable]]): the
+                `(key, request_func)` pairs to run
+
+        Yields:
+            AsyncRequestResult: outcome for each request
+        """
+        request_iterator = _aiterate(requests).__aiter__()
+        in_flight = set()
+        exhausted = False
+
+        try:
+            while True:
+                while not exhausted and len(in_flight) < self.max_concurrent_requests:
+                    try:
+                        key, request_func = await request_iterator.__anext__()
+                    except StopAsyncIteration:
+                        exhausted = True
+                        break
+
+                    in_flight.add(
+                        asyncio.ensure_future(self._run_request(key, request_func))
+                    )
+                    self.counts["submitted"] += 1
+                    self.counts["in_flight"] = len(in_flight)
+
+                if not in_flight:
+                    return
+
+                done, in_flight = await asyncio.wait(
+                    in_flight, return_when=asyncio.FIRST_COMPLETED
+                )
+                self.counts["in_flight"] = len(in_flight)
+
+                for task in done:
+                    result = task.result()
+                    self.counts["succeeded" if result.ok else "failed"] += 1
+                    if self.progress_callback:
+                        self.progress_callback(dict(self.counts))
+                    yield result
+        finally:
+            # only reached with requests in flight if the caller stopped
+            # consuming results early
+            for task in in_flight:
+                task.cancel()
+
+    async def run_all(self, requests, raise_on_error=True):
+        """
+        Run all the requests to completion, discarding successful results.
+
+        Args:
+            requests (Iterable|AsyncIterable[Tuple[object, Callable]]): the
+                `(key, request_func)` pairs to run
+            raise_on_error (bool, optional): re-raise the first failure once
+                every request has finished
+
+        Returns:
+            List[AsyncRequestResult]: the failed requests
+        """
+        failures = []
+        async for result in self.run(requests):
+            if not result.ok:
+                logging.error(f"request for {result.key} failed: {result.error}")
+                failures.append(result)
+
+        logging.info(
+            f"finished {self.counts['submitted']} requests: "
+            f"{self.counts['succeeded']} succeeded, {self.counts['failed']} failed, "
+            f"{self.counts['retried']} retries"
+        )
+
+        if failures and raise_on_error:
+            raise failures[0].error
+
+        return failures
+
+    async def _run_request(self, key, request_func):
+        """
+        Run a single request with retries. Never raises, errors are captured
+        on the returned AsyncRequestResult.
+        """
+        outcome = AsyncRequestResult(key=key)
+
+        def _on_backoff(details):
+            self.counts["retried"] += 1
+            log_backoff_retry(details)
+
+        @backoff.on_exception(
+            backoff.expo,
+            Exception,
+            max_tries=self.max_tries,
+            giveup=self.giveup,
+            logger=None,
+            on_backoff=_on_backoff,
+        )
+        async def _attempt():
+            outcome.tries += 1
+            return await request_func()
+
+        try:
+            outcome.result = await _attempt()
+        except Exception as exc:
+            outcome.error = exc
+
+        return outcome
+
+
+async def _aiterate(items):
+    """
+    Iterate asynchronously over either a regular or an async iterable
+    """
+    if hasattr(items, "__aiter__"):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+
+class GraphQLClient:
+    """
+    Send GraphQL queries and other read requests to a Gen3 service, reusing
+    connections through a pooled requests.Session.
+
+    Responses of read-only requests (schemas, dictionaries, counts) can be cached
+    in memory for `cache_ttl` seconds, keyed on the url, query text and variables.
+    Caching is disabled when `cache_ttl` is None. Cached responses are returned
+    as copies, so callers can modify them.
+
+    JSON documents fetched with `get_json` are also revalidated with their ETag or
+    Last-Modified header, so an unchanged document is neither downloaded nor parsed
+    again, and are saved to `cache_dir` so later processes can revalidate them too.
+
+    Example:
+        client = GraphQLClient(f"{endpoint}/guppy/graphql", auth, cache_ttl=300)
+        counts = client.batch_query(
+            {
+                "subjects": '_subject_count(project_id: "DEV-test")',
+                "samples": '_sample_count(project_id: "DEV-test")',
+            },
+            cache=True,
+        )
+
+    Attributes:
+        url (str): GraphQL endpoint
+        cache_ttl (float): seconds cached responses are kept for
+        cache_dir (str): folder JSON documents and their validators are saved in
+    """
+
+    def __init__(
+        self, url, auth_provider=None, cache_ttl=None, pool_maxsize=10, cache_dir=None
+    ):
+        """
+        Args:
+            url (str): GraphQL endpoint
+            auth_provider (Gen3Auth, optional): auth sent with the queries
+            cache_ttl (float, optional): seconds to keep cached responses for
+            pool_maxsize (int, optional): connections kept open per host
+            cache_dir (str, optional): folder to save JSON documents fetched with
+                `get_json` in, nothing is saved to disk by default
+        """
+        self.url = url
+        self.cache_ttl = cache_ttl
+        self.cache_dir = cache_dir
+        self._auth_provider = auth_provider
+        self._pool_maxsize = pool_maxsize
+        self._session = None
+        self._cache = {}
+        # url to {"etag", "last_modified", "data"} of revalidated JSON documents
+        self._validated = {}
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = requests.adapters.HTTPAdapter(
+                        pool_connections=self._pool_maxsize,
+                        pool_maxsize=self._pool_maxsize,
+                    )
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    self._session = session
+        return self._session
+
+    def _cached(self, key, fetch, cache):
+        """
+        Return `fetch()`, from the cache if `cache` is set, caching is enabled
+        and it was fetched less than `cache_ttl` seconds ago.
+
+        Callers get a copy of the cached result, so modifying it does not change
+        what later callers get.
+        """
+        if not cache or self.cache_ttl is None:
+            return fetch()
+        with self._lock:
+            cached = self._cache.get(key)
+        if cached and cached[0] > time.monotonic():
+            return copy.deepcopy(cached[1])
+        result = fetch()
+        with self._lock:
+            self._cache[key] = (time.monotonic() + self.cache_ttl, result)
+        return copy.deepcopy(result)
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
+            self._validated.clear()
+
+    def post(self, query_string, variables=None):
+        """
+        Send a GraphQL query.
+
+        Returns:
+            requests.Response: the raw response
+        """
+        return self.session.post(
+            self.url,
+            json={"query": query_string, "variables": variables},
+            auth=self._auth_provider,
+        )
+
+    def query(self, query_string, variables=None, cache=False, parse=None):
+        """
+        Send a GraphQL query and parse the response.
+
+        Args:
+            query_string (str): GraphQL query
+            variables (dict, optional): query variables
+            cache (bool, optional): whether the response can be served from and
+                saved to the cache
+            parse (Callable[[requests.Response], object], optional): parses and
+                checks the response, defaults to `response.json()`
+
+        Returns:
+            object: the parsed response
+        """
+        parse = parse or (lambda response: response.json())
+        key = ("query", query_string, json.dumps(variables, sort_keys=True))
+        return self._cached(
+            key, lambda: parse(self.post(query_string, variables)), cache
+        )
+
+    def batch_query(self, fields, variables=None, cache=False, parse=None):
+        """
+        Send several queries in a single request by aliasing their fields.
+
+        Args:
+            fields (Dict[str, str]): alias to the field selection to query with it,
+                for example `{"subjects": '_subject_count(project_id: $project_id)'}`
+            variables (Dict[str, Tuple[str, object]], optional): name to the GraphQL
+                type and value of the variables used by any of the fields, for example
+                `{"project_id": ("String", "DEV-test")}`
+            cache (bool, optional): see `query`
+            parse (Callable[[requests.Response], object], optional): see `query`
+
+        Returns:
+            Dict[str, object]: alias to the data returned for its field
+        """
+        if not fields:
+            return {}
+        query_string = "{%s}" % " ".join(
+            f"{alias}: {selection}" for alias, selection in fields.items()
+        )
+        if variables:
+            declarations = ", ".join(
+                f"${name}: {variable_type}"
+                for name, (variable_type, _) in variables.items()
+            )
+            query_string = f"query({declarations}) {query_string}"
+            variables = {name: value for name, (_, value) in variables.items()}
+        response = self.query(query_string, variables, cache=cache, parse=parse)
+        return {alias: response["data"][alias] for alias in fields}
+
+    def get(self, url, cache=False, parse=None, **kwargs):
+        """
+        Send a GET request through the pooled session, for example for a
+        schema or dictionary.
+
+        Args:
+            url (str): url to get
+            cache (bool, optional): see `query`
+            parse (Callable[[requests.Response], object], optional): see `query`
+            **kwargs: passed to `requests.Session.get`
+
+        Returns:
+            object: the parsed response
+        """
+        parse = parse or (lambda response: response.json())
+        key = ("get", url, json.dumps(kwargs, sort_keys=True, default=str))
+        return self._cached(key, lambda: parse(self.session.get(url, **kwargs)), cache)
+
+    def get_json(self, url, cache=False, **kwargs):
+        """
+        GET a JSON document, for example a schema or dictionary, revalidating the
+        copy fetched before with a conditional request.
+
+        The parsed document is kept in memory and, if `cache_dir` is set, saved to
+        disk with its ETag and Last-Modified headers. When the server answers
+        304 Not Modified a copy of the kept document is returned. Documents served
+        without either header are not kept.
+
+        Args:
+            url (str): url to get
+            cache (bool, optional): whether to skip revalidation for `cache_ttl`
+                seconds, see `query`
+            **kwargs: passed to `requests.Session.get`
+
+        Returns:
+            object: the parsed document
+        """
+        key = ("get_json", url, json.dumps(kwargs, sort_keys=True, default=str))
+        return self._cached(key, lambda: self._get_revalidated(url, **kwargs), cache)
+
+    def _get_revalidated(self, url, **kwargs):
+        with self._lock:
+            entry = self._validated.get(url)
+        if entry is None:
+            entry = self._read_cache_file(url)
+
+        headers = dict(kwargs.pop("headers", None) or {})
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        response = self.session.get(url, headers=headers, **kwargs)
+
+        if entry and response.status_code == 304:
+            logging.debug(f"{url} not modified, using the cached copy")
+        else:
+            raise_for_status_and_print_error(response)
+            data = json.loads(response.text)
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+            if response.status_code != 200 or not (etag or last_modified):
+                with self._lock:
+                    self._validated.pop(url, None)
+                return data
+            entry = {"etag": etag, "last_modified": last_modified, "data": data}
+            self._write_cache_file(url, entry)
+
+        with self._lock:
+            self._validated[url] = entry
+        return copy.deepcopy(entry["data"])
+
+    def _get_cache_file_name(self, url):
+        return os.path.join(
+            self.cache_dir, hashlib.sha256(url.encode("utf-8")).hexdigest() + ".json"
+        )
+
+    def _read_cache_file(self, url):
+        """Return the entry saved for url, or None if there is none or it is unreadable."""
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._get_cache_file_name(url)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(entry, dict) or entry.get("url") != url:
+            return None
+        return entry
+
+    def _write_cache_file(self, url, entry):
+        """Atomically save the entry for url, failing to save only logs a warning."""
+        if not self.cache_dir:
+            return
+        cache_file = self._get_cache_file_name(url)
+        tmp_file = "{}.{}.tmp".format(cache_file, threading.get_ident())
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(tmp_file, "w") as f:
+                json.dump(dict(entry, url=url), f)
+            os.replace(tmp_file, cache_file)
+        except (OSError, TypeError, ValueError) as e:
+            logging.warning(f"Unable to cache {url} in {self.cache_dir}: {e}")
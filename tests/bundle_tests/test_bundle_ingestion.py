@@ -4,6 +4,7 @@ from unittest.mock import MagicMock, patch
 from drsclient.client import DrsClient
 
 from gen3.tools.bundle.ingest_manifest import (
+    _get_bundle_levels,
     _replace_bundle_name_with_guid,
     ingest_bundle_manifest,
 )
@@ -34,6 +35,65 @@ def test_replace_bundle_name_with_guid():
     assert list_with_guid == expected_list
 
 
+def test_get_bundle_levels():
+    records = [
+        {"name": "A", "bundles": ["dg.TEST/f2a39f98-6ae1-48a5-8d48-825a0c52a22b"]},
+        {"name": "B", "bundles": ["dg.TEST/1e9d3103-cbe2-4c39-917c-b3abad4750d2"]},
+        {"name": "C", "bundles": ["A", "B"]},
+        {"name": "D", "bundles": ["A", "B", "C"]},
+        {"name": "E", "bundles": ["A", "B"]},
+        {"name": "F", "bundles": ["E"]},
+    ]
+    levels = _get_bundle_levels(records)
+    assert [[record["name"] for _, record in level] for level in levels] == [
+        ["A", "B"],
+        ["C", "E"],
+        ["D", "F"],
+    ]
+    assert [position for position, _ in levels[1]] == [3, 5]
+
+
+def test_ingest_bundle_manifest_concurrently():
+    """
+    Test that with thread_num > 1 every bundle is created after the bundles it
+    references, with their names replaced by the guids indexd returned
+    """
+    created = {}
+
+    def _create(**record):
+        assert all(
+            bundle in created.values()
+            for bundle in record["bundles"]
+            if "/" not in bundle
+        )
+        guid = "{}-guid".format(record["name"])
+        created[record["name"]] = guid
+        resp = MagicMock()
+        resp.status_code = 200
+        resp.json.return_value = {"bundle_id": guid}
+        return resp
+
+    with patch(
+        "gen3.tools.bundle.ingest_manifest.DrsClient.create", side_effect=_create
+    ), patch("gen3.tools.bundle.ingest_manifest._write_csv"):
+        records = ingest_bundle_manifest(
+            "https://example.com",
+            "./tests/bundle_tests/valid_manifest.csv",
+            manifest_file_delimiter=",",
+            auth=("user", "user"),
+            thread_num=4,
+        )
+
+    assert len(records) == 6
+    assert sorted(created) == ["A", "B", "C", "D", "E", "F"]
+    records_by_name = {record["name"]: record for record in records}
+    assert records_by_name["D"]["bundles"] == ["A-guid", "B-guid", "C-guid"]
+    assert records_by_name["A"]["guid"] == "A-guid"
+    assert (
+        records_by_name["E"]["guid"] == "dg.xxxx/590ee63d-2790-477a-bbf8-d53873ca4933"
+    )
+
+
 def test_valid_ingest_bundle_manifest(gen3_index, indexd_server, drs_client):
     """
     Test valid manifest
@@ -1,4 +1,6 @@
 import csv
+from unittest.mock import patch
+
 import pytest
 from gen3.tools.indexing.merge_manifests import merge_bucket_manifests
 from gen3.tools.utils import MD5_STANDARD_KEY, GUID_STANDARD_KEY
@@ -168,6 +170,148 @@ def test_no_guid_input_order():
     )
 
 
+@pytest.mark.parametrize("num_processes", [1, 2])
+@pytest.mark.parametrize(
+    "test_directory,merge_options",
+    [
+        (
+            "regular",
+            {
+                "columns_with_arrays": [
+                    "extra_data",
+                    "more_data",
+                    "some_additional_data",
+                ]
+            },
+        ),
+        (
+            "multiple_guids_per_hash",
+            {
+                "columns_with_arrays": [
+                    "extra_data",
+                    "more_data",
+                    "some_additional_data",
+                ],
+                "allow_mult_guids_per_hash": True,
+            },
+        ),
+        ("column_mismatch", {}),
+        ("no_guid_same_md5_order", {}),
+    ],
+)
+def test_external_sort_merge(test_directory, merge_options, num_processes, tmp_path):
+    """
+    Test that sharding the input to disk by md5 and merging shard by shard
+    matches the expected output manifest.
+    """
+    merge_bucket_manifests(
+        directory=f"tests/merge_manifests/{test_directory}/input",
+        output_manifest="tests/outputs/merged-output-test-manifest.tsv",
+        external_sort=True,
+        num_shards=3,
+        num_processes=num_processes,
+        spill_directory=str(tmp_path),
+        **merge_options,
+    )
+    assert _get_tsv_data(
+        "tests/outputs/merged-output-test-manifest.tsv"
+    ) == _get_tsv_data(
+        f"tests/merge_manifests/{test_directory}/expected-merged-output-manifest.tsv"
+    )
+    # spill files are cleaned up
+    assert not list(tmp_path.iterdir())
+
+
+@pytest.mark.parametrize(
+    "test_directory",
+    [
+        "regular",
+        "multiple_guids_per_hash",
+        "same_guid_for_same_hash",
+        "column_mismatch",
+        "multiple_urls",
+        "duplicate_values",
+        "no_guid_same_md5_order",
+    ],
+)
+def test_parallel_merge_matches_serial(test_directory, tmp_path):
+    """
+    Test that merging partitions in separate processes writes exactly the same
+    output, in the same order, as merging in a single process.
+    """
+    outputs = []
+    for num_processes in [1, 3]:
+        output_manifest = str(tmp_path / f"merged-{num_processes}.tsv")
+        merge_bucket_manifests(
+            directory=f"tests/merge_manifests/{test_directory}/input",
+            output_manifest=output_manifest,
+            columns_with_arrays=[
+                "extra_data",
+                "more_data",
+                "some_additional_data",
+                "food",
+            ],
+            allow_mult_guids_per_hash=True,
+            num_processes=num_processes,
+        )
+        with open(output_manifest) as f:
+            outputs.append(f.read())
+
+    assert outputs[0] == outputs[1]
+
+
+def test_external_sort_size_mismatch():
+    """
+    Test that merge errors are still raised when merging shard by shard.
+    """
+    with pytest.raises(csv.Error):
+        merge_bucket_manifests(
+            directory="tests/merge_manifests/size_mismatch/input",
+            output_manifest="tests/outputs/merged-output-test-manifest.tsv",
+            external_sort=True,
+            num_shards=3,
+        )
+
+
+def test_external_sort_streams_and_verifies_manifests(tmp_path):
+    """
+    Test that external sort verifies rows while streaming them to the spill files,
+    without loading whole manifests, and that a manifest which fails verification
+    contributes no records, like it does when merging in memory.
+    """
+    input_directory = tmp_path / "input"
+    input_directory.mkdir()
+    (input_directory / "manifest_1.tsv").write_text(
+        "guid\tmd5\tsize\turl\n"
+        "guid1\t473d83400bc1bc9dc635e334faddf33c\t1\ts3://bucket/a\n"
+        "guid2\t573d83400bc1bc9dc635e334faddf33c\t2\ts3://bucket/b\n"
+    )
+    (input_directory / "manifest_2.tsv").write_text(
+        "guid\tmd5\tsize\turl\n"
+        "guid3\t673d83400bc1bc9dc635e334faddf33c\t3\ts3://bucket/c\n"
+        "guid4\tnot-an-md5\t4\ts3://bucket/d\n"
+    )
+    spill_directory = tmp_path / "spill"
+    spill_directory.mkdir()
+    output_manifest = str(tmp_path / "merged.tsv")
+
+    with patch(
+        "gen3.tools.indexing.merge_manifests.get_and_verify_fileinfos_from_manifest",
+        side_effect=AssertionError("manifest loaded into memory"),
+    ):
+        merge_bucket_manifests(
+            directory=str(input_directory),
+            output_manifest=output_manifest,
+            external_sort=True,
+            num_shards=3,
+            spill_directory=str(spill_directory),
+        )
+
+    merged = _get_tsv_data(output_manifest)
+    assert [row[GUID_STANDARD_KEY] for row in merged] == [["guid1"], ["guid2"]]
+    assert not list(spill_directory.iterdir())
+
+
 def _get_tsv_data(manifest, delimiter="\t"):
     """
     Returns a list of rows sorted by md5 for the given manifest.
@@ -236,6 +236,67 @@ def test_publish_single_crosswalk(
     ) == sorted(create_metadata_patch.call_args.kwargs.get("aliases"))
 
 
+@patch("gen3.metadata.Gen3Metadata.async_update")
+@patch("gen3.index.Gen3Index.get_valid_guids")
+@patch("gen3.metadata.Gen3Metadata.async_get")
+@patch("gen3.metadata.Gen3Metadata.async_create")
+def test_publish_crosswalk_groups_rows_per_guid(
+    create_metadata_patch,
+    get_metadata_patch,
+    get_valid_guids_patch,
+    update_metadata_patch,
+    gen3_auth,
+    tmp_path,
+):
+    """
+    Test that rows sharing an identifier (directly or through another row) are
+    merged and written to the MDS once, even when they are spilled across
+    partitions.
+    """
+    crosswalk_file = tmp_path / "crosswalk.csv"
+    crosswalk_file.write_text(
+        "https://a.org|gen3_node_property|Case.submitter_id,"
+        "https://b.org|gen3_node_property|Subject.submitter_id\n"
+        "A-1,B-1\n"
+        "A-2,B-2\n"
+        "A-1,B-3\n"
+        "A-4,B-3\n"
+        "A-5,\n"
+    )
+
+    get_valid_guids_patch.return_value = ["guid_1", "guid_2", "guid_3"]
+
+    async def mock_async_get_metadata(guid, *_, **__):
+        # simulate an HTTP 404 error
+        raise Exception()
+
+    get_metadata_patch.side_effect = mock_async_get_metadata
+
+    with patch("gen3.tools.metadata.crosswalk.MAX_ROWS_IN_MEMORY", 1):
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(
+            publish_crosswalk_metadata(gen3_auth, file=str(crosswalk_file))
+        )
+
+    assert not update_metadata_patch.called
+    assert create_metadata_patch.call_count == 3
+    created = {
+        tuple(sorted(call.kwargs["aliases"])): call.args[1][CROSSWALK_NAMESPACE][
+            GUID_TYPE
+        ]
+        for call in create_metadata_patch.call_args_list
+    }
+    assert set(created.keys()) == {
+        ("A-1", "A-4", "B-1", "B-3"),
+        ("A-2", "B-2"),
+        ("", "A-5"),
+    }
+    # later rows win when merging the same identifier
+    merged = created[("A-1", "A-4", "B-1", "B-3")]
+    assert merged["https://a.org"]["Case.submitter_id"]["value"] == "A-4"
+    assert merged["https://b.org"]["Subject.submitter_id"]["value"] == "B-3"
+
+
 @pytest.mark.parametrize(
     "file,info",
     [
@@ -1,7 +1,8 @@
 import pytest
 import csv
+import json
 import os
-from gen3.tools.diff import manifest_diff
+from gen3.tools.diff import manifest_diff, stream_manifest_diff, _normalize_acl
 from pathlib import Path
 
 cwd = os.path.dirname(os.path.realpath(__file__))
@@ -139,3 +140,120 @@ def remove_manifest(file):
         os.remove(file)
     else:
         print("The file does not exist")
+
+
+@pytest.mark.parametrize("presorted", [False, True])
+def test_stream_manifest_diff(tmp_path, presorted):
+    """
+    Test that stream_manifest_diff writes added, removed and changed rows with
+    the columns that changed, and ignores acl ordering.
+    """
+    old_manifest = tmp_path / "old.tsv"
+    new_manifest = tmp_path / "new.tsv"
+    old_manifest.write_text(
+        "guid\tmd5\tacl\n"
+        "a\tmd5a\t['open', 'phs1']\n"
+        "b\tmd5b\t['open']\n"
+        "c\tmd5c\t['open']\n"
+    )
+    new_manifest.write_text(
+        "guid\tmd5\tacl\n"
+        "a\tmd5a\t['phs1', 'open']\n"
+        "c\tmd5c2\t['open']\n"
+        "d\tmd5d\t['open']\n"
+    )
+    output_manifest = tmp_path / "diff.tsv"
+
+    counts = stream_manifest_diff(
+        files=[str(old_manifest), str(new_manifest)],
+        key_column="guid",
+        output_manifest=str(output_manifest),
+        presorted=presorted,
+        num_partitions=2,
+    )
+
+    assert counts == {"added": 1, "removed": 1, "changed": 1, "unchanged": 1}
+    with open(output_manifest) as output_file:
+        rows = {row["guid"]: row for row in csv.DictReader(output_file, delimiter="\t")}
+    assert rows.keys() == {"b", "c", "d"}
+    assert rows["b"]["diff"] == "removed"
+    assert rows["b"]["md5"] == "md5b"
+    assert rows["c"]["diff"] == "changed"
+    assert rows["c"]["md5"] == "md5c2"
+    assert json.loads(rows["c"]["changes"]) == {"md5": {"old": "md5c", "new": "md5c2"}}
+    assert rows["d"]["diff"] == "added"
+
+
+def test_stream_manifest_diff_unsorted(tmp_path):
+    """
+    Test that presorted fails if a manifest is not sorted by key.
+    """
+    old_manifest = tmp_path / "old.csv"
+    new_manifest = tmp_path / "new.csv"
+    old_manifest.write_text("guid,md5\nb,md5b\na,md5a\n")
+    new_manifest.write_text("guid,md5\na,md5a\nb,md5b\n")
+
+    with pytest.raises(ValueError):
+        stream_manifest_diff(
+            files=[str(old_manifest), str(new_manifest)],
+            key_column="guid",
+            output_manifest=str(tmp_path / "diff.csv"),
+            presorted=True,
+        )
+
+
+@pytest.mark.parametrize("presorted", [False, True])
+def test_stream_manifest_diff_duplicate_keys(tmp_path, presorted):
+    """
+    Test that only the first row for a duplicated key is compared, in either
+    manifest.
+    """
+    old_manifest = tmp_path / "old.csv"
+    new_manifest = tmp_path / "new.csv"
+    old_manifest.write_text("guid,md5\na,md5a\na,md5x\nb,md5b\n")
+    new_manifest.write_text("guid,md5\na,md5a\nb,md5b2\nb,md5b3\nc,md5c\nc,md5c\n")
+    output_manifest = tmp_path / "diff.csv"
+
+    counts = stream_manifest_diff(
+        files=[str(old_manifest), str(new_manifest)],
+        key_column="guid",
+        output_manifest=str(output_manifest),
+        presorted=presorted,
+        num_partitions=2,
+    )
+
+    assert counts == {"added": 1, "removed": 0, "changed": 1, "unchanged": 1}
+    with open(output_manifest) as output_file:
+        rows = list(csv.DictReader(output_file))
+    assert sorted((row["guid"], row["diff"], row["md5"]) for row in rows) == [
+        ("b", "changed", "md5b2"),
+        ("c", "added", "md5c"),
+    ]
+
+
+def test_stream_manifest_diff_mixed_extensions(tmp_path):
+    """
+    Test that manifests with different extensions are rejected, even when both
+    would be read as CSV.
+    """
+    old_manifest = tmp_path / "old.txt"
+    new_manifest = tmp_path / "new.csv"
+    old_manifest.write_text("guid,md5\na,md5a\n")
+    new_manifest.write_text("guid,md5\na,md5a\n")
+
+    with pytest.raises(ValueError):
+        stream_manifest_diff(
+            files=[str(old_manifest), str(new_manifest)],
+            key_column="guid",
+            output_manifest=str(tmp_path / "diff.csv"),
+        )
+
+
+def test_normalize_acl():
+    """
+    Test that acl values are compared without regard to order and are never
+    evaluated as code.
+    """
+    assert _normalize_acl("['phs1', 'open']") == _normalize_acl("['open', 'phs1']")
+    assert _normalize_acl("phs1 open") == "open phs1"
+    assert _normalize_acl("__import__('os')") == "__import__('os')"
@@ -208,6 +208,90 @@ def test_discovery_read(
             )
 
 
+@patch("gen3.tools.metadata.discovery._create_metadata_output_filename")
+@patch("gen3.metadata.Gen3Metadata.query")
+def test_discovery_read_fields_and_filters(
+    metadata_query_patch, metadata_file_patch, gen3_auth
+):
+    """
+    Test that plain filters are pushed down to mds as query params, callable
+    filters are applied locally and only the requested fields are output
+    """
+    all_metadata = {
+        "guid1": {
+            "_guid_type": "discovery_metadata",
+            "gen3_discovery": {
+                "study_id": "a",
+                "subjects": 10,
+                "extra": "not exported",
+                "tags": [{"name": "t1", "category": "c1"}],
+            },
+        },
+        "guid2": {
+            "_guid_type": "discovery_metadata",
+            "gen3_discovery": {"study_id": "a", "subjects": 1, "extra": "x"},
+        },
+    }
+    queries = []
+
+    def mock_query(query, *_, **__):
+        queries.append(query)
+        return all_metadata
+
+    metadata_query_patch.side_effect = mock_query
+
+    with tempfile.NamedTemporaryFile(suffix=".csv", mode="a+") as outfile:
+        metadata_file_patch.side_effect = lambda *_, **__: outfile.name
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(
+            output_expanded_discovery_metadata(
+                gen3_auth,
+                endpoint="excommons.org",
+                fields=["subjects", "study_id", "tags"],
+                filters={"study_id": ["a", "b"], "subjects": lambda n: n > 5},
+            )
+        )
+        outfile.seek(0)
+        reader = csv.DictReader(outfile, **BASE_CSV_PARSER_SETTINGS)
+        csv_rows = list(reader)
+
+    assert queries == [
+        "_guid_type=discovery_metadata"
+        "&gen3_discovery.study_id=a&gen3_discovery.study_id=b"
+    ]
+    assert reader.fieldnames == ["guid", "subjects", "study_id", "_tag_0"]
+    assert len(csv_rows) == 1
+    assert csv_rows[0]["guid"] == "guid1"
+    assert csv_rows[0]["subjects"] == "10"
+
+    # aggregate mds doesn't support filters, so they all get applied locally
+    queries.clear()
+    metadata_query_patch.side_effect = lambda query, *_, **__: (
+        queries.append(query) or {"commons1": [all_metadata]}
+    )
+    with tempfile.NamedTemporaryFile(suffix=".json", mode="a+") as outfile:
+        metadata_file_patch.side_effect = lambda *_, **__: outfile.name
+        loop.run_until_complete(
+            output_expanded_discovery_metadata(
+                gen3_auth,
+                endpoint="excommons.org",
+                use_agg_mds=True,
+                output_format="json",
+                fields=["study_id"],
+                filters={"study_id": "a", "subjects": 1},
+            )
+        )
+        outfile.seek(0)
+        assert json.load(outfile) == [
+            {
+                "guid": "guid2",
+                "_guid_type": "discovery_metadata",
+                "gen3_discovery": {"study_id": "a"},
+            }
+        ]
+    assert queries == ["_guid_type=discovery_metadata"]
+
+
 @patch("gen3.metadata.Gen3Metadata.async_create")
 @pytest.mark.parametrize("ignore_empty_columns", [True, False])
 def test_discovery_publish_omit_empty_columns(
@@ -279,6 +363,148 @@ def test_discovery_publish_omit_empty_columns(
         )
 
 
+@patch("gen3.metadata.Gen3Metadata.async_delete")
+@patch("gen3.metadata.Gen3Metadata.async_create")
+@patch("gen3.metadata.Gen3Metadata.query")
+def test_discovery_publish_skip_unchanged(
+    metadata_query_patch, create_metadata_patch, delete_metadata_patch, gen3_auth
+):
+    """
+    Test that only records which differ from what's in mds get published, that
+    records missing from the file get deleted, and that existing records are
+    paged through instead of stopping at the first page.
+    """
+    existing_records = {
+        "unchanged_guid": {
+            "_guid_type": "discovery_metadata",
+            "gen3_discovery": {"c1": "x", "c2": "y"},
+        },
+        "changed_guid": {
+            "_guid_type": "discovery_metadata",
+            "gen3_discovery": {"c1": "old", "c2": "y"},
+        },
+        "deleted_guid": {
+            "_guid_type": "discovery_metadata",
+            "gen3_discovery": {"c1": "z", "c2": ""},
+        },
+    }
+
+    def mock_query(query, return_full_metadata=False, limit=10, offset=0, **__):
+        assert query == "_guid_type=discovery_metadata"
+        # simulate mds capping the page size
+        limit = min(limit, 2)
+        page = dict(list(existing_records.items())[offset : offset + limit])
+        return page if return_full_metadata else list(page)
+
+    metadata_query_patch.side_effect = mock_query
+
+    created = {}
+    deleted = []
+
+    async def mock_async_create_metadata(guid, metadata, *_, **__):
+        created[guid] = metadata
+
+    async def mock_async_delete_metadata(guid, *_, **__):
+        deleted.append(guid)
+
+    create_metadata_patch.side_effect = mock_async_create_metadata
+    delete_metadata_patch.side_effect = mock_async_delete_metadata
+
+    with tempfile.NamedTemporaryFile(suffix=".tsv") as mocked_manifest:
+        mocked_manifest.write(
+            "\n".join(
+                [
+                    "guid\tc1\tc2",
+                    "unchanged_guid\tx\ty",
+                    "changed_guid\tnew\ty",
+                    "new_guid\tq\tr",
+                ]
+            ).encode()
+        )
+        mocked_manifest.seek(0)
+
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(
+            publish_discovery_metadata(
+                gen3_auth,
+                mocked_manifest.name,
+                endpoint="excommons.org",
+                skip_unchanged=True,
+                delete_missing=True,
+            )
+        )
+
+    assert sorted(created.keys()) == ["changed_guid", "new_guid"]
+    assert created["changed_guid"]["gen3_discovery"] == {"c1": "new", "c2": "y"}
+    assert deleted == ["deleted_guid"]
+
+
+@patch("gen3.metadata.Gen3Metadata.async_delete")
+@patch("gen3.metadata.Gen3Metadata.async_create")
+@patch("gen3.metadata.Gen3Metadata.query")
+def test_discovery_publish_delete_missing_after_failed_create(
+    metadata_query_patch, create_metadata_patch, delete_metadata_patch, gen3_auth
+):
+    """
+    Test that records missing from the file are not deleted when any create or
+    update failed.
+    """
+    existing_records = {
+        "changed_guid": {
+            "_guid_type": "discovery_metadata",
+            "gen3_discovery": {"c1": "old", "c2": "y"},
+        },
+        "deleted_guid": {
+            "_guid_type": "discovery_metadata",
+            "gen3_discovery": {"c1": "z", "c2": ""},
+        },
+    }
+
+    def mock_query(query, return_full_metadata=False, limit=10, offset=0, **__):
+        page = dict(list(existing_records.items())[offset : offset + limit])
+        return page if return_full_metadata else list(page)
+
+    metadata_query_patch.side_effect = mock_query
+
+    async def mock_async_create_metadata(guid, metadata, *_, **__):
+        if guid == "changed_guid":
+            raise Exception("create failed")
+
+    deleted = []
+
+    async def mock_async_delete_metadata(guid, *_, **__):
+        deleted.append(guid)
+
+    create_metadata_patch.side_effect = mock_async_create_metadata
+    delete_metadata_patch.side_effect = mock_async_delete_metadata
+
+    with tempfile.NamedTemporaryFile(suffix=".tsv") as mocked_manifest:
+        mocked_manifest.write(
+            "\n".join(
+                [
+                    "guid\tc1\tc2",
+                    "changed_guid\tnew\ty",
+                    "new_guid\tq\tr",
+                ]
+            ).encode()
+        )
+        mocked_manifest.seek(0)
+
+        loop = asyncio.new_event_loop()
+        with pytest.raises(Exception, match="create failed"):
+            loop.run_until_complete(
+                publish_discovery_metadata(
+                    gen3_auth,
+                    mocked_manifest.name,
+                    endpoint="excommons.org",
+                    delete_missing=True,
+                )
+            )
+
+    assert create_metadata_patch.call_count == 2
+    assert deleted == []
+
+
 def test_discovery_combine():
     """
     Test the underlying logic for combining metadata manifests.
@@ -2,11 +2,13 @@ import asyncio
 import csv
 import json
 import tempfile
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 import pytest
+import requests
 
 from gen3.tools.metadata.discovery_objects import (
     output_discovery_objects,
+    publish_discovery_object_metadata,
     BASE_CSV_PARSER_SETTINGS,
     REQUIRED_OBJECT_FIELDS,
     OPTIONAL_OBJECT_FIELDS,
@@ -249,3 +251,54 @@ def test_discovery_objects_read_JSON(
         )
         outfile.seek(0)
         assert json.load(outfile) == expected_output
+
+
+@patch("gen3.metadata.Gen3Metadata.async_create")
+@patch("gen3.metadata.requests.get")
+def test_publish_discovery_objects(requests_get_patch, async_create_patch, gen3_auth):
+    """
+    Test that publishing discovery objects looks up the current dataset metadata
+    with auth, appends to the existing objects, and creates datasets that don't
+    exist yet.
+    """
+
+    def _mock_get(url, **kwargs):
+        response = MagicMock()
+        if url.endswith("/guid1"):
+            response.json.return_value = json.loads(
+                json.dumps(MOCK_METADATA_SIDE_EFFECT()["guid1"])
+            )
+        else:
+            response.status_code = 404
+            response.raise_for_status.side_effect = requests.exceptions.HTTPError(
+                response=response
+            )
+        return response
+
+    requests_get_patch.side_effect = _mock_get
+    async_create_patch.return_value = {}
+
+    with tempfile.NamedTemporaryFile(suffix=".tsv", mode="w+") as objects_file:
+        objects_file.write(
+            "dataset_guid\tguid\tdisplay_name\n"
+            "guid1\tdrs://dg.FOOBAR:new1\tNew TSV\n"
+            "guid3\tdrs://dg.FOOBAR:new3\tOther TSV\n"
+        )
+        objects_file.flush()
+        asyncio.run(publish_discovery_object_metadata(gen3_auth, objects_file.name))
+
+    assert requests_get_patch.call_count == 2
+    for call in requests_get_patch.call_args_list:
+        assert call.kwargs["auth"] is gen3_auth
+
+    published = {
+        call.args[0]: call.args[1] for call in async_create_patch.call_args_list
+    }
+    assert [obj["guid"] for obj in published["guid1"]["gen3_discovery"]["objects"]] == [
+        "drs://dg.FOOBAR:082a288e-3da2-4806-9438-bc974cdb1cd7",
+        "drs://dg.FOOBAR:f060149a-8a35-421e-802a-873612ee4874",
+        "drs://dg.FOOBAR:new1",
+    ]
+    assert published["guid3"]["gen3_discovery"]["objects"] == [
+        {"guid": "drs://dg.FOOBAR:new3", "display_name": "Other TSV"}
+    ]
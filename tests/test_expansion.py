@@ -201,25 +201,16 @@ def test_get_project_tsvs(mock_gen3_auth):
             mocked_result = {
                 "data": {"project": [{"project_id": "Canine-B_cell_lymphoma"}]}
             }
-        elif query_txt == """{_node_type (first:-1) {id}}""":
-            mocked_result = {
-                "data": {
-                    "_node_type": [
-                        {"id": "demographic"},
-                        {"id": "diagnosis"},
-                        {"id": "program"},
-                    ]
-                }
-            }
         elif (
             query_txt
-            == """{_demographic_count (project_id:"Canine-B_cell_lymphoma")}"""
+            == """{count_0: _demographic_count (project_id:"Canine-B_cell_lymphoma") count_1: _diagnosis_count (project_id:"Canine-B_cell_lymphoma")}"""
         ):
-            mocked_result = {"data": {"_demographic_count": 1}}
+            mocked_result = {"data": {"count_0": 1, "count_1": 1}}
         elif (
-            query_txt == """{_diagnosis_count (project_id:"Canine-B_cell_lymphoma")}"""
+            query_txt
+            == """{count_0: _demographic_count (project_id:"Canine-B_cell_lymphoma")}"""
         ):
-            mocked_result = {"data": {"_diagnosis_count": 1}}
+            mocked_result = {"data": {"count_0": 1}}
 
         return mocked_result
 
@@ -239,6 +230,12 @@ def test_get_project_tsvs(mock_gen3_auth):
 
     mocked_submission = Gen3Submission(endpoint, mock_gen3_auth)
     mocked_submission.query = _mock_sub_query
+    mocked_submission.get_dictionary_all = lambda: {
+        "_definitions": {},
+        "demographic": {"id": "demographic"},
+        "diagnosis": {"id": "diagnosis"},
+        "program": {"id": "program"},
+    }
     exp = Gen3Expansion(endpoint, mock_gen3_auth)
     exp.sub = mocked_submission
 
@@ -287,3 +284,39 @@ def test_get_project_tsvs(mock_gen3_auth):
     # Clean up
     if os.path.exists(dirpath) and os.path.isdir(dirpath):
         shutil.rmtree(dirpath)
+
+
+def test_get_node_counts(mock_gen3_auth):
+    """
+    Test that record counts are batched into queries of aliased count fields
+    """
+    endpoint = "https://test/ok"
+    queries = []
+
+    def _mock_sub_query(query_txt):
+        queries.append(query_txt)
+        aliases = re.findall(r"(count_\d+):", query_txt)
+        return {"data": {alias: len(queries) for alias in aliases}}
+
+    mocked_submission = Gen3Submission(endpoint, mock_gen3_auth)
+    mocked_submission.query = _mock_sub_query
+    exp = Gen3Expansion(endpoint, mock_gen3_auth)
+    exp.sub = mocked_submission
+
+    project_nodes = [
+        ("Canine-Osteosarcoma", "demographic"),
+        ("Canine-Osteosarcoma", "diagnosis"),
+        ("Canine-B_cell_lymphoma", "demographic"),
+    ]
+    with patch("gen3.tools.expansion.COUNT_QUERY_BATCH_SIZE", 2):
+        counts = exp._get_node_counts(project_nodes)
+
+    assert queries == [
+        """{count_0: _demographic_count (project_id:"Canine-Osteosarcoma") count_1: _diagnosis_count (project_id:"Canine-Osteosarcoma")}""",
+        """{count_0: _demographic_count (project_id:"Canine-B_cell_lymphoma")}""",
+    ]
+    assert counts == {
+        ("Canine-Osteosarcoma", "demographic"): 1,
+        ("Canine-Osteosarcoma", "diagnosis"): 1,
+        ("Canine-B_cell_lymphoma", "demographic"): 2,
+    }
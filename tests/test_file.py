@@ -1,8 +1,10 @@
 """
 Tests gen3.file.Gen3File for calls
 """
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
+import hashlib
 import json
+import os
 import pytest
 from requests import HTTPError
 
@@ -395,3 +397,170 @@ def test_upload_file_wrong_api_key(gen3_file, supported_protocol, authz, expires
             expires_in=expires_in,
         )
         assert res == "Failed to upload data file."
+
+
+def _mock_multipart_requests(requests_sent, failing_parts, expired_uploads):
+    """
+    Mock fence's multipart endpoints and the presigned part urls, recording
+    the requests sent. Every init starts a new upload, "guid<n>" and "upload<n>".
+    """
+    uploads = []
+
+    def _mock_post(url, **kwargs):
+        requests_sent.append((url.split("/user/data/multipart/")[1], kwargs["json"]))
+        response = MagicMock()
+        if url.endswith("/init"):
+            uploads.append(len(uploads) + 1)
+            response.json.return_value = {
+                "guid": f"guid{uploads[-1]}",
+                "uploadId": f"upload{uploads[-1]}",
+            }
+        elif url.endswith("/upload"):
+            upload_id = kwargs["json"]["uploadId"]
+            part_number = kwargs["json"]["partNumber"]
+            response.json.return_value = {
+                "presigned_url": f"https://s3/{upload_id}/{part_number}"
+            }
+        return response
+
+    def _mock_put(url, data):
+        upload_id, part_number = url.split("/")[-2:]
+        part_number = int(part_number)
+        requests_sent.append(("put", part_number, data))
+        response = MagicMock()
+        response.text = ""
+        if upload_id in expired_uploads:
+            response.status_code = 404
+            response.text = "<Error><Code>NoSuchUpload</Code></Error>"
+            response.raise_for_status.side_effect = HTTPError(response=response)
+        elif part_number in failing_parts:
+            response.status_code = 404
+            response.raise_for_status.side_effect = HTTPError(response=response)
+        response.headers = {"ETag": f'"etag{part_number}"'}
+        return response
+
+    return patch("gen3.file.requests.post", side_effect=_mock_post), patch(
+        "gen3.file.requests.put", side_effect=_mock_put
+    )
+
+
+def test_upload_file_multipart_resume(gen3_file, tmp_path):
+    """
+    Upload a file in parts, fail on a part, then resume the upload and only
+    upload the parts that are missing
+    """
+    file_path = tmp_path / "file.txt"
+    content = b"0123456789"
+    file_path.write_bytes(content)
+    checkpoint_file = str(file_path) + ".checkpoint"
+    requests_sent = []
+    failing_parts = {2}
+    mock_post, mock_put = _mock_multipart_requests(requests_sent, failing_parts, ())
+
+    with mock_post, mock_put:
+        with pytest.raises(HTTPError):
+            gen3_file.upload_file_multipart(
+                str(file_path), chunk_size=4, max_concurrent_requests=1
+            )
+        with open(checkpoint_file) as f:
+            assert json.load(f)["parts"] == {
+                "1": {"etag": "etag1", "md5": hashlib.md5(b"0123").hexdigest()}
+            }
+
+        failing_parts.clear()
+        requests_sent.clear()
+        res = gen3_file.upload_file_multipart(
+            str(file_path), chunk_size=4, max_concurrent_requests=1
+        )
+
+    assert res == {
+        "guid": "guid1",
+        "key": "guid1/file.txt",
+        "size": 10,
+        "md5": hashlib.md5(content).hexdigest(),
+    }
+    assert "init" not in [request[0] for request in requests_sent]
+    assert [request for request in requests_sent if request[0] == "put"] == [
+        ("put", 2, b"4567"),
+        ("put", 3, b"89"),
+    ]
+    assert requests_sent[-1] == (
+        "complete",
+        {
+            "key": "guid1/file.txt",
+            "uploadId": "upload1",
+            "parts": [
+                {"PartNumber": 1, "ETag": "etag1"},
+                {"PartNumber": 2, "ETag": "etag2"},
+                {"PartNumber": 3, "ETag": "etag3"},
+            ],
+        },
+    )
+    assert not os.path.exists(checkpoint_file)
+
+
+def test_upload_file_multipart_resume_changed_file(gen3_file, tmp_path):
+    """
+    Resume the upload of a file modified without changing its size: the parts
+    that changed are uploaded again
+    """
+    file_path = tmp_path / "file.txt"
+    file_path.write_bytes(b"0123456789")
+    requests_sent = []
+    failing_parts = {3}
+    mock_post, mock_put = _mock_multipart_requests(requests_sent, failing_parts, ())
+
+    with mock_post, mock_put:
+        with pytest.raises(HTTPError):
+            gen3_file.upload_file_multipart(
+                str(file_path), chunk_size=4, max_concurrent_requests=1
+            )
+
+        file_path.write_bytes(b"0123abcd89")
+        failing_parts.clear()
+        requests_sent.clear()
+        res = gen3_file.upload_file_multipart(
+            str(file_path), chunk_size=4, max_concurrent_requests=1
+        )
+
+    assert res["md5"] == hashlib.md5(b"0123abcd89").hexdigest()
+    assert [request for request in requests_sent if request[0] == "put"] == [
+        ("put", 2, b"abcd"),
+        ("put", 3, b"89"),
+    ]
+
+
+def test_upload_file_multipart_resume_expired_upload(gen3_file, tmp_path):
+    """
+    Resume an upload that no longer exists: a new upload is started instead
+    """
+    file_path = tmp_path / "file.txt"
+    file_path.write_bytes(b"0123456789")
+    requests_sent = []
+    failing_parts = {3}
+    expired_uploads = set()
+    mock_post, mock_put = _mock_multipart_requests(
+        requests_sent, failing_parts, expired_uploads
+    )
+
+    with mock_post, mock_put:
+        with pytest.raises(HTTPError):
+            gen3_file.upload_file_multipart(
+                str(file_path), chunk_size=4, max_concurrent_requests=1
+            )
+
+        failing_parts.clear()
+        expired_uploads.add("upload1")
+        requests_sent.clear()
+        res = gen3_file.upload_file_multipart(
+            str(file_path), chunk_size=4, max_concurrent_requests=1
+        )
+
+    assert res["guid"] == "guid2"
+    assert [request for request in requests_sent if request[0] == "put"] == [
+        ("put", 3, b"89"),
+        ("put", 1, b"0123"),
+        ("put", 2, b"4567"),
+        ("put", 3, b"89"),
+    ]
+    assert requests_sent[-1][1]["uploadId"] == "upload2"
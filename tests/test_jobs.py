@@ -1,3 +1,4 @@
+import asyncio
 import os
 from unittest.mock import MagicMock, patch
 import requests
@@ -162,3 +163,55 @@ def test_get_version(requests_mock, gen3_auth):
     response = jobs.get_version()
 
     assert response == "2020.02-1-gbf5df61"
+
+
+@patch("gen3.jobs.JOB_POLL_INTERVAL", 0.01)
+def test_async_run_jobs_and_wait(gen3_auth):
+    """
+    Test that many jobs are waited for concurrently and that their outputs are
+    yielded as soon as each one is done
+    """
+    jobs = Gen3Jobs(gen3_auth)
+    # number of status checks before each job is done, and its final status
+    job_statuses = {
+        "slow": (["Running", "Running"], "Completed"),
+        "fast": ([], "Completed"),
+        "failing": (["Running"], "Failed"),
+    }
+
+    async def _mock_create_job(job_name, job_input, **kwargs):
+        return {"uid": job_input["id"], "status": "Unknown"}
+
+    async def _mock_get_status(job_id, **kwargs):
+        running, final_status = job_statuses[job_id]
+        return {"status": running.pop() if running else final_status}
+
+    async def _mock_get_output(job_id, **kwargs):
+        return {"output": job_id}
+
+    async def _run_jobs():
+        return [
+            result
+            async for result in jobs.async_run_jobs_and_wait(
+                (job_id, DBGAP_METADATA_JOB, {"id": job_id}) for job_id in job_statuses
+            )
+        ]
+
+    with patch.object(
+        jobs, "async_create_job", side_effect=_mock_create_job
+    ), patch.object(
+        jobs, "async_get_status", side_effect=_mock_get_status
+    ), patch.object(
+        jobs, "async_get_output", side_effect=_mock_get_output
+    ), patch(
+        "gen3.jobs.random.uniform", return_value=1
+    ):
+        loop = asyncio.new_event_loop()
+        results = loop.run_until_complete(_run_jobs())
+        loop.close()
+
+    assert [result.key for result in results] == ["fast", "failing", "slow"]
+    assert results[0].result == {"output": "fast"}
+    assert results[2].result == {"output": "slow"}
+    assert not results[1].ok
+    assert "Failed" in str(results[1].error)
@@ -0,0 +1,184 @@
+import copy
+import csv
+import gzip
+import random
+
+import pytest
+
+from gen3.tools.merge import (
+    _NgramIndex,
+    get_guids_for_manifest_row_partial_match,
+    manifest_row_parsers,
+    merge_guids_into_metadata,
+)
+
+
+@pytest.fixture
+def manifests(tmp_path):
+    indexing_manifest = tmp_path / "indexing.tsv"
+    indexing_manifest.write_text(
+        "guid\tsample_id\tmd5\n"
+        "guid_1\tsample_1\tmd5_1\n"
+        "guid_2\tsample_1\tmd5_2\n"
+        "guid_3\tsample_2\tmd5_3\n"
+    )
+    metadata_manifest = tmp_path / "metadata.tsv"
+    metadata_manifest.write_text(
+        "submitted_sample_id\tbody_site\n"
+        "sample_1\tblood\n"
+        "sample_2\tliver\n"
+        "sample_3\tskin\n"
+    )
+    return str(indexing_manifest), str(metadata_manifest)
+
+
+@pytest.mark.parametrize("include_all_indexing_cols_in_output", [True, False])
+def test_merge_guids_into_metadata_compressed(
+    manifests, tmp_path, include_all_indexing_cols_in_output
+):
+    """
+    Test that merging writes every matched row once and that gzip output has the
+    same content as uncompressed output
+    """
+    indexing_manifest, metadata_manifest = manifests
+
+    output_filename = str(tmp_path / "merged.tsv")
+    merge_guids_into_metadata(
+        indexing_manifest,
+        metadata_manifest,
+        output_filename=output_filename,
+        include_all_indexing_cols_in_output=include_all_indexing_cols_in_output,
+    )
+    with open(output_filename, encoding="utf-8-sig") as output_file:
+        output = output_file.read()
+
+    rows = list(csv.DictReader(output.splitlines(), delimiter="\t"))
+    assert [(row["guid"], row["body_site"]) for row in rows] == [
+        ("guid_1", "blood"),
+        ("guid_2", "blood"),
+        ("guid_3", "liver"),
+    ] + ([] if include_all_indexing_cols_in_output else [("", "skin")])
+
+    compressed_output_filename = str(tmp_path / "merged.tsv.gz")
+    merge_guids_into_metadata(
+        indexing_manifest,
+        metadata_manifest,
+        output_filename=compressed_output_filename,
+        include_all_indexing_cols_in_output=include_all_indexing_cols_in_output,
+        output_compression="gzip",
+    )
+    with gzip.open(
+        compressed_output_filename, "rt", encoding="utf-8-sig"
+    ) as output_file:
+        assert output_file.read() == output
+
+
+def test_merge_guids_into_metadata_zstd(manifests, tmp_path):
+    """
+    Test that zstd output has the same content as uncompressed output
+    """
+    zstandard = pytest.importorskip("zstandard")
+    indexing_manifest, metadata_manifest = manifests
+
+    output_filename = str(tmp_path / "merged.tsv")
+    merge_guids_into_metadata(
+        indexing_manifest, metadata_manifest, output_filename=output_filename
+    )
+    compressed_output_filename = str(tmp_path / "merged.tsv.zst")
+    merge_guids_into_metadata(
+        indexing_manifest,
+        metadata_manifest,
+        output_filename=compressed_output_filename,
+        output_compression="zstd",
+    )
+
+    with open(output_filename, encoding="utf-8-sig") as output_file, zstandard.open(
+        compressed_output_filename, "rt", encoding="utf-8-sig"
+    ) as compressed_output_file:
+        assert compressed_output_file.read() == output_file.read()
+
+
+def test_merge_guids_into_metadata_invalid_compression(manifests, tmp_path):
+    indexing_manifest, metadata_manifest = manifests
+
+    with pytest.raises(ValueError):
+        merge_guids_into_metadata(
+            indexing_manifest,
+            metadata_manifest,
+            output_filename=str(tmp_path / "merged.tsv"),
+            output_compression="bz2",
+        )
+
+
+def test_merge_guids_into_metadata_partial_match(manifests, tmp_path):
+    """
+    Test that merging with the partial match row parser matches rows against keys
+    containing them
+    """
+    indexing_manifest, _ = manifests
+    metadata_manifest = tmp_path / "partial_metadata.tsv"
+    metadata_manifest.write_text(
+        "submitted_sample_id\tbody_site\n" "ple_1\tblood\n" "sample_3\tskin\n"
+    )
+
+    output_filename = str(tmp_path / "merged.tsv")
+    merge_guids_into_metadata(
+        indexing_manifest,
+        str(metadata_manifest),
+        manifest_row_parsers={
+            "guids_for_manifest_row": get_guids_for_manifest_row_partial_match,
+            "get_data_from_indexing_manifest": manifest_row_parsers[
+                "get_data_from_indexing_manifest"
+            ],
+        },
+        output_filename=output_filename,
+        include_all_indexing_cols_in_output=False,
+    )
+    with open(output_filename, encoding="utf-8-sig") as output_file:
+        rows = list(csv.DictReader(output_file, delimiter="\t"))
+
+    assert [(row["guid"], row["body_site"]) for row in rows] == [
+        ("guid_1", "blood"),
+        ("guid_2", "blood"),
+        ("", "skin"),
+    ]
+
+
+def _brute_force_partial_match(key_from_row, data_from_indexing_manifest):
+    matching_keys = [key for key in data_from_indexing_manifest if key_from_row in key]
+    guids = [
+        row["guid"] for key in matching_keys for row in data_from_indexing_manifest[key]
+    ]
+    for key in matching_keys:
+        del data_from_indexing_manifest[key]
+    return guids
+
+
+def test_get_guids_for_manifest_row_partial_match():
+    """
+    Test that the indexed partial match returns the same guids, in the same order,
+    and removes the same keys as checking every key
+    """
+    random.seed(0)
+    data = {}
+    for i in range(500):
+        key = "s3://bucket/" + "".join(random.choices("abc123", k=12)) + ".cram"
+        data.setdefault(key, []).append({"guid": f"guid_{i}"})
+    expected_data = copy.deepcopy(data)
+
+    config = {"guid_column_name": "guid", "row_column_name": "sample"}
+    queries = ["a1", "", "abc", "zzzz", ".cram", "cc12", "b"] + [
+        "".join(random.choices("abc123", k=4)) for _ in range(200)
+    ]
+    index = _NgramIndex(data)
+    for query in queries:
+        assert get_guids_for_manifest_row_partial_match(
+            {"sample": f" {query} "}, data, config, partial_match_index=index
+        ) == _brute_force_partial_match(query, expected_data)
+        assert list(data) == list(expected_data)
+
+    # without an index every key is checked
+    data["s3://bucket/new_key"] = [{"guid": "new_guid"}]
+    assert get_guids_for_manifest_row_partial_match(
+        {"sample": "new_key"}, data, config
+    ) == ["new_guid"]
@@ -628,3 +628,55 @@ def test_aliases_creation(
 
     response = mds.get_aliases(guid)
     assert response.get("aliases") == []
+
+
+@patch("gen3.metadata.Gen3Metadata.async_delete_alias")
+@patch("gen3.metadata.Gen3Metadata.async_delete_aliases")
+@patch("gen3.metadata.Gen3Metadata.async_create_aliases")
+def test_batch_aliases(
+    create_aliases_patch, delete_aliases_patch, delete_alias_patch, gen3_auth
+):
+    """
+    Test that batch alias operations fan out one request per guid and report
+    per-guid results without raising
+    """
+    mds = Gen3Metadata("https://example.com", auth_provider=gen3_auth)
+
+    async def mock_create_aliases(guid, aliases, *_, **__):
+        if guid == "conflict_guid":
+            raise Exception("409")
+        return {"aliases": aliases}
+
+    create_aliases_patch.side_effect = mock_create_aliases
+
+    loop = asyncio.new_event_loop()
+    results = loop.run_until_complete(
+        mds.async_batch_create_aliases(
+            {
+                "guid_1": ["a", "b"],
+                "guid_2": ["c"],
+                "conflict_guid": ["d"],
+            },
+            max_concurrent_requests=2,
+        )
+    )
+
+    assert create_aliases_patch.call_count == 3
+    assert results["guid_1"].ok
+    assert results["guid_1"].result == {"aliases": ["a", "b"]}
+    assert results["guid_2"].result == {"aliases": ["c"]}
+    assert not results["conflict_guid"].ok
+    assert str(results["conflict_guid"].error) == "409"
+
+    # empty alias list deletes all aliases, otherwise only the ones listed
+    results = loop.run_until_complete(
+        mds.async_batch_delete_aliases({"guid_1": ["a", "b"], "guid_2": []})
+    )
+
+    assert all(result.ok for result in results.values())
+    assert sorted(call.args[1] for call in delete_alias_patch.call_args_list) == [
+        "a",
+        "b",
+    ]
+    delete_aliases_patch.assert_called_once()
+    assert delete_aliases_patch.call_args.args[0] == "guid_2"
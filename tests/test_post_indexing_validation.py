@@ -3,6 +3,7 @@ import os
 from gen3.tools.indexing.post_indexing_validation import (
     validate_manifest,
     ManifestError,
+    RecordParser,
 )
 from unittest import mock
 from unittest.mock import MagicMock, mock_open
@@ -33,6 +34,9 @@ class MockResponse:
     def read(self):
         pass
 
+    def close(self):
+        pass
+
     def json(self):
         return self.json_data
 
@@ -213,3 +217,84 @@ def test_validate_manifest_coro_with_invalid_url():
             records = validate_manifest(input, auth, output)
         except ManifestError:
             assert True
+
+
+def test_record_parser_samples_per_key():
+    """
+    Test that samples_per_key checks the smallest non-zero sized records of each
+    (bucket, protocol, acl) with 1-byte range requests
+    """
+    sample_data = (
+        "guid,md5,size,acl,url\n"
+        "guid1,473d83400bc1bc9dc635e334faddf33d,30,[Open],[s3://bucket1/a]\n"
+        "guid2,473d83400bc1bc9dc635e334faddf33d,0,[Open],[s3://bucket1/b]\n"
+        "guid3,473d83400bc1bc9dc635e334faddf33d,10,[Open],[s3://bucket1/c]\n"
+        "guid4,473d83400bc1bc9dc635e334faddf33d,20,[Open],[s3://bucket1/d]\n"
+        "guid5,473d83400bc1bc9dc635e334faddf33d,5,[Open],[s3://bucket2/e]\n"
+    )
+    with mock.patch("builtins.open", mock_open(read_data=sample_data)):
+        parser = RecordParser(MagicMock(), samples_per_key=2)
+        parser.read_records_from_manifest("manifest.csv")
+
+    assert [record.guid for record in parser.get_records_to_check()] == [
+        "guid3",
+        "guid4",
+        "guid5",
+    ]
+
+    with mock.patch(
+        "gen3.file.Gen3File.get_presigned_url"
+    ) as mock_get_presigned_url, mock.patch("requests.get") as mock_request:
+        mock_get_presigned_url.return_value = {"url": "my_presigned_url"}
+        mock_request.return_value = MockResponse(206)
+        parser.check_records(max_concurrent_requests=2)
+
+    assert mock_request.call_count == 3
+    mock_request.assert_called_with(
+        "my_presigned_url", headers={"Range": "bytes=0-0"}, stream=True
+    )
+    assert all(
+        record.response_status == 200 and record.download_status == 200
+        for record in parser.get_records_to_check()
+    )
+
+
+@pytest.mark.parametrize("empty_file_status", [200, 416])
+def test_record_parser_empty_files(empty_file_status):
+    """
+    Test that a non-zero sized record is checked instead of a first-seen empty
+    one, and that a key with only empty files is checked without a range and
+    passes
+    """
+    sample_data = (
+        "guid,md5,size,acl,url\n"
+        "guid1,473d83400bc1bc9dc635e334faddf33d,0,[Open],[s3://bucket1/a]\n"
+        "guid2,473d83400bc1bc9dc635e334faddf33d,20,[Open],[s3://bucket1/b]\n"
+        "guid3,473d83400bc1bc9dc635e334faddf33d,0,[Open],[s3://bucket2/c]\n"
+    )
+    with mock.patch("builtins.open", mock_open(read_data=sample_data)):
+        parser = RecordParser(MagicMock())
+        parser.read_records_from_manifest("manifest.csv")
+
+    assert [record.guid for record in parser.get_records_to_check()] == [
+        "guid2",
+        "guid3",
+    ]
+
+    def _mock_get(url, headers, stream):
+        return MockResponse(206 if headers else empty_file_status)
+
+    with mock.patch(
+        "gen3.file.Gen3File.get_presigned_url"
+    ) as mock_get_presigned_url, mock.patch("requests.get") as mock_request:
+        mock_get_presigned_url.side_effect = lambda guid: {"url": f"url-{guid}"}
+        mock_request.side_effect = _mock_get
+        parser.check_records()
+
+    assert {
+        call.args[0]: call.kwargs["headers"] for call in mock_request.call_args_list
+    } == {"url-guid2": {"Range": "bytes=0-0"}, "url-guid3": {}}
+    assert all(
+        record.response_status == 200 and record.download_status == 200
+        for record in parser.get_records_to_check()
+    )
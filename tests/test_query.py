@@ -1,10 +1,13 @@
+import csv
 import json
+import pytest
 import requests
 from unittest.mock import MagicMock, patch
 
 
+@patch("requests.Session.post")
 @patch("gen3.jobs.requests.post")
-def test_query(requests_post_mock, gen3_query):
+def test_query(requests_post_mock, session_post_mock, gen3_query):
     data_type = "subject"
     records = [
         {"id": "uuid1", "vital_status": "Alive"},
@@ -26,6 +29,7 @@ def test_query(requests_post_mock, gen3_query):
         return mocked_response
 
     requests_post_mock.side_effect = _mock_request
+    session_post_mock.side_effect = _mock_request
 
     # hit "/guppy/graphql" endpoint. Use "filters" param, which should
     # be converted to a filter object
@@ -64,3 +68,178 @@ def test_query(requests_post_mock, gen3_query):
     )
     # "first" and "offset" are handled on the _client_ side
     assert data == {"data": {data_type: records[2:]}}
+
+
+def _mock_download_response(records, chunk_size=7):
+    """Mock a streamed "/guppy/download" response split in small chunks"""
+    content = json.dumps(records).encode("utf-8")
+    mocked_response = MagicMock(requests.Response, status_code=200)
+    mocked_response.iter_content.return_value = [
+        content[i : i + chunk_size] for i in range(0, len(content), chunk_size)
+    ]
+    return mocked_response
+
+
+@patch("gen3.jobs.requests.post")
+def test_iter_raw_data_download(requests_post_mock, gen3_query):
+    records = [{"id": f"uuid{i}", "vital_status": "Alive"} for i in range(10)]
+    requests_post_mock.return_value = _mock_download_response(records)
+
+    data = gen3_query.iter_raw_data_download(
+        data_type="subject", fields=["id", "vital_status"], first=3, offset=2
+    )
+    assert list(data) == records[2:5]
+    assert requests_post_mock.call_args.kwargs["stream"] is True
+    requests_post_mock.return_value.close.assert_called_once()
+
+
+@pytest.mark.parametrize("output_format", ["csv", "tsv", "jsonl"])
+@patch("gen3.jobs.requests.post")
+def test_raw_data_download_to_file(
+    requests_post_mock, gen3_query, tmp_path, output_format
+):
+    records = [
+        {"id": "uuid1", "vital_status": "Alive", "ages": [1, 2]},
+        {"id": "uuid2", "vital_status": "Dead"},
+    ]
+    requests_post_mock.return_value = _mock_download_response(records)
+    output_file = str(tmp_path / f"subjects.{output_format}")
+
+    count = gen3_query.raw_data_download_to_file(
+        output_file, data_type="subject", fields=["id", "vital_status", "ages"]
+    )
+
+    assert count == 2
+    with open(output_file) as f:
+        if output_format == "jsonl":
+            assert [json.loads(line) for line in f] == records
+        else:
+            delimiter = "\t" if output_format == "tsv" else ","
+            assert list(csv.DictReader(f, delimiter=delimiter)) == [
+                {"id": "uuid1", "vital_status": "Alive", "ages": "[1, 2]"},
+                {"id": "uuid2", "vital_status": "Dead", "ages": ""},
+            ]
+
+
+@patch("gen3.jobs.requests.post")
+def test_raw_data_download_to_parquet(requests_post_mock, gen3_query, tmp_path):
+    pyarrow = pytest.importorskip("pyarrow")
+    import pyarrow.parquet
+
+    records = [{"id": f"uuid{i}", "age": i} for i in range(5)]
+    requests_post_mock.return_value = _mock_download_response(records)
+    output_file = str(tmp_path / "subjects.parquet")
+
+    with patch("gen3.query.DOWNLOAD_BATCH_SIZE", 2):
+        count = gen3_query.raw_data_download_to_file(
+            output_file, data_type="subject", fields=["id", "age"]
+        )
+
+    assert count == 5
+    assert pyarrow.parquet.read_table(output_file).to_pylist() == records
+
+
+@patch("requests.Session.post")
+@patch("gen3.jobs.requests.post")
+def test_iter_partitioned_raw_data_download(
+    requests_post_mock, session_post_mock, gen3_query
+):
+    records = [
+        {"id": f"uuid{i}", "project_id": project_id}
+        for i, project_id in enumerate(["P1", "P1", "P1", "P2", "P2", "P3"])
+    ]
+    filter_object = {"=": {"vital_status": "Alive"}}
+
+    def _mock_request(url, **kwargs):
+        if url.endswith("/guppy/graphql"):
+            assert "project_id { histogram { key count } }" in kwargs["json"]["query"]
+            mocked_response = MagicMock(requests.Response, status_code=200)
+            mocked_response.json.return_value = {
+                "data": {
+                    "_aggregation": {
+                        "subject": {
+                            "_totalCount": 7,
+                            "project_id": {
+                                "histogram": [
+                                    {"key": "P2", "count": 2},
+                                    {"key": "P1", "count": 3},
+                                    {"key": "P3", "count": 1},
+                                ]
+                            },
+                        }
+                    }
+                }
+            }
+            return mocked_response
+        assert kwargs["json"]["filter"]["AND"][0] == filter_object
+        project_ids = kwargs["json"]["filter"]["AND"][1]["IN"]["project_id"]
+        return _mock_download_response(
+            [
+                {field: record[field] for field in kwargs["json"]["fields"]}
+                for record in records
+                if record["project_id"] in project_ids
+            ]
+        )
+
+    requests_post_mock.side_effect = _mock_request
+    session_post_mock.side_effect = _mock_request
+
+    with patch("gen3.query.logging") as logging_mock:
+        partitions = gen3_query.get_partition_filters(
+            "subject", "project_id", filter_object=filter_object, num_partitions=2
+        )
+    # one of the 7 records has no project_id
+    assert "1 of 7" in logging_mock.warning.call_args.args[0]
+    assert [partition["AND"][1] for partition in partitions] == [
+        {"IN": {"project_id": ["P1"]}},
+        {"IN": {"project_id": ["P2", "P3"]}},
+    ]
+
+    data = gen3_query.iter_partitioned_raw_data_download(
+        data_type="subject",
+        fields=["id", "project_id"],
+        partition_field="project_id",
+        filter_object=filter_object,
+        num_partitions=2,
+    )
+    assert sorted(data, key=lambda record: record["id"]) == records
+
+    # "/guppy/download" partitions are merged then sorted and sliced, the sort
+    # field is downloaded to sort on but not returned
+    data = gen3_query.query(
+        data_type="subject",
+        fields=["project_id"],
+        first=9999,
+        offset=2,
+        filter_object=filter_object,
+        sort_object={"id": "desc"},
+        partition_field="project_id",
+        num_partitions=3,
+    )
+    assert data == {
+        "data": {
+            "subject": [
+                {"project_id": record["project_id"]} for record in records[::-1][2:]
+            ]
+        }
+    }
+
+
+def test_get_numeric_partition_filters(gen3_query):
+    with patch.object(gen3_query, "graphql_query") as graphql_query_mock:
+        graphql_query_mock.return_value = {
+            "data": {
+                "_aggregation": {
+                    "subject": {"age": {"histogram": [{"min": 0, "max": 90}]}}
+                }
+            }
+        }
+        partitions = gen3_query.get_partition_filters(
+            "subject", "age", num_partitions=3, numeric=True
+        )
+
+    assert partitions == [
+        {"AND": [{">=": {"age": 0}}, {"<": {"age": 30}}]},
+        {"AND": [{">=": {"age": 30}}, {"<": {"age": 60}}]},
+        {"AND": [{">=": {"age": 60}}, {"<=": {"age": 90}}]},
+    ]
@@ -4,6 +4,8 @@ import pytest
 import requests
 from unittest.mock import call, MagicMock, patch
 
+from gen3.submission import Gen3Error, _write_submission_checkpoint
+
 
 def test_get(sub):
     """
@@ -13,9 +15,12 @@ def test_get(sub):
     get_dictionary_all
 
     """
-    with patch("gen3.submission.requests") as mock_request:
+    with patch("gen3.submission.requests") as mock_request, patch(
+        "requests.Session.get"
+    ) as mock_session_get:
         mock_request.status_code = 200
         mock_request.get().text = '{ "key": "value" }'
+        mock_session_get.return_value.text = '{ "key": "value" }'
         assert sub.get_programs()
         try:
             sub.get_graphql_schema()
@@ -194,7 +199,7 @@ def test_delete_record(sub):
         sub.delete_record("prog1", "proj1", "id")
 
 
-@patch("gen3.jobs.requests.post")
+@patch("requests.Session.post")
 @patch("gen3.jobs.requests.delete")
 def test_delete_nodes(requests_delete_mock, requests_post_mock, sub):
     def get_mocked_query_response(node_name, uuids):
@@ -231,9 +236,274 @@ def test_delete_nodes(requests_delete_mock, requests_post_mock, sub):
     )
 
 
+@patch("gen3.submission.DELETE_QUERY_PAGE_SIZE", 2)
+@patch("requests.Session.post")
+@patch("gen3.jobs.requests.delete")
+def test_delete_nodes_concurrently(requests_delete_mock, requests_post_mock, sub):
+    """
+    Test that all the ids of a node are paged before deleting them concurrently,
+    and that batches with a url too long are split
+    """
+
+    def get_mocked_query_response(node_name, uuids):
+        content = {"data": {node_name: [{"id": uuid} for uuid in uuids]}}
+        return MagicMock(requests.Response, status_code=200, text=json.dumps(content))
+
+    requests_post_mock.side_effect = [
+        get_mocked_query_response("node1", ["id1", "id2"]),
+        get_mocked_query_response("node1", ["id3", "id4"]),
+        get_mocked_query_response("node1", ["id5"]),
+        get_mocked_query_response("node1", []),
+    ]
+
+    def _delete(url, auth):
+        uuids = url.rsplit("/", 1)[1].split(",")
+        status_code = 414 if len(uuids) > 2 else 200
+        return MagicMock(requests.Response, status_code=status_code)
+
+    requests_delete_mock.side_effect = _delete
+
+    sub.delete_nodes(
+        "program",
+        "project",
+        ["node1"],
+        batch_size=4,
+        verbose=False,
+        max_concurrent_requests=2,
+    )
+
+    assert "offset: 2" in requests_post_mock.call_args_list[1].kwargs["json"]["query"]
+    deleted = sorted(
+        call.args[0].rsplit("/", 1)[1] for call in requests_delete_mock.call_args_list
+    )
+    assert deleted == ["id1,id2", "id1,id2,id3,id4", "id3,id4", "id5"]
+
+
 def test_query(sub):
-    with patch("gen3.submission.requests") as mock_request:
-        mock_request.status_code = 200
-        mock_request.post().text = '{ "key": "value" }'
+    with patch("requests.Session.post") as mock_request:
+        mock_request.return_value.status_code = 200
+        mock_request.return_value.text = '{ "key": "value" }'
         res = sub.query("{ experiment { submitter_id } }")
         assert res == {"key": "value"}
+
+
+def _submission_response(text):
+    response = MagicMock()
+    response.status_code = 200
+    response.text = text
+    return response
+
+
+def _successful_submission(url, auth, data, headers):
+    """Mock a successful sheepdog response for every row of a submitted TSV chunk"""
+    rows = data.strip().split("\n")[1:]
+    entities = [
+        {"unique_keys": [{"submitter_id": row.split("\t")[1]}], "valid": True}
+        for row in rows
+    ]
+    return _submission_response(json.dumps({"code": 200, "entities": entities}))
+
+
+def _write_submission_file(path, num_rows):
+    with open(path, "w") as f:
+        f.write("type\t*submitter_id\tprojects.code\n")
+        for i in range(num_rows):
+            f.write("subject\tsubject_{}\tproj1\n".format(i))
+
+
+def test_submit_file_concurrently(sub, tmp_path):
+    """
+    Test that submit_file streams every row in concurrent, growing chunks and
+    removes its checkpoint when done
+    """
+    filename = str(tmp_path / "subject.tsv")
+    _write_submission_file(filename, 400)
+
+    with patch(
+        "gen3.submission.requests.put", side_effect=_successful_submission
+    ) as mock_put:
+        results = sub.submit_file(
+            "prog1-proj1",
+            filename,
+            chunk_size=10,
+            max_concurrent_requests=4,
+            max_chunk_size=30,
+        )
+
+    assert sorted(results["succeeded"]) == sorted(
+        "subject_{}".format(i) for i in range(400)
+    )
+    assert mock_put.call_args.args[0] == (
+        "https://example.commons.com/api/v0/submission/prog1/proj1"
+    )
+    first_chunk = mock_put.call_args_list[0].kwargs["data"]
+    assert first_chunk.startswith("type\tsubmitter_id\tprojects.code\n")
+    assert (
+        max(
+            len(call.kwargs["data"].strip().split("\n")) - 1
+            for call in mock_put.call_args_list
+        )
+        == 30
+    )
+    assert not os.path.exists(filename + ".checkpoint")
+
+
+def test_submit_file_timeout_and_resume(sub, tmp_path):
+    """
+    Test that a timed out chunk is resubmitted in smaller chunks and that an
+    interrupted submission resumes from its checkpoint
+    """
+    filename = str(tmp_path / "subject.tsv")
+    _write_submission_file(filename, 20)
+    submitted = []
+
+    def _put(url, auth, data, headers):
+        rows = data.strip().split("\n")[1:]
+        if len(rows) > 5:
+            return _submission_response("Request Timeout")
+        if "subject_12" in data:
+            raise ValueError("interrupted")
+        submitted.extend(rows)
+        return _successful_submission(url, auth, data, headers)
+
+    with patch("gen3.submission.requests.put", side_effect=_put):
+        with pytest.raises(ValueError):
+            sub.submit_file("prog1-proj1", filename, chunk_size=10)
+
+    with open(filename + ".checkpoint") as f:
+        assert json.load(f)["row_offset"] == 10
+
+    with patch(
+        "gen3.submission.requests.put", side_effect=_successful_submission
+    ) as mock_put:
+        results = sub.submit_file("prog1-proj1", filename, chunk_size=10)
+
+    assert sorted(results["succeeded"]) == sorted(
+        "subject_{}".format(i) for i in range(10, 20)
+    )
+    assert not os.path.exists(filename + ".checkpoint")
+
+
+def test_submit_file_does_not_grow_back_to_slow_chunk_size(sub, tmp_path):
+    """
+    Test that after a chunk times out the chunk size grows back in small steps and
+    stays below the size that timed out
+    """
+    filename = str(tmp_path / "subject.tsv")
+    _write_submission_file(filename, 100)
+    chunk_sizes = []
+
+    def _put(url, auth, data, headers):
+        rows = data.strip().split("\n")[1:]
+        chunk_sizes.append(len(rows))
+        if len(rows) > 6:
+            return _submission_response("Request Timeout")
+        return _successful_submission(url, auth, data, headers)
+
+    with patch("gen3.submission.requests.put", side_effect=_put):
+        results = sub.submit_file(
+            "prog1-proj1", filename, chunk_size=8, max_chunk_size=16
+        )
+
+    assert len(results["succeeded"]) == 100
+    assert chunk_sizes[:5] == [8, 4, 4, 7, 3]
+    assert [size for size in chunk_sizes if size > 6] == [8, 7]
+
+
+def test_submit_file_ignores_checkpoint_of_changed_file(sub, tmp_path):
+    """
+    Test that a checkpoint saved before the file was edited is not used to skip rows
+    """
+    filename = str(tmp_path / "subject.tsv")
+    _write_submission_file(filename, 20)
+    _write_submission_checkpoint(filename + ".checkpoint", "prog1-proj1", filename, 10)
+    _write_submission_file(filename, 21)
+
+    with patch("gen3.submission.requests.put", side_effect=_successful_submission):
+        results = sub.submit_file("prog1-proj1", filename, chunk_size=10)
+
+    assert sorted(results["succeeded"]) == sorted(
+        "subject_{}".format(i) for i in range(21)
+    )
+
+
+def test_submit_file_duplicate_submitter_ids(sub, tmp_path):
+    filename = str(tmp_path / "subject.csv")
+    with open(filename, "w") as f:
+        f.write("type,submitter_id\nsubject,subject_1\nsubject,subject_1\n")
+
+    with patch("gen3.submission.requests.put") as mock_put:
+        with pytest.raises(Gen3Error):
+            sub.submit_file("prog1-proj1", filename)
+    mock_put.assert_not_called()
+
+
+def test_submit_file_with_byte_order_mark(sub, tmp_path):
+    """
+    Test that a UTF-8 file starting with a byte order mark, as Excel exports them,
+    has its first column read without it
+    """
+    filename = str(tmp_path / "subject.csv")
+    with open(filename, "w", encoding="utf-8-sig") as f:
+        f.write("submitter_id,type\nsubject_1,subject\n")
+
+    with patch(
+        "gen3.submission.requests.put", side_effect=_successful_submission
+    ) as mock_put:
+        results = sub.submit_file("prog1-proj1", filename)
+
+    assert mock_put.call_args.kwargs["data"].startswith("submitter_id\ttype\n")
+    assert len(results["succeeded"]) == 1
+
+
+def test_submit_directory(sub, tmp_path):
+    """
+    Test that submit_directory submits nodes after the nodes they link to and
+    skips nodes linking to a node that failed
+    """
+    dictionary = {
+        "project": {"links": [{"target_type": "program"}]},
+        "subject": {"links": [{"target_type": "project"}]},
+        "study": {"links": [{"target_type": "project"}]},
+        "sample": {
+            "links": [
+                {
+                    "subgroup": [
+                        {"target_type": "subject"},
+                        {"target_type": "study"},
+                    ]
+                }
+            ]
+        },
+        "aliquot": {"links": [{"target_type": "sample"}]},
+        "demographic": {"links": [{"target_type": "subject"}]},
+    }
+    for node in ["subject", "study", "sample", "aliquot", "demographic"]:
+        with open(str(tmp_path / "{}.tsv".format(node)), "w") as f:
+            f.write("type\tsubmitter_id\n{}\t{}_1\n".format(node, node))
+    with open(str(tmp_path / "README.md"), "w") as f:
+        f.write("not a node file")
+
+    def _submit_file(project_id, filename, **kwargs):
+        node = os.path.splitext(os.path.basename(filename))[0]
+        if node == "sample":
+            raise ValueError("Submission is timing out.")
+        return {"succeeded": ["{}_1".format(node)], "invalid": {}}
+
+    with patch.object(sub, "get_dictionary_all", return_value=dictionary), patch.object(
+        sub, "submit_file", side_effect=_submit_file
+    ) as mock_submit:
+        report = sub.submit_directory("prog1-proj1", str(tmp_path), chunk_size=10)
+
+    assert report["levels"] == [
+        ["study", "subject"],
+        ["demographic", "sample"],
+        ["aliquot"],
+    ]
+    assert sorted(report["nodes"]) == ["demographic", "study", "subject"]
+    assert report["succeeded"] == 3
+    assert report["failed"] == {"sample": "Submission is timing out."}
+    assert report["skipped"] == ["aliquot"]
+    mock_submit.assert_any_call(
+        "prog1-proj1", str(tmp_path / "subject.tsv"), chunk_size=10
+    )
@@ -1,6 +1,21 @@
+import asyncio
+import functools
+import pickle
+from unittest.mock import MagicMock, patch
+
 import pytest
+import requests
 
 from gen3.external.nih.utils import get_dbgap_accession_as_parts
+from gen3.tools.utils import (
+    ManifestReader,
+    ManifestRecord,
+    ManifestWriter,
+    get_and_verify_fileinfos_from_manifest,
+    get_manifest_format,
+    read_manifest_in_parallel,
+)
+from gen3.utils import BoundedAsyncExecutor, GraphQLClient
 
 
 @pytest.mark.parametrize("test_input, expected", [
@@ -102,4 +117,339 @@ def test_get_dbgap_accession_as_parts(test_input, expected):
     Test dbgap accession parsing works and outputs expected fields and values.
     """
 
-    assert get_dbgap_accession_as_parts(test_input) == expected
\ No newline at end of file
+    assert get_dbgap_accession_as_parts(test_input) == expected
+
+
+def test_bounded_async_executor_sliding_window():
+    """
+    Test that the executor keeps the window full while a slow request is still
+    running, instead of waiting for the whole batch.
+    """
+    in_flight = 0
+    max_in_flight = 0
+    finished = []
+
+    async def _request(key, delay):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(delay)
+        in_flight -= 1
+        finished.append(key)
+        return key
+
+    # one slow request followed by lots of fast ones
+    requests = [("slow", functools.partial(_request, "slow", 0.2))] + [
+        (i, functools.partial(_request, i, 0.01)) for i in range(20)
+    ]
+    executor = BoundedAsyncExecutor(max_concurrent_requests=3)
+
+    async def _run():
+        return [result async for result in executor.run(requests)]
+
+    results = asyncio.new_event_loop().run_until_complete(_run())
+
+    assert max_in_flight == 3
+    # every fast request finished while the slow one occupied a single slot
+    assert finished[-1] == "slow"
+    assert sorted(result.key for result in results if result.key != "slow") == list(
+        range(20)
+    )
+    assert all(result.ok and result.result == result.key for result in results)
+    assert executor.counts == {
+        "submitted": 21,
+        "in_flight": 0,
+        "succeeded": 21,
+        "failed": 0,
+        "retried": 0,
+    }
+
+
+def test_bounded_async_executor_retries_and_errors():
+    """
+    Test per-request retries and that run_all raises the first error only after
+    every request has finished.
+    """
+    attempts = {}
+
+    async def _flaky(key, failures):
+        attempts[key] = attempts.get(key, 0) + 1
+        if attempts[key] <= failures:
+            raise ValueError(key)
+        return key
+
+    requests = [
+        ("ok", functools.partial(_flaky, "ok", 0)),
+        ("retried", functools.partial(_flaky, "retried", 1)),
+        ("broken", functools.partial(_flaky, "broken", 10)),
+    ]
+    executor = BoundedAsyncExecutor(max_concurrent_requests=2, max_tries=2)
+
+    with pytest.raises(ValueError):
+        asyncio.new_event_loop().run_until_complete(executor.run_all(requests))
+
+    assert attempts == {"ok": 1, "retried": 2, "broken": 2}
+    assert executor.counts["succeeded"] == 2
+    assert executor.counts["failed"] == 1
+    assert executor.counts["retried"] == 2
+
+    attempts.clear()
+    executor = BoundedAsyncExecutor(max_concurrent_requests=2, max_tries=1)
+    failures = asyncio.new_event_loop().run_until_complete(
+        executor.run_all(requests, raise_on_error=False)
+    )
+    assert sorted(failure.key for failure in failures) == ["broken", "retried"]
+    assert all(isinstance(failure.error, ValueError) for failure in failures)
+
+
+def test_graphql_client_cache_and_batch_query():
+    """
+    Test that cached queries are only sent once within the TTL, and that
+    batched queries are aliased into a single request.
+    """
+    client = GraphQLClient("https://example.com/graphql", cache_ttl=60)
+
+    def _post(url, json, auth):
+        response = MagicMock()
+        response.json.return_value = {
+            "data": {
+                alias: len(alias)
+                for alias in ("subjects", "samples")
+                if alias in json["query"]
+            }
+        }
+        return response
+
+    with patch("requests.Session.post", side_effect=_post) as mock_post:
+        for _ in range(2):
+            assert client.query("{subjects: _subject_count}", cache=True) == {
+                "data": {"subjects": 8}
+            }
+        assert mock_post.call_count == 1
+
+        client.query("{subjects: _subject_count}")
+        assert mock_post.call_count == 2
+
+        counts = client.batch_query(
+            {
+                "subjects": '_subject_count(project_id: "DEV-test")',
+                "samples": '_sample_count(project_id: "DEV-test")',
+            }
+        )
+        assert counts == {"subjects": 8, "samples": 7}
+        assert mock_post.call_args.kwargs["json"]["query"] == (
+            '{subjects: _subject_count(project_id: "DEV-test") '
+            'samples: _sample_count(project_id: "DEV-test")}'
+        )
+
+        cached = client.query("{subjects: _subject_count}", cache=True)
+        cached["data"]["subjects"] = 0
+        assert client.query("{subjects: _subject_count}", cache=True) == {
+            "data": {"subjects": 8}
+        }
+
+        client.batch_query(
+            {"subjects": "_subject_count(project_id: $project_id)"},
+            variables={"project_id": ("String", "DEV-test")},
+        )
+        assert mock_post.call_args.kwargs["json"] == {
+            "query": "query($project_id: String) "
+            "{subjects: _subject_count(project_id: $project_id)}",
+            "variables": {"project_id": "DEV-test"},
+        }
+
+        with patch("gen3.utils.time.monotonic", return_value=float("inf")):
+            client.query("{subjects: _subject_count}", cache=True)
+        assert mock_post.call_count == 5
+
+
+def test_graphql_client_get_json_revalidates(tmp_path):
+    """
+    Test that JSON documents are revalidated with their ETag, reused on a 304
+    and saved to disk for other clients
+    """
+    url = "https://example.com/api/v0/submission/_dictionary/_all"
+    requests_headers = []
+
+    def _get(url, headers):
+        requests_headers.append(headers)
+        response = MagicMock()
+        if headers.get("If-None-Match") == '"v1"':
+            response.status_code = 304
+        else:
+            response.status_code = 200
+            response.text = '{"subject": {"id": "subject"}}'
+            response.headers = {"ETag": '"v1"'}
+        return response
+
+    with patch("requests.Session.get", side_effect=_get):
+        client = GraphQLClient("https://example.com/graphql", cache_dir=str(tmp_path))
+        dictionary = client.get_json(url)
+        assert dictionary == {"subject": {"id": "subject"}}
+        # the kept document can't be modified through a returned copy
+        dictionary["subject"]["id"] = "modified"
+        dictionary = client.get_json(url)
+        assert dictionary == {"subject": {"id": "subject"}}
+
+        other_client = GraphQLClient(
+            "https://example.com/graphql", cache_dir=str(tmp_path)
+        )
+        assert other_client.get_json(url) == dictionary
+
+    assert requests_headers == [
+        {},
+        {"If-None-Match": '"v1"'},
+        {"If-None-Match": '"v1"'},
+    ]
+    assert len(list(tmp_path.iterdir())) == 1
+
+
+def test_graphql_client_get_json_error(tmp_path):
+    """
+    Test that an error response raises instead of being parsed or kept
+    """
+    response = requests.Response()
+    response.status_code = 500
+    response._content = b"<html>Internal Server Error</html>"
+    response.headers["ETag"] = '"error"'
+
+    with patch("requests.Session.get", return_value=response):
+        client = GraphQLClient("https://example.com/graphql", cache_dir=str(tmp_path))
+        with pytest.raises(requests.HTTPError):
+            client.get_json("https://example.com/api/v0/submission/_dictionary/_all")
+
+    assert not list(tmp_path.iterdir())
+
+
+def test_manifest_reader_columns_and_filters(tmp_path):
+    """
+    Test that ManifestReader only returns the requested columns of matching rows
+    """
+    manifest = tmp_path / "manifest.tsv"
+    manifest.write_text("guid\tmd5\tsize\na\tmd5a\t1\nb\tmd5b\t2\nc\tmd5c\t3\n")
+
+    with ManifestReader(
+        str(manifest), columns=["guid", "size"], filters=[("size", "!=", "2")]
+    ) as reader:
+        assert reader.fieldnames == ["guid", "size"]
+        assert list(reader) == [
+            {"guid": "a", "size": "1"},
+            {"guid": "c", "size": "3"},
+        ]
+
+    with pytest.raises(ValueError):
+        ManifestReader(str(manifest), filters=[("size", "~", "2")])
+
+
+@pytest.mark.parametrize("extension", [".parquet", ".arrow"])
+def test_columnar_manifest_round_trip(tmp_path, extension):
+    """
+    Test that Parquet and Arrow manifests read back the same rows as were written,
+    with filters pushed down to the file
+    """
+    pytest.importorskip("pyarrow")
+    manifest = str(tmp_path / f"manifest{extension}")
+    rows = [
+        {"guid": "a", "md5": "md5a", "size": 1, "acl": "['open']"},
+        {"guid": "b", "md5": "md5b", "size": 2, "acl": ""},
+    ]
+    assert get_manifest_format(manifest) == extension[1:]
+
+    with ManifestWriter(
+        manifest, ["guid", "md5", "size", "acl"], batch_size=1
+    ) as writer:
+        writer.writeheader()
+        writer.writerows(rows)
+
+    with ManifestReader(manifest) as reader:
+        assert reader.fieldnames == ["guid", "md5", "size", "acl"]
+        assert list(reader) == [
+            {"guid": "a", "md5": "md5a", "size": "1", "acl": "['open']"},
+            {"guid": "b", "md5": "md5b", "size": "2", "acl": ""},
+        ]
+
+    with ManifestReader(
+        manifest, columns=["guid"], filters=[("size", ">", 1)]
+    ) as reader:
+        assert list(reader) == [{"guid": "b"}]
+        assert sum(batch.num_rows for batch in reader.iter_batches()) == 1
+
+
+def _get_guids_and_line_numbers(rows, first_line_number):
+    return [
+        (line_number, row["guid"])
+        for line_number, row in enumerate(rows, first_line_number)
+    ]
+
+
+@pytest.mark.parametrize("num_processes", [1, 3])
+def test_read_manifest_in_parallel(tmp_path, monkeypatch, num_processes):
+    """
+    Test that a manifest parsed in shards gives the same rows, in order and with
+    the right line numbers, as parsing it all at once
+    """
+    manifest = tmp_path / "manifest.csv"
+    guids = [f"guid-{i}" for i in range(100)]
+    manifest.write_text(
+        "guid,md5,size,url\n"
+        + "".join(
+            f"{guid},{i:032x},{i},s3://bucket/{guid}\n" for i, guid in enumerate(guids)
+        )
+    )
+
+    results = read_manifest_in_parallel(
+        str(manifest),
+        _get_guids_and_line_numbers,
+        num_processes=num_processes,
+        shard_size=100,
+    )
+    assert len(results) > 1
+    assert [row for result in results for row in result] == [
+        (line_number, guid) for line_number, guid in enumerate(guids, 2)
+    ]
+
+    reduced = read_manifest_in_parallel(
+        str(manifest),
+        _get_guids_and_line_numbers,
+        num_processes=num_processes,
+        shard_size=100,
+        reduce_function=lambda rows, result: rows + result,
+        initial=[],
+    )
+    assert reduced == [row for result in results for row in result]
+
+    monkeypatch.setattr("gen3.tools.utils.MANIFEST_SHARD_SIZE", 100)
+    assert get_and_verify_fileinfos_from_manifest(
+        str(manifest), num_processes=num_processes
+    ) == get_and_verify_fileinfos_from_manifest(str(manifest))
+
+
+def test_manifest_record():
+    """
+    Test that ManifestRecord behaves like a dict of the row while storing md5s as
+    bytes and sharing column names between records
+    """
+    row = {"guid": "dg.1234/0", "md5": "f7cb" * 8, "size": "42", "acl": "open"}
+    record = ManifestRecord(row)
+    other_record = ManifestRecord(dict(row, guid="dg.1234/1"))
+
+    assert record == dict(row, size=42)
+    assert record["md5"] == "f7cb" * 8
+    assert record._values[1] == bytes.fromhex("f7cb" * 8)
+    assert record._columns is other_record._columns
+    assert pickle.loads(pickle.dumps(record))._columns is record._columns
+
+    # md5s that wouldn't convert back exactly are kept as-is
+    assert ManifestRecord({"md5": "F7CB" * 8})["md5"] == "F7CB" * 8
+    assert ManifestRecord({"md5": "not an md5"})["md5"] == "not an md5"
+
+    copied_record = record.copy()
+    copied_record["urls"] = "s3://bucket/key"
+    del copied_record["acl"]
+    assert dict(copied_record) == {
+        "guid": "dg.1234/0",
+        "md5": "f7cb" * 8,
+        "size": 42,
+        "urls": "s3://bucket/key",
+    }
+    assert "urls" not in record and record["acl"] == "open"
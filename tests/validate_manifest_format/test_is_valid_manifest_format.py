@@ -373,3 +373,26 @@ def test_is_valid_manifest_with_missing_url_column_and_error_on_empty_url(logfil
     )
     assert missing_size_message in logfile.read()
     assert result == False
+
+
+def test_is_valid_manifest_format_in_parallel(logfile, monkeypatch):
+    """
+    Test that validating rows in multiple processes logs the same errors, with
+    the same line numbers, as validating them in this process
+    """
+    manifest = "tests/validate_manifest_format/manifests/manifest_with_many_types_of_errors.tsv"
+    result = is_valid_manifest_format(manifest)
+    error_log = logfile.read()
+
+    # make sure rows are split across processes
+    monkeypatch.setattr("gen3.tools.utils.MANIFEST_SHARD_SIZE", 64)
+    parallel_result = is_valid_manifest_format(manifest, num_processes=2)
+    logfile.logs = ""
+    parallel_error_log = logfile.read()[len(error_log) :]
+
+    def _get_messages(log):
+        # without the timestamps, and in any order since processes log concurrently
+        return sorted(line.split("] ", 1)[-1] for line in log.splitlines())
+
+    assert parallel_result == result == False
+    assert _get_messages(parallel_error_log) == _get_messages(error_log)